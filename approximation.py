@@ -0,0 +1,219 @@
+"""
+This file implements explicit feature maps which approximate kernels, so svm may be trained by a linear solver in the
+feature space instead of working with the kernel matrix. The number of components trades accuracy against time and
+memory: both training and prediction are linear in it.
+"""
+import abc
+import time
+
+import numpy
+
+import minimization
+from kernels import *
+
+RANDOM_FOURIER = "random_fourier"
+NYSTROEM = "nystroem"
+LINEAR_FEATURES = "linear_features"
+
+DEFAULT_COMPONENTS = 256
+
+
+class FeatureMap(abc.ABC):
+    """
+    An abstract feature map z, such that transpose(z(x)) * z(y) approximates K(x, y).
+    """
+
+    def __init__(self, kernel_type: str, params: list, n_components: int = DEFAULT_COMPONENTS, seed: int = None):
+        """
+        Constructor. Assigns the initial values to the fields of the class.
+        :param kernel_type: name of kernel type. The constants defined in kernels namespace must be used.
+        :param params: params for kernel
+        :param n_components: dimension of the feature space
+        :param seed: seed of the random generator
+        """
+        if n_components < 1:
+            raise ValueError("Number of components should be positive")
+        self.kernel_type = kernel_type
+        self.params = list(params)
+        self.n_components = n_components
+        self.seed = seed
+
+    @abc.abstractmethod
+    def fit(self, X) -> 'FeatureMap':
+        """
+        Prepares the map for the input vectors set
+        :param X: input vectors set
+        :return: the map itself
+        """
+
+    @abc.abstractmethod
+    def _transform(self, X: numpy.ndarray) -> numpy.ndarray:
+        """
+        Maps the matrix of input vectors, the map is fitted already
+        :param X: matrix of input vectors
+        :return: matrix samples x n_components
+        """
+
+    def transform(self, X) -> numpy.ndarray:
+        """
+        Maps the input vectors into the feature space
+        :param X: matrix of input vectors
+        :return: matrix samples x n_components
+        """
+        return self._transform(as_matrix(X))
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Memory used by the arrays of the map
+        """
+        return sum(value.nbytes for value in self.__dict__.values() if isinstance(value, numpy.ndarray))
+
+
+class RandomFourierFeatures(FeatureMap):
+    """
+    This class implements random Fourier features (Rahimi, Recht 2007) z(x) = sqrt(2 / D) * cos(W * x + b) of shift
+    invariant kernels. Rows of W are sampled from the Fourier transform of the kernel: the normal distribution for
+    the gaussian kernel and the multivariate Cauchy distribution for the exponential and laplacian kernels, which
+    depend on the distance exp(-|x - y| / scale).
+    """
+
+    def fit(self, X) -> 'RandomFourierFeatures':
+        """
+        Samples the frequencies for the dimension of the input vectors set
+        :param X: input vectors set
+        :return: the map itself
+        :except ValueError: the kernel is not shift invariant
+        """
+        dimension = as_matrix(X).shape[1]
+        generator = numpy.random.default_rng(self.seed)
+        shape = (dimension, self.n_components)
+        sigma = self.params[0] if self.params else 1
+        if self.kernel_type == GAUSSIAN:
+            self.frequencies = generator.standard_normal(shape) / sigma
+        elif self.kernel_type in (EXPONENTIAL, LAPLICAN):
+            scale = 2 * sigma ** 2 if self.kernel_type == EXPONENTIAL else sigma
+            #  The multivariate Cauchy vector is a normal vector divided by the square root of a chi-squared variable
+            self.frequencies = generator.standard_normal(shape) / numpy.sqrt(
+                generator.chisquare(1, self.n_components)) / scale
+        else:
+            raise ValueError("Random Fourier features are not defined for {} kernel".format(self.kernel_type))
+        self.offsets = generator.uniform(0, 2 * numpy.pi, self.n_components)
+        return self
+
+    def _transform(self, X: numpy.ndarray) -> numpy.ndarray:
+        return numpy.sqrt(2. / self.n_components) * numpy.cos(numpy.dot(X, self.frequencies) + self.offsets)
+
+
+class Nystroem(FeatureMap):
+    """
+    This class implements the Nystroem approximation z(x) = K(landmarks, landmarks) ^ (-1/2) * K(landmarks, x)
+    for any kernel. Landmarks are random input vectors.
+    """
+
+    #  Eigenvalues of the landmarks kernel matrix below this share of the greatest one are dropped
+    tolerance = 1e-10
+
+    def fit(self, X) -> 'Nystroem':
+        """
+        Chooses the landmarks among the input vectors
+        :param X: input vectors set
+        :return: the map itself
+        """
+        X = as_matrix(X)
+        generator = numpy.random.default_rng(self.seed)
+        indices = numpy.sort(generator.permutation(len(X))[:self.n_components])
+        self.landmarks = numpy.ascontiguousarray(X[indices])
+        values, vectors = numpy.linalg.eigh(kernel_matrix(self.kernel_type, self.landmarks, self.landmarks,
+                                                          self.params))
+        keep = values > self.tolerance * max(values.max(initial=0.), self.tolerance)
+        self.normalization = vectors[:, keep] / numpy.sqrt(values[keep])
+        return self
+
+    def _transform(self, X: numpy.ndarray) -> numpy.ndarray:
+        return numpy.dot(kernel_matrix(self.kernel_type, X, self.landmarks, self.params), self.normalization)
+
+
+class LinearFeatures(FeatureMap):
+    """
+    This class is the exact map of the linear kernel: the input vectors themselves. The linear svm becomes one weight
+    vector and the bias, trained in the primal space in time linear in the number of samples. The constant of the
+    kernel is not used, because the bias is a separate variable there.
+    """
+
+    def fit(self, X) -> 'LinearFeatures':
+        """
+        Checks the kernel. Nothing is learned from the input vectors.
+        :param X: input vectors set
+        :return: the map itself
+        :except ValueError: the kernel is not linear
+        """
+        if self.kernel_type != LINEAR:
+            raise ValueError("Linear features are defined for {} kernel only".format(LINEAR))
+        return self
+
+    def _transform(self, X: numpy.ndarray) -> numpy.ndarray:
+        return X
+
+
+feature_maps = {RANDOM_FOURIER: RandomFourierFeatures, NYSTROEM: Nystroem, LINEAR_FEATURES: LinearFeatures}
+
+
+def feature_map(method: str, kernel_type: str, params: list, n_components: int = DEFAULT_COMPONENTS,
+                seed: int = None) -> FeatureMap:
+    """
+    Creates the feature map by the name of the method
+    :param method: name of the approximation. The constants defined in this file must be used.
+    :param kernel_type: name of kernel type
+    :param params: params for kernel
+    :param n_components: dimension of the feature space
+    :param seed: seed of the random generator
+    :return: not fitted feature map
+    :except ValueError: unknown method
+    """
+    if method not in feature_maps:
+        raise ValueError("Unknown approximation {}".format(method))
+    return feature_maps[method](kernel_type, params, n_components, seed)
+
+
+def benchmark(kernel_type: str, params: list, X, Y, X_test, Y_test, c: float, components: tuple = (64, 256, 1024),
+              methods: tuple = (RANDOM_FOURIER, NYSTROEM), number_of_classes: int = None, seed: int = 0,
+              solver: str = minimization.SMO) -> list:
+    """
+    Compares OVR trained on the exact kernel with OVR trained on the approximations
+    :param kernel_type: name of kernel type
+    :param params: params for kernel
+    :param X: training input vectors set
+    :param Y: training class numbers
+    :param X_test: test input vectors set
+    :param Y_test: test class numbers
+    :param c: param for svm
+    :param components: numbers of components of the approximations
+    :param methods: names of the approximations
+    :param number_of_classes: number of classes, by default the greatest class number plus one
+    :param seed: seed of the random generator
+    :param solver: name of the quadratic problem solver for the exact kernel
+    :return: list of dictionaries with method (None for the exact kernel), n_components, accuracy, train_time,
+    predict_time in seconds and the bytes of the model used by prediction
+    """
+    #  Imported here, because svm depends on this file
+    import ovr
+    Y, Y_test = numpy.asarray(Y), numpy.asarray(Y_test)
+    if number_of_classes is None:
+        number_of_classes = int(max(Y.max(), Y_test.max())) + 1
+    configurations = [(None, None)] + [(method, n) for method in methods for n in components
+                                      if method == NYSTROEM or kernel_type in DISTANCE_KERNELS]
+    results = []
+    for method, n_components in configurations:
+        machine = ovr.OVR()
+        start = time.perf_counter()
+        machine.train(number_of_classes, kernel_type, params, X, Y, c, solver=solver, approximation=method,
+                      n_components=n_components or DEFAULT_COMPONENTS, seed=seed)
+        train_time = time.perf_counter() - start
+        start = time.perf_counter()
+        predicted = machine.predict_batch(X_test)
+        predict_time = time.perf_counter() - start
+        results.append({'method': method, 'n_components': n_components,
+                        'accuracy': float(numpy.mean(predicted == Y_test)), 'train_time': train_time,
+                        'predict_time': predict_time, 'bytes': machine.nbytes})
+    return results
@@ -0,0 +1,269 @@
+"""
+This file implements the benchmark of training and prediction on synthetic datasets. Every stage is measured for every
+kernel and dataset size: the best wall time of several runs, the peak memory allocated by Python and NumPy during
+one more run and the throughput. Results are written to a JSON file and may be compared with a stored baseline.
+
+Usage: python benchmark.py [--full] [--output results.json] [--baseline baseline.json] [--threshold 1.25]
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy
+
+import features
+import minimization
+import ovr
+import svm
+from kernels import *
+
+#  Kernels with their params used by the benchmark
+KERNELS = {LINEAR: [1], POLYNOMIAL: [1, 1, 2], GAUSSIAN: [1], EXPONENTIAL: [1], LAPLICAN: [1]}
+
+#  Dataset sizes (samples, dimension, classes)
+QUICK_SIZES = ((100, 8, 3), (400, 8, 3), (400, 32, 3), (400, 8, 10))
+FULL_SIZES = QUICK_SIZES + ((1600, 8, 3), (1600, 32, 10))
+
+#  The dense solver builds matrices of 3n x n constraints, so it is measured on small datasets only
+QUADPROG_LIMIT = 500
+
+#  Number of samples classified one by one
+SINGLE_SAMPLES = 50
+
+FORMAT_VERSION = 1
+
+
+def synthetic_dataset(n: int, d: int, classes: int, seed: int = 0) -> tuple:
+    """
+    Generates overlapping gaussian clusters, one for each class
+    :param n: number of samples
+    :param d: dimension of samples
+    :param classes: number of classes
+    :param seed: seed of the random generator
+    :return: matrix of samples and vector of class numbers
+    """
+    generator = numpy.random.default_rng(seed)
+    centers = generator.normal(scale=2., size=(classes, d))
+    Y = numpy.arange(n) % classes
+    X = centers[Y] + generator.normal(size=(n, d))
+    return X, Y
+
+
+def synthetic_records(number: int, channels: int = 3, beats: int = 40, seed: int = 0) -> list:
+    """
+    Generates processed records with the layout of data_predprocessor output
+    :param number: number of records
+    :param channels: number of channels of every record
+    :param beats: number of heartbeats of every channel
+    :param seed: seed of the random generator
+    :return: list of records
+    """
+    generator = numpy.random.default_rng(seed)
+    records = []
+    for r in range(number):
+        data = []
+        for k in range(channels):
+            rpeaks = numpy.cumsum(generator.integers(150, 250, beats))
+            data.append({'ts': numpy.arange(rpeaks[-1] + 200) / 250., 'rpeaks': rpeaks,
+                         'templates': generator.normal(size=(beats, 180)),
+                         'heart_rate': generator.normal(70, 5, beats - 1)})
+        records.append(data)
+    return records
+
+
+def measure(function, items: int, repeat: int = 3) -> dict:
+    """
+    Measures the function
+    :param function: function without arguments
+    :param items: number of processed items used for the throughput
+    :param repeat: number of timed runs, the best one is reported
+    :return: dictionary with seconds, peak_bytes and throughput (items per second)
+    """
+    best = numpy.inf
+    for run in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    #  Tracing slows the code down, so memory is measured in a separate run
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'seconds': best, 'peak_bytes': peak, 'throughput': items / best if best > 0 else numpy.inf}
+
+
+def _stages(kernel_type: str, params: list, X: numpy.ndarray, Y: numpy.ndarray, classes: int) -> list:
+    """
+    Private function listing the measured stages of one kernel and dataset
+    :return: list of tuples (stage, solver, function, items)
+    """
+    labels = numpy.where(Y == 0, 1, -1)
+    trained = ovr.OVR()
+    trained.train(classes, kernel_type, params, X, Y, 10, solver=minimization.SMO)
+    stages = [('kernel_matrix', None, lambda: kernel_matrix(kernel_type, X, X, params), len(X))]
+    if len(X) <= QUADPROG_LIMIT:
+        stages.append(('svm_train', minimization.QUADPROG,
+                       lambda: svm.SVM().train(kernel_type, params, X, labels, 10, solver=minimization.QUADPROG),
+                       len(X)))
+    stages += [
+        ('svm_train', minimization.SMO,
+         lambda: svm.SVM().train(kernel_type, params, X, labels, 10, solver=minimization.SMO), len(X)),
+        ('ovr_train', minimization.SMO,
+         lambda: ovr.OVR().train(classes, kernel_type, params, X, Y, 10, solver=minimization.SMO), len(X)),
+        ('ovr_classify', None, lambda: [trained.classify(x) for x in X[:SINGLE_SAMPLES]], min(len(X), SINGLE_SAMPLES)),
+        ('ovr_predict_batch', None, lambda: trained.predict_batch(X), len(X)),
+    ]
+    if kernel_type == LINEAR:
+        stages.append(('ovr_train', minimization.COORDINATE_DESCENT,
+                       lambda: ovr.OVR().train(classes, kernel_type, params, X, Y, 10,
+                                               solver=minimization.COORDINATE_DESCENT), len(X)))
+    return stages
+
+
+def run(sizes: tuple = QUICK_SIZES, kernels: dict = None, repeat: int = 3, seed: int = 0, log=None) -> list:
+    """
+    Runs the benchmark
+    :param sizes: dataset sizes as triples (samples, dimension, classes)
+    :param kernels: params by kernel types, all kernels by default
+    :param repeat: number of timed runs of every stage
+    :param seed: seed of the datasets
+    :param log: function printing the progress, None for silence
+    :return: list of results. Every result is a dictionary with stage, kernel_type, solver, n, d, classes and
+    the measurements (see measure). A stage which failed has error instead of the measurements.
+    """
+    kernels = KERNELS if kernels is None else kernels
+    results = []
+
+    def record(stage: str, kernel_type: str, solver: str, n: int, d: int, classes: int, function, items: int):
+        result = {'stage': stage, 'kernel_type': kernel_type, 'solver': solver, 'n': n, 'd': d, 'classes': classes}
+        try:
+            result.update(measure(function, items, repeat))
+        except (ValueError, ArithmeticError) as error:
+            result['error'] = str(error)
+        results.append(result)
+        if log is not None:
+            log(format_result(result))
+
+    for n, d, classes in sizes:
+        X, Y = synthetic_dataset(n, d, classes, seed)
+        records = synthetic_records(max(1, n // 20), seed=seed)
+        record('extract_features', None, None, n, d, classes, lambda: features.extract_features_batch(records),
+               len(records))
+        for kernel_type, params in kernels.items():
+            try:
+                stages = _stages(kernel_type, params, X, Y, classes)
+            except (ValueError, ArithmeticError) as error:
+                results.append({'stage': 'prepare', 'kernel_type': kernel_type, 'solver': None, 'n': n, 'd': d,
+                                'classes': classes, 'error': str(error)})
+                continue
+            for stage, solver, function, items in stages:
+                record(stage, kernel_type, solver, n, d, classes, function, items)
+    return results
+
+
+def _key(result: dict) -> tuple:
+    return tuple(result[name] for name in ('stage', 'kernel_type', 'solver', 'n', 'd', 'classes'))
+
+
+def save(results: list, path: str) -> None:
+    """
+    Writes the results with the description of the environment
+    :param results: list of results returned by run
+    :param path: path of the JSON file
+    :return: None
+    """
+    document = {'version': FORMAT_VERSION, 'python': sys.version.split()[0], 'numpy': numpy.__version__,
+                'platform': platform.platform(), 'results': results}
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=1)
+
+
+def load(path: str) -> list:
+    """
+    Reads the results written by save
+    :param path: path of the JSON file
+    :return: list of results
+    :except ValueError: unsupported file version
+    """
+    with open(path, 'r') as f:
+        document = json.load(f)
+    if document.get('version') != FORMAT_VERSION:
+        raise ValueError("Unsupported benchmark file version {}".format(document.get('version')))
+    return document['results']
+
+
+def compare(results: list, baseline: list, threshold: float = 1.25, memory_threshold: float = 1.25) -> list:
+    """
+    Finds the stages which became slower or use more memory than in the baseline
+    :param results: current results
+    :param baseline: results of the baseline
+    :param threshold: allowed ratio of the current time to the baseline time
+    :param memory_threshold: allowed ratio of the current peak memory to the baseline one
+    :return: list of regressions. Every regression is the current result with time_ratio and memory_ratio added.
+    Stages failing now but not in the baseline are regressions too.
+    """
+    previous = {_key(result): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get(_key(result))
+        if old is None or 'error' in old:
+            continue
+        if 'error' in result:
+            regressions.append(dict(result, time_ratio=numpy.inf, memory_ratio=numpy.inf))
+            continue
+        time_ratio = result['seconds'] / old['seconds'] if old['seconds'] > 0 else 1.
+        memory_ratio = result['peak_bytes'] / old['peak_bytes'] if old['peak_bytes'] > 0 else 1.
+        if time_ratio > threshold or memory_ratio > memory_threshold:
+            regressions.append(dict(result, time_ratio=time_ratio, memory_ratio=memory_ratio))
+    return regressions
+
+
+def format_result(result: dict) -> str:
+    """
+    Formats one result as a line
+    :param result: result returned by run
+    :return: text of the line
+    """
+    name = '{:<18} {:<12} {:<18} n={:<5} d={:<3} classes={:<3}'.format(
+        result['stage'], result['kernel_type'] or '-', result['solver'] or '-', result['n'], result['d'],
+        result['classes'])
+    if 'error' in result:
+        return '{} error: {}'.format(name, result['error'])
+    line = '{} {:>10.4f} s {:>10.1f} KiB {:>12.1f} items/s'.format(
+        name, result['seconds'], result['peak_bytes'] / 1024, result['throughput'])
+    if 'time_ratio' in result:
+        line += ' time x{:.2f} memory x{:.2f}'.format(result['time_ratio'], result['memory_ratio'])
+    return line
+
+
+def main(arguments: list = None) -> int:
+    """
+    Runs the benchmark from the command line
+    :param arguments: command line arguments, sys.argv by default
+    :return: exit status, 1 if regressions were found
+    """
+    parser = argparse.ArgumentParser(description="Benchmark of svm training and prediction")
+    parser.add_argument('--full', action='store_true', help="measure the large datasets too")
+    parser.add_argument('--repeat', type=int, default=3, help="number of timed runs of every stage")
+    parser.add_argument('--output', default='benchmark.json', help="file for the results")
+    parser.add_argument('--baseline', help="results to compare with")
+    parser.add_argument('--threshold', type=float, default=1.25, help="allowed slowdown ratio")
+    options = parser.parse_args(arguments)
+    results = run(FULL_SIZES if options.full else QUICK_SIZES, repeat=options.repeat, log=print)
+    save(results, options.output)
+    if options.baseline is None:
+        return 0
+    regressions = compare(results, load(options.baseline), options.threshold)
+    print('{} regressions'.format(len(regressions)))
+    for regression in regressions:
+        print(format_result(regression))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,68 +1,186 @@
 import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 from os.path import isfile, join
 
-import biosppy
 import pickle
 
 import numpy
-import wfdb
 import peakutils
 from matplotlib import pyplot
-import itertools
-import utility
+import parallel
+from feature_store import FeatureStore
+from features import extract_features, extract_features_batch
 
 
-def load():
-    for name in [f for f in os.listdir('data/') if isfile(join('data/', f)) and '.dat' in f]:
-        record = wfdb.rdsamp("data/{}".format(name[:-4]))
-        wfdb.plotrec(record)
+DATA_DIRECTORY = 'data/'
+PROCESSED_DIRECTORY = 'processed_data/'
+
+
+def records(directory: str = DATA_DIRECTORY) -> list:
+    """
+    Returns the names of the records without extension
+    :param directory: directory with .dat files of records
+    :return: sorted list of names
+    """
+    return sorted(f[:-4] for f in os.listdir(directory) if isfile(join(directory, f)) and f.endswith('.dat'))
+
+
+def load(plot: bool = False):
+    #  biosppy and wfdb are imported where they are used, so the rest of the file works without them
+    import biosppy
+    import wfdb
+    for name in records():
+        record = wfdb.rdsamp(join(DATA_DIRECTORY, name))
+        if plot:
+            wfdb.plotrec(record)
         predprocessed_data = [list(signal) for signal in zip(*record.p_signals)]
         data = [tuple(biosppy.ecg.ecg(signal=f, sampling_rate=record.fs, show=False)) for f in predprocessed_data]
         print(data)
 
 
-def process_data():
-    for name in [f for f in os.listdir('data/') if isfile(join('data/', f)) and '.dat' in f]:
-        record = wfdb.rdsamp("data/{}".format(name[:-4]))
-        processed_data = [list(signal) for signal in zip(*record.p_signals)]
-        data = [tuple(biosppy.ecg.ecg(signal=f, sampling_rate=record.fs, show=False)) for f in processed_data]
-        data = [{'ts': list(element[0]), 'filtered': list(element[1]), 'rpeaks': list(element[2]),
-                 'templates': list(element[4]), 'heart_rate': list(element[6])} for element in data]
-        with open('processed_data/{}'.format(name[:-4]), 'wb') as f:
+def is_processed(name: str, data_directory: str = DATA_DIRECTORY, processed_directory: str = PROCESSED_DIRECTORY,
+                 store: FeatureStore = None) -> bool:
+    """
+    Checks whether the processed record is newer than its source files
+    :param name: name of the record
+    :param data_directory: directory with source records
+    :param processed_directory: directory with processed records
+    :param store: feature store with processed records. If it is given processed_directory is not used.
+    :return: True if the record does not need processing
+    """
+    if store is not None:
+        modified = store.modification_time(name)
+    elif isfile(join(processed_directory, name)):
+        modified = os.stat(join(processed_directory, name)).st_mtime
+    else:
+        modified = 0.
+    sources = [join(data_directory, name + extension) for extension in ('.dat', '.hea')]
+    return modified >= max(os.stat(f).st_mtime for f in sources if isfile(f))
+
+
+def _read_record(name: str, data_directory: str) -> tuple:
+    """
+    Reads the record in the worker process
+    :param name: name of the record
+    :param data_directory: directory with source records
+    :return: name, sampling rate, matrix channels x samples and elapsed time
+    """
+    import wfdb
+    start = time.perf_counter()
+    record = wfdb.rdsamp(join(data_directory, name))
+    signals = numpy.ascontiguousarray(numpy.asarray(record.p_signals, dtype=numpy.float64).T)
+    return name, record.fs, signals, time.perf_counter() - start
+
+
+def _process_channel(signal: numpy.ndarray, sampling_rate: float) -> tuple:
+    """
+    Processes one channel of the record in the worker process
+    :param signal: samples of the channel
+    :param sampling_rate: sampling rate of the signal
+    :return: processed channel and elapsed time
+    """
+    import biosppy
+    start = time.perf_counter()
+    element = biosppy.ecg.ecg(signal=signal, sampling_rate=sampling_rate, show=False)
+    channel = {'ts': numpy.asarray(element[0]), 'filtered': numpy.asarray(element[1]),
+               'rpeaks': numpy.asarray(element[2]), 'templates': numpy.asarray(element[4]),
+               'heart_rate': numpy.asarray(element[6])}
+    return channel, time.perf_counter() - start
+
+
+def _write_atomically(path: str, data) -> None:
+    """
+    Pickles the data into a temporary file of the same directory and renames it to the path, so an interrupted
+    write never leaves a truncated file which looks up to date
+    :param path: path of the file
+    :param data: object to save
+    :return: None
+    """
+    descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path) or '.', prefix='.', suffix='.tmp')
+    try:
+        with os.fdopen(descriptor, 'wb') as f:
             pickle.dump(data, f)
-        print(name)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
 
 
-def prepare_data_for():
-    for name in [f for f in os.listdir('processed_data/') if isfile(join('processed_data/', f))]:
+def process_data(n_jobs: int = -1, force: bool = False, data_directory: str = DATA_DIRECTORY,
+                 processed_directory: str = PROCESSED_DIRECTORY, store: FeatureStore = None) -> dict:
+    """
+    Processes all records with biosppy in a pool of processes. Records are read in parallel and every channel is
+    processed as a separate task. A record is written as soon as all its channels are processed. Records whose output
+    is newer than their source files are skipped, so repeated runs process only new or changed records. Processed
+    channels are stored as NumPy arrays.
+    :param n_jobs: number of processes, -1 means all CPUs
+    :param force: process all records even if they are up to date
+    :param data_directory: directory with source records
+    :param processed_directory: directory for processed records
+    :param store: feature store for processed records. If it is given records are saved to it instead of pickles in
+    processed_directory.
+    :return: timings of the stages in seconds, summed over all tasks, and the numbers of processed and skipped records
+    """
+    start = time.perf_counter()
+    names = [name for name in records(data_directory)
+             if force or not is_processed(name, data_directory, processed_directory, store)]
+    timings = {'read': 0., 'ecg': 0., 'write': 0., 'records': len(names),
+               'skipped': len(records(data_directory)) - len(names)}
+    if store is None:
+        os.makedirs(processed_directory, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=parallel.number_of_workers(n_jobs)) as executor:
+        #  Maps running tasks to the record name and the channel number (None for reading of the record)
+        pending = {executor.submit(_read_record, name, data_directory): (name, None) for name in names}
+        channels = {}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                name, index = pending.pop(future)
+                if index is None:
+                    name, sampling_rate, signals, elapsed = future.result()
+                    timings['read'] += elapsed
+                    channels[name] = [None] * len(signals)
+                    for n, signal in enumerate(signals):
+                        pending[executor.submit(_process_channel, signal, sampling_rate)] = (name, n)
+                    continue
+                channel, elapsed = future.result()
+                timings['ecg'] += elapsed
+                channels[name][index] = channel
+                if any(element is None for element in channels[name]):
+                    continue
+                write_start = time.perf_counter()
+                if store is not None:
+                    store.write_record(name, channels.pop(name))
+                else:
+                    _write_atomically(join(processed_directory, name), channels.pop(name))
+                timings['write'] += time.perf_counter() - write_start
+                print(name)
+    timings['total'] = time.perf_counter() - start
+    return timings
+
+
+def prepare_data_for(store: FeatureStore = None):
+    """
+    Builds feature vectors of all processed records
+    :param store: feature store with processed records. If it is given all feature vectors are saved to it as one
+    matrix instead of pickles in train_data/.
+    """
+    if store is not None:
+        names = store.records()
+        store.write_features(names, extract_features_batch([store.read_record(name) for name in names]))
+        return
+    for name in [f for f in os.listdir(PROCESSED_DIRECTORY)
+                 if isfile(join(PROCESSED_DIRECTORY, f)) and not f.startswith('.')]:
         data = None
-        with open('processed_data/{}'.format(name), 'rb') as f:
+        with open(join(PROCESSED_DIRECTORY, name), 'rb') as f:
             data = pickle.load(f)
-        y = [sum(i) / len(data[0]['templates']) for i in zip(*data[0]['templates'])]
-        for j in range(1, len(data)):
-            y = [y[n] + (sum(i) / len(data[0]['templates'])) for n, i in enumerate(zip(*data[j]['templates']))]
-        y = [i / len(data) for i in y]
-        temp = [abs(i) for i in y]
-        temp2 = list(sorted(temp))[-5:]
-        peaks = [(y[temp.index(i)], temp.index(i)) for i in temp2]
-        peaks = list(itertools.chain(*peaks))
-        r_distance = [j-i for i, j in zip(data[0]['rpeaks'][:-1], data[0]['rpeaks'][1:])]
-        for k in range(1, len(data)):
-            r_distance = [(r_distance[n] if len(r_distance) > n else 0) + j - i for n, (i, j) in
-                          enumerate(zip(data[k]['rpeaks'][:-1], data[k]['rpeaks'][1:]))]
-        r_distance = [i / len(data) for i in r_distance]
-        distance_ev, distance_dispersion = utility.get_ev_and_dispersion(r_distance)
-        r_peaks = []
-        for k in range(len(data)):
-            r_peak = [data[k]['ts'][i] for i in data[k]['rpeaks']]
-            peaks_ev, peaks_dispersion = utility.get_ev_and_dispersion(r_peak)
-            r_peaks += [peaks_ev, peaks_dispersion]
-        heart_rate = data[0]['heart_rate']
-        rate_ev, distance_dispersion = utility.get_ev_and_dispersion(heart_rate)
-        result = peaks + [distance_ev, distance_dispersion] + r_peaks + [rate_ev, distance_dispersion]
+        result = extract_features(data).tolist()
         with open('train_data/{}'.format(name), 'wb') as f:
             pickle.dump(result, f)
         print(name)
 
+
 if __name__ == '__main__':
     prepare_data_for()
@@ -0,0 +1,130 @@
+"""
+This file implements loading of the prepared records and their diagnoses into one feature matrix and label vector.
+Loaded datasets are cached in memory until the files are changed.
+"""
+import os
+import pickle
+from os.path import isfile, join
+
+import numpy
+
+from feature_store import FeatureStore, INDEX
+
+TRAIN_DIRECTORY = 'train_data/'
+DIAGNOSES_DIRECTORY = 'diagnoses/'
+
+#  Loaded datasets by their directories together with the state of the files they were loaded from
+_cache = {}
+
+
+class Dataset:
+    """
+    This class contains feature vectors of records as rows of one contiguous matrix and their classes.
+    Slicing returns a dataset with views of the same arrays, so parts of the dataset are not reloaded.
+    """
+
+    def __init__(self, names: list, X: numpy.ndarray, Y: numpy.ndarray):
+        """
+        Constructor. Assigns the initial values to the fields of the class.
+        :param names: names of records
+        :param X: matrix of feature vectors, one row for each record
+        :param Y: vector of class numbers
+        """
+        self.names = names
+        self.X = X
+        self.Y = Y
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __getitem__(self, item: slice) -> 'Dataset':
+        """
+        Returns the part of the dataset
+        :param item: slice of records
+        :return: dataset sharing the arrays with this one
+        """
+        if not isinstance(item, slice):
+            raise TypeError("Only slices of the dataset are supported")
+        return Dataset(self.names[item], self.X[item], self.Y[item])
+
+    def split(self, size: int) -> tuple:
+        """
+        Splits the dataset into two parts
+        :param size: number of records in the first part
+        :return: first size records and the rest ones
+        """
+        return self[:size], self[size:]
+
+
+def _signature(train_directory: str, diagnoses_directory: str) -> tuple:
+    """
+    Private function describing the state of the dataset files without reading them
+    :param train_directory: directory with pickled feature vectors
+    :param diagnoses_directory: directory with class numbers of records
+    :return: sorted names of records which have both files and modification times of the files
+    """
+    result = []
+    for name in sorted(os.listdir(train_directory)):
+        train_file, diagnosis_file = join(train_directory, name), join(diagnoses_directory, name)
+        if isfile(train_file) and isfile(diagnosis_file):
+            result.append((name, os.stat(train_file).st_mtime_ns, os.stat(diagnosis_file).st_mtime_ns))
+    return tuple(result)
+
+
+def load_dataset(train_directory: str = TRAIN_DIRECTORY, diagnoses_directory: str = DIAGNOSES_DIRECTORY) -> Dataset:
+    """
+    Loads all records which have both feature vector and diagnosis. Records are sorted by name. The result is cached
+    and returned again while no file is added, removed or modified.
+    :param train_directory: directory with pickled feature vectors
+    :param diagnoses_directory: directory with class numbers of records
+    :return: dataset
+    :except ValueError: feature vectors have different sizes
+    """
+    key = (os.path.abspath(train_directory), os.path.abspath(diagnoses_directory))
+    signature = _signature(train_directory, diagnoses_directory)
+    cached = _cache.get(key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    names = [name for name, *times in signature]
+    vectors = []
+    Y = numpy.empty(len(names), dtype=numpy.int64)
+    for n, name in enumerate(names):
+        with open(join(train_directory, name), 'rb') as f:
+            vectors.append(numpy.asarray(pickle.load(f), dtype=numpy.float64))
+        with open(join(diagnoses_directory, name), 'r') as f:
+            Y[n] = int(f.readline().rstrip())
+    if len({len(vector) for vector in vectors}) > 1:
+        raise ValueError("Feature vectors should be the same size")
+    X = numpy.array(vectors) if vectors else numpy.zeros((0, 0))
+    result = Dataset(names, X, Y)
+    _cache[key] = (signature, result)
+    return result
+
+
+def load_from_store(path: str, diagnoses_directory: str = DIAGNOSES_DIRECTORY) -> Dataset:
+    """
+    Loads feature vectors saved in the feature store together with diagnoses. The feature matrix is memory mapped and
+    is not copied. Records without diagnosis are skipped. The result is cached the same way as in load_dataset.
+    :param path: directory of the feature store
+    :param diagnoses_directory: directory with class numbers of records
+    :return: dataset
+    """
+    key = (os.path.abspath(path), os.path.abspath(diagnoses_directory))
+    store = FeatureStore(path)
+    names, X = store.features()
+    signature = (os.stat(join(path, INDEX)).st_mtime_ns if isfile(join(path, INDEX)) else 0,) + tuple(
+        (name, os.stat(join(diagnoses_directory, name)).st_mtime_ns) for name in names
+        if isfile(join(diagnoses_directory, name)))
+    cached = _cache.get(key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    rows = [n for n, name in enumerate(names) if isfile(join(diagnoses_directory, name))]
+    Y = numpy.empty(len(rows), dtype=numpy.int64)
+    for i, n in enumerate(rows):
+        with open(join(diagnoses_directory, names[n]), 'r') as f:
+            Y[i] = int(f.readline().rstrip())
+    if len(rows) != len(names):
+        X = X[rows]
+    result = Dataset([names[n] for n in rows], X, Y)
+    _cache[key] = (signature, result)
+    return result
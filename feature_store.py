@@ -0,0 +1,161 @@
+"""
+This file implements the columnar storage of processed records and feature vectors. Arrays are kept in .npy files
+and are loaded memory mapped, so reading does not copy or unpickle anything. The index file describes the records.
+"""
+import json
+import os
+import pickle
+from os.path import isfile, join
+
+import numpy
+
+INDEX = 'index.json'
+FEATURES = 'features.npy'
+VERSION = 1
+
+#  Fields of a processed channel. Fields with the same length for all channels are stored as a matrix
+#  channels x samples, the other ones are concatenated with the offsets of channels saved in the index.
+SIGNAL_FIELDS = ('ts', 'filtered')
+RAGGED_FIELDS = ('rpeaks', 'templates', 'heart_rate')
+
+
+class FeatureStore:
+    """
+    This class stores filtered signals, r-peaks, templates and heart rate of every channel of records and the feature
+    vectors of all records as one matrix.
+    """
+
+    def __init__(self, path: str):
+        """
+        Constructor. Opens the store creating its directory if it does not exist.
+        :param path: directory of the store
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.index = {'version': VERSION, 'records': {}, 'features': None}
+        if isfile(join(path, INDEX)):
+            with open(join(path, INDEX), 'r') as f:
+                self.index = json.load(f)
+            if self.index.get('version') != VERSION:
+                raise ValueError("Unsupported store version {}".format(self.index.get('version')))
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.index['records']
+
+    def __save_index(self) -> None:
+        """
+        Private method writing the index. The file is replaced atomically, so readers never see a partial index.
+        :return: None
+        """
+        temporary = join(self.path, INDEX + '.tmp')
+        with open(temporary, 'w') as f:
+            json.dump(self.index, f)
+        os.replace(temporary, join(self.path, INDEX))
+
+    def __array_path(self, name: str, field: str) -> str:
+        return join(self.path, '{}.{}.npy'.format(name, field))
+
+    def records(self) -> list:
+        """
+        Returns the names of stored records
+        :return: sorted list of names
+        """
+        return sorted(self.index['records'])
+
+    def modification_time(self, name: str) -> float:
+        """
+        Returns the time when the record was written
+        :param name: name of the record
+        :return: modification time, 0 if the record is not stored
+        """
+        if name not in self:
+            return 0.
+        return os.stat(self.__array_path(name, SIGNAL_FIELDS[0])).st_mtime
+
+    def write_record(self, name: str, channels: list) -> None:
+        """
+        Saves the processed record
+        :param name: name of the record
+        :param channels: list of dictionaries with the arrays ts, filtered, rpeaks, templates and heart_rate
+        :return: None
+        """
+        description = {'channels': len(channels), 'offsets': {}}
+        for field in RAGGED_FIELDS:
+            arrays = [numpy.asarray(channel[field]) for channel in channels]
+            description['offsets'][field] = numpy.cumsum([0] + [len(array) for array in arrays]).tolist()
+            numpy.save(self.__array_path(name, field), numpy.concatenate(arrays) if arrays else numpy.zeros(0))
+        #  The first signal field is written last, its modification time is the time of the record
+        for field in reversed(SIGNAL_FIELDS):
+            numpy.save(self.__array_path(name, field), numpy.array([channel[field] for channel in channels]))
+        self.index['records'][name] = description
+        self.__save_index()
+
+    def read_record(self, name: str) -> list:
+        """
+        Loads the processed record. Arrays are memory mapped views of the files.
+        :param name: name of the record
+        :return: list of dictionaries with the arrays ts, filtered, rpeaks, templates and heart_rate for every channel
+        """
+        description = self.index['records'][name]
+        arrays = {field: numpy.load(self.__array_path(name, field), mmap_mode='r')
+                  for field in SIGNAL_FIELDS + RAGGED_FIELDS}
+        result = []
+        for k in range(description['channels']):
+            channel = {field: arrays[field][k] for field in SIGNAL_FIELDS}
+            for field in RAGGED_FIELDS:
+                offsets = description['offsets'][field]
+                channel[field] = arrays[field][offsets[k]:offsets[k + 1]]
+            result.append(channel)
+        return result
+
+    def write_features(self, names: list, X) -> None:
+        """
+        Saves feature vectors of records as one matrix
+        :param names: names of records
+        :param X: matrix of feature vectors, one row for each record
+        :return: None
+        """
+        X = numpy.asarray(X, dtype=numpy.float64)
+        if len(names) != len(X):
+            raise ValueError("X and names should be the same size")
+        numpy.save(join(self.path, FEATURES), X)
+        self.index['features'] = {'names': list(names), 'shape': list(X.shape)}
+        self.__save_index()
+
+    def features(self) -> tuple:
+        """
+        Loads feature vectors of records. The matrix is a memory mapped view of the file.
+        :return: names of records and matrix of their feature vectors
+        """
+        if self.index['features'] is None:
+            return [], numpy.zeros((0, 0))
+        return list(self.index['features']['names']), numpy.load(join(self.path, FEATURES), mmap_mode='r')
+
+
+def convert(processed_directory: str, train_directory: str, path: str) -> FeatureStore:
+    """
+    Converts directories of pickled processed records and feature vectors to the store. Used once for the data
+    prepared by earlier versions.
+    :param processed_directory: directory with pickled processed records, may be None
+    :param train_directory: directory with pickled feature vectors, may be None
+    :param path: directory of the store
+    :return: store with the converted data
+    """
+    store = FeatureStore(path)
+    if processed_directory is not None and os.path.isdir(processed_directory):
+        for name in sorted(os.listdir(processed_directory)):
+            if isfile(join(processed_directory, name)):
+                with open(join(processed_directory, name), 'rb') as f:
+                    store.write_record(name, pickle.load(f))
+    if train_directory is not None and os.path.isdir(train_directory):
+        names = sorted(name for name in os.listdir(train_directory) if isfile(join(train_directory, name)))
+        vectors = []
+        for name in names:
+            with open(join(train_directory, name), 'rb') as f:
+                vectors.append(numpy.asarray(pickle.load(f), dtype=numpy.float64))
+        store.write_features(names, vectors)
+    return store
+
+
+if __name__ == '__main__':
+    convert('processed_data/', 'train_data/', 'feature_store/')
@@ -0,0 +1,108 @@
+"""
+This file builds feature vectors of processed ECG records with NumPy array operations over all leads at once
+"""
+import numpy
+
+#  Number of the highest peaks of the averaged heartbeat template in the feature vector
+PEAKS = 5
+
+
+def _group_statistics(values: numpy.ndarray, groups: numpy.ndarray, number_of_groups: int) -> tuple:
+    """
+    Calculates the expected value and the dispersion of values in every group, the same way as
+    utility.get_ev_and_dispersion does
+    :param values: concatenated values of all groups
+    :param groups: group number of every value
+    :param number_of_groups: number of groups
+    :return: vectors of expected values and dispersions of groups
+    """
+    counts = numpy.bincount(groups, minlength=number_of_groups)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        ev = numpy.bincount(groups, weights=values, minlength=number_of_groups) / counts
+        dispersion = numpy.bincount(groups, weights=(values - ev[groups]) ** 2, minlength=number_of_groups) / counts
+    return ev, dispersion
+
+
+def template_peaks(y: numpy.ndarray) -> numpy.ndarray:
+    """
+    Finds the highest peaks of averaged heartbeat templates by absolute value
+    :param y: matrix of templates, one row for each record
+    :return: matrix of pairs (value, position) of PEAKS peaks in ascending order of absolute values
+    """
+    absolute = numpy.abs(y)
+    highest = numpy.sort(absolute, axis=1)[:, -PEAKS:]
+    #  The first position with the same absolute value, as list.index returns
+    positions = numpy.argmax(absolute[:, :, numpy.newaxis] == highest[:, numpy.newaxis, :], axis=1)
+    return numpy.stack([numpy.take_along_axis(y, positions, axis=1), positions], axis=2).reshape(len(y), -1)
+
+
+def extract_features_batch(records: list) -> numpy.ndarray:
+    """
+    Builds feature vectors of many processed records in one pass. The vector consists of the five highest peaks of
+    the heartbeat template averaged over all leads as pairs (value, position), the expected value of R-R distances
+    averaged over leads, the dispersion of the heart rate, the expected value and dispersion of R-peak times for every
+    lead, the expected value and dispersion of the heart rate.
+    :param records: list of records, each of them is a list of processed channels with arrays ts, rpeaks, templates and
+    heart_rate
+    :return: matrix of feature vectors, one row for each record
+    :except ValueError: records have different number of channels
+    """
+    if not records:
+        return numpy.zeros((0, 0))
+    channels = len(records[0])
+    if any(len(data) != channels for data in records):
+        raise ValueError("Records should have the same number of channels")
+    templates = [[numpy.asarray(channel['templates'], dtype=numpy.float64) for channel in data] for data in records]
+    if len({template.shape[1] for data in templates for template in data}) != 1:
+        #  Templates of different length can not be stacked, so such records are processed one by one
+        return numpy.array([extract_features_batch([data])[0] for data in records])
+    number = len(records)
+
+    #  Template averaged over leads. Every lead is divided by the number of templates of the first lead.
+    stacked = numpy.concatenate([numpy.concatenate(data) for data in templates])
+    offsets = numpy.cumsum([0] + [sum(len(template) for template in data) for data in templates])[:-1]
+    first_lead = numpy.array([len(data[0]) for data in templates], dtype=numpy.float64)
+    y = numpy.add.reduceat(stacked, offsets, axis=0) / first_lead[:, numpy.newaxis] / channels
+    peaks = template_peaks(y)
+
+    #  R-R distances are summed over leads position by position. A lead contributes to a position only if all the
+    #  following leads have a distance at this position too, and the last lead defines the number of distances.
+    distances = [[numpy.diff(numpy.asarray(channel['rpeaks'], dtype=numpy.float64)) for channel in data]
+                 for data in records]
+    longest = max(len(distance) for data in distances for distance in data)
+    padded = numpy.zeros((number, channels, longest))
+    present = numpy.zeros((number, channels, longest), dtype=bool)
+    for r, data in enumerate(distances):
+        for k, distance in enumerate(data):
+            padded[r, k, :len(distance)] = distance
+            present[r, k, :len(distance)] = True
+    suffix = numpy.flip(numpy.cumprod(numpy.flip(present, axis=1), axis=1), axis=1)
+    r_distance = (padded * suffix).sum(axis=1) / channels
+    weights = present[:, -1, :]
+    counts = weights.sum(axis=1)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        distance_ev = (r_distance * weights).sum(axis=1) / counts
+
+    #  Times of R-peaks of every lead of every record form one group
+    times = [numpy.asarray(channel['ts'])[numpy.asarray(channel['rpeaks'], dtype=numpy.int64)]
+             for data in records for channel in data]
+    groups = numpy.repeat(numpy.arange(len(times)), [len(element) for element in times])
+    peaks_ev, peaks_dispersion = _group_statistics(numpy.concatenate(times).astype(numpy.float64), groups, len(times))
+    r_peaks = numpy.stack([peaks_ev, peaks_dispersion], axis=1).reshape(number, -1)
+
+    rates = [numpy.asarray(data[0]['heart_rate'], dtype=numpy.float64) for data in records]
+    groups = numpy.repeat(numpy.arange(number), [len(rate) for rate in rates])
+    rate_ev, rate_dispersion = _group_statistics(numpy.concatenate(rates), groups, number)
+
+    #  The place of the dispersion of R-R distances has always been taken by the dispersion of the heart rate.
+    #  It is kept so, because trained models depend on this layout.
+    return numpy.column_stack([peaks, distance_ev, rate_dispersion, r_peaks, rate_ev, rate_dispersion])
+
+
+def extract_features(data: list) -> numpy.ndarray:
+    """
+    Builds the feature vector of the processed record
+    :param data: list of processed channels with arrays ts, rpeaks, templates and heart_rate
+    :return: feature vector
+    """
+    return extract_features_batch([data])[0]
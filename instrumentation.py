@@ -0,0 +1,221 @@
+"""
+This file implements the opt-in instrumentation of training and prediction. Stages of the code are timed and counters
+(kernel evaluations, solver iterations, support vectors) are accumulated while instrumentation is enabled. Disabled
+instrumentation costs one function call per stage and nothing is recorded.
+
+Usage:
+    instrumentation.enable(profile=True)
+    machine.train(...)
+    print(instrumentation.report())
+    print(instrumentation.profile_report('svm.train'))
+"""
+import cProfile
+import functools
+import io
+import pstats
+import time
+from contextlib import nullcontext
+
+#  Whether stages and counters are recorded
+_enabled = False
+#  Whether the stages opened with profile=True are captured by cProfile
+_profile = False
+#  Active profiler. Only the outermost profiled stage is captured, because profilers can not be nested.
+_profiler = None
+
+_metrics = {}
+_profiles = {}
+_callbacks = []
+
+_disabled = nullcontext()
+
+
+def enable(profile: bool = False) -> None:
+    """
+    Starts recording
+    :param profile: whether training is captured by cProfile too
+    :return: None
+    """
+    global _enabled, _profile
+    _enabled = True
+    _profile = profile
+
+
+def disable() -> None:
+    """
+    Stops recording. The recorded metrics are kept.
+    :return: None
+    """
+    global _enabled, _profile
+    _enabled = False
+    _profile = False
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def reset() -> None:
+    """
+    Clears the recorded metrics and profiles
+    :return: None
+    """
+    _metrics.clear()
+    _profiles.clear()
+
+
+def add_callback(callback) -> None:
+    """
+    Registers the function called on every recorded event
+    :param callback: function (stage, values), where values is {'seconds': time} when a stage ends and
+    {counter: value} when a counter is incremented
+    :return: None
+    """
+    _callbacks.append(callback)
+
+
+def remove_callback(callback) -> None:
+    """
+    Unregisters the function
+    :param callback: function registered by add_callback
+    :return: None
+    """
+    _callbacks.remove(callback)
+
+
+def _record(name: str, values: dict) -> None:
+    """
+    Private function adding values to the metrics of the stage and notifying the callbacks
+    :param name: name of the stage
+    :param values: values to add
+    :return: None
+    """
+    metrics = _metrics.setdefault(name, {})
+    for key, value in values.items():
+        metrics[key] = metrics.get(key, 0) + value
+    for callback in _callbacks:
+        callback(name, values)
+
+
+class _Stage:
+    """
+    Context measuring one run of the stage
+    """
+    __slots__ = ('name', 'profile', 'profiler', 'start')
+
+    def __init__(self, name: str, profile: bool):
+        self.name = name
+        self.profile = profile
+        self.profiler = None
+        self.start = 0.
+
+    def __enter__(self) -> '_Stage':
+        global _profiler
+        if self.profile and _profile and _profiler is None:
+            self.profiler = _profiler = cProfile.Profile()
+            self.profiler.enable()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception) -> None:
+        global _profiler
+        seconds = time.perf_counter() - self.start
+        if self.profiler is not None:
+            self.profiler.disable()
+            _profiler = None
+            if self.name in _profiles:
+                _profiles[self.name].add(self.profiler)
+            else:
+                _profiles[self.name] = pstats.Stats(self.profiler)
+        metrics = _metrics.setdefault(self.name, {})
+        metrics['max_seconds'] = max(metrics.get('max_seconds', 0.), seconds)
+        _record(self.name, {'calls': 1, 'seconds': seconds})
+
+
+def stage(name: str, profile: bool = False):
+    """
+    Returns the context measuring the stage
+    :param name: name of the stage, for example 'svm.train'
+    :param profile: whether the stage is captured by cProfile when profiling is enabled
+    :return: context manager
+    """
+    if not _enabled:
+        return _disabled
+    return _Stage(name, profile)
+
+
+def timed(name: str, profile: bool = False):
+    """
+    Decorator measuring every call of the function as the stage
+    :param name: name of the stage
+    :param profile: whether the stage is captured by cProfile when profiling is enabled
+    :return: decorator
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            with _Stage(name, profile):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name: str, counter: str, value: float = 1) -> None:
+    """
+    Increments the counter of the stage
+    :param name: name of the stage
+    :param counter: name of the counter, for example 'iterations'
+    :param value: increment
+    :return: None
+    """
+    if _enabled:
+        _record(name, {counter: value})
+
+
+def metrics() -> dict:
+    """
+    Returns the recorded metrics
+    :return: dictionary of stages, each of them is a dictionary with calls, seconds, max_seconds and counters
+    """
+    return {name: dict(values) for name, values in _metrics.items()}
+
+
+def profiles() -> dict:
+    """
+    Returns the captured profiles
+    :return: pstats.Stats by the names of stages
+    """
+    return dict(_profiles)
+
+
+def profile_report(name: str, sort: str = 'cumulative', limit: int = 20) -> str:
+    """
+    Formats the captured profile of the stage
+    :param name: name of the stage
+    :param sort: sort key of pstats
+    :param limit: number of functions
+    :return: text of the report, empty if the stage was not captured
+    """
+    if name not in _profiles:
+        return ''
+    stream = io.StringIO()
+    stats = pstats.Stats(stream=stream)
+    stats.add(_profiles[name])
+    stats.sort_stats(sort).print_stats(limit)
+    return stream.getvalue()
+
+
+def report() -> str:
+    """
+    Formats the recorded metrics as a table sorted by the total time
+    :return: text of the table
+    """
+    lines = ['{:<20} {:>8} {:>10} {:>10}  {}'.format('stage', 'calls', 'seconds', 'max', 'counters')]
+    for name, values in sorted(_metrics.items(), key=lambda item: -item[1].get('seconds', 0.)):
+        counters = ', '.join('{}={:g}'.format(key, value) for key, value in sorted(values.items())
+                             if key not in ('calls', 'seconds', 'max_seconds'))
+        lines.append('{:<20} {:>8} {:>10.4f} {:>10.4f}  {}'.format(
+            name, values.get('calls', 0), values.get('seconds', 0.), values.get('max_seconds', 0.), counters))
+    return '\n'.join(lines)
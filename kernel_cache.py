@@ -0,0 +1,188 @@
+"""
+This file implements the cache of kernel matrix rows which is used by solvers instead of the whole matrix
+"""
+import copy
+from collections import OrderedDict
+
+import numpy
+
+from kernels import as_matrix, kernel_matrix, kernel_diagonal
+
+DEFAULT_BUDGET = 256 * 1024 * 1024
+
+
+class KernelCache:
+    """
+    This class lazily computes rows Y_i * Y_j * K(X_i, X_j) and keeps the most recently used ones within a memory
+    budget. The least recently used rows are evicted first.
+    """
+
+    def __init__(self, kernel_type: str, params: list, X: list, Y: list = None, budget: int = DEFAULT_BUDGET,
+                 dtype=numpy.float64):
+        """
+        Constructor. Assigns the initial values to the fields of the class.
+        :param kernel_type: name of kernel type. The constants defined in kernels namespace must be used.
+        :param params: params for kernel
+        :param X: input vectors set
+        :param Y: output values set. If it is None the rows are not multiplied by the labels
+        :param budget: maximum number of bytes used by the cached rows. At least two rows are always kept.
+        :param dtype: float type of the input vectors and kernel rows. float32 rows take half of the budget, rows
+        multiplied by the labels are float64 for the solvers anyway.
+        """
+        self.kernel_type = kernel_type
+        self.params = params
+        self.dtype = numpy.dtype(dtype)
+        self.points = as_matrix(X, self.dtype)
+        self.labels = None if Y is None else numpy.asarray(Y, dtype=numpy.float64)
+        self.budget = budget
+        self.capacity = max(2, budget // max(1, self.points.shape[0] * self.points.itemsize))
+        self.rows = OrderedDict()
+        self.counters = {"hits": 0, "misses": 0, "evictions": 0}
+        self.parent = None
+        self.indices = None
+        self.__diagonal = None
+
+    @classmethod
+    def from_matrix(cls, kernel_type: str, params: list, X: list, gram: numpy.ndarray, Y: list = None) -> 'KernelCache':
+        """
+        Creates the cache over the already computed kernel matrix. The rows are views of the matrix, so nothing is
+        copied or recomputed and the budget is not applied.
+        :param kernel_type: name of kernel type which was used for the matrix
+        :param params: params for kernel
+        :param X: input vectors set
+        :param gram: matrix K(X_i, X_j) without labels. Its float type becomes the float type of the cache.
+        :param Y: output values set. If it is None the rows are not multiplied by the labels
+        :return: cache containing all rows
+        """
+        result = cls(kernel_type, params, X, Y, budget=gram.nbytes, dtype=gram.dtype)
+        if gram.shape != (len(result), len(result)):
+            raise ValueError("Kernel matrix should be n x n")
+        result.capacity = max(2, len(result))
+        for i, row in enumerate(gram):
+            result.rows[i] = row
+        return result
+
+    def relabel(self, Y: list) -> 'KernelCache':
+        """
+        Returns the cache for the same kernel and vectors with other labels. Kernel rows do not depend on the labels,
+        so both caches share the stored rows and statistics, and every row is computed only once for all of them.
+        :param Y: output values set
+        :return: cache sharing the rows with this one
+        """
+        if len(Y) != len(self):
+            raise ValueError("X and Y should be the same size")
+        result = copy.copy(self)
+        result.labels = numpy.asarray(Y, dtype=numpy.float64)
+        return result
+
+    def subset(self, indices: numpy.ndarray, Y: list = None) -> 'KernelCache':
+        """
+        Returns the cache for the subset of vectors. Its rows are cut from the rows of this cache, so the subsets of
+        the same vectors set share the stored rows and statistics.
+        :param indices: indexes of the vectors of the subset
+        :param Y: output values set for the subset. If it is None the rows are not multiplied by the labels
+        :return: cache of the subset
+        """
+        result = copy.copy(self)
+        result.parent = self
+        result.indices = numpy.asarray(indices, dtype=numpy.int64)
+        result.points = self.points[result.indices]
+        result.labels = None if Y is None else numpy.asarray(Y, dtype=numpy.float64)
+        result.rows = OrderedDict()
+        result.__diagonal = None
+        if result.labels is not None and len(result.labels) != len(result):
+            raise ValueError("X and Y should be the same size")
+        return result
+
+    def __len__(self) -> int:
+        return self.points.shape[0]
+
+    def __store(self, i: int, row: numpy.ndarray) -> None:
+        """
+        Private method saving the row into the cache and evicting the least recently used rows
+        :param i: row number
+        :param row: kernel values K(X_i, X_j) for all j
+        :return: None
+        """
+        self.rows[i] = row
+        while len(self.rows) > self.capacity:
+            self.rows.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def kernel_row(self, i: int) -> numpy.ndarray:
+        """
+        Returns row i of the kernel matrix K(X_i, X_j) without the labels
+        :param i: row number
+        :return: vector of kernel values
+        """
+        if self.parent is not None:
+            return self.parent.kernel_row(self.indices[i])[self.indices]
+        row = self.rows.get(i)
+        if row is not None:
+            self.counters["hits"] += 1
+            self.rows.move_to_end(i)
+            return row
+        self.counters["misses"] += 1
+        if not self.rows and self.capacity >= len(self):
+            #  The whole matrix fits into the budget, so it is computed in one call
+            for j, row in enumerate(kernel_matrix(self.kernel_type, self.points, self.points, self.params,
+                                                  self.dtype)):
+                self.__store(j, row)
+            self.rows.move_to_end(i)
+            return self.rows[i]
+        row = kernel_matrix(self.kernel_type, self.points, self.points[i], self.params, self.dtype)
+        self.__store(i, row)
+        return row
+
+    def row(self, i: int) -> numpy.ndarray:
+        """
+        Returns row i of the matrix Y_i * Y_j * K(X_i, X_j)
+        :param i: row number
+        :return: vector of values
+        """
+        row = self.kernel_row(i)
+        if self.labels is None:
+            return row
+        return self.labels[i] * self.labels * row
+
+    def diagonal(self) -> numpy.ndarray:
+        """
+        Returns the diagonal of the matrix. Y_i * Y_i = 1, so labels do not change it.
+        :return: vector of values
+        """
+        if self.__diagonal is None and self.parent is not None:
+            self.__diagonal = self.parent.diagonal()[self.indices]
+        elif self.__diagonal is None:
+            self.__diagonal = kernel_diagonal(self.kernel_type, self.points, self.params)
+        return self.__diagonal
+
+    def matrix(self) -> numpy.ndarray:
+        """
+        Returns the whole matrix Y_i * Y_j * K(X_i, X_j). Should be used only by the dense solvers.
+        :return: float64 matrix n x n
+        """
+        if self.capacity >= len(self) or self.parent is not None:
+            result = numpy.array([self.kernel_row(i) for i in range(len(self))], dtype=numpy.float64)
+        else:
+            #  The matrix does not fit into the budget, so it is computed without touching the cached rows
+            result = kernel_matrix(self.kernel_type, self.points, self.points, self.params, self.dtype).astype(
+                numpy.float64, copy=False)
+        if self.labels is not None:
+            result *= numpy.outer(self.labels, self.labels)
+        return result
+
+    def clear(self) -> None:
+        """
+        Releases all cached rows. Statistics are kept.
+        :return: None
+        """
+        self.rows.clear()
+
+    def statistics(self) -> dict:
+        """
+        Returns usage statistics of the cache
+        :return: dictionary with the numbers of hits, misses, evictions, cached rows and used bytes
+        """
+        requests = self.counters["hits"] + self.counters["misses"]
+        return dict(self.counters, hit_ratio=self.counters["hits"] / requests if requests else 0., rows=len(self.rows),
+                    bytes=sum(row.nbytes for row in self.rows.values()))
@@ -1,8 +1,11 @@
 """
-This file contains functions that are kernels
+This file contains functions that are kernels and their batched versions which work with whole matrices
 """
 from math import exp
 
+import numpy
+
+import instrumentation
 import utility
 
 
@@ -12,6 +15,9 @@ GAUSSIAN = "gaussian"
 EXPONENTIAL = "exponential"
 LAPLICAN = "laplacian"
 
+#  Float types of kernel matrices. float32 halves the memory and bandwidth of kernel rows and support vectors.
+FLOAT_TYPES = (numpy.float64, numpy.float32)
+
 
 def linear_kernel(X: list, Y: list, c: float = 0, *p) -> float:
     """
@@ -90,3 +96,206 @@ def laplacian_kernel(X: list, Y: list, sigma: float = 1, *p) -> float:
     assert Y, list
     assert sigma, float
     return exp(-(utility.euclidean_distance(X, Y)) / sigma)
+
+
+def as_matrix(X, dtype=numpy.float64) -> numpy.ndarray:
+    """
+    Converts the set of vectors to the two-dimensional float array. A single vector becomes a matrix 1 x d.
+    :param X: vector or set of vectors
+    :param dtype: float type of the matrix
+    :return: matrix n x d
+    """
+    return numpy.atleast_2d(numpy.asarray(X, dtype=dtype))
+
+
+def _batched(kernel):
+    """
+    Decorator which converts the arguments of a batched kernel to matrices. If the second argument is a single vector
+    the result is a vector too. The keyword argument dtype selects the float type of the result.
+    :param kernel: batched kernel which works with matrices n x d and m x d
+    :return: kernel accepting lists, matrices and vectors
+    """
+    def wrapper(X, Y, *params, dtype=numpy.float64) -> numpy.ndarray:
+        is_vector = numpy.ndim(Y) == 1
+        #  Norms and dot products are always float64 and only the finished block is rounded: the expansion of squared
+        #  distances cancels catastrophically in float32 for features of large magnitude
+        A = as_matrix(X)
+        B = A if Y is X else as_matrix(Y)
+        result = kernel(A, B, *params).astype(dtype, copy=False)
+        return result[:, 0] if is_vector else result
+    wrapper.__name__ = kernel.__name__
+    wrapper.__doc__ = kernel.__doc__
+    return wrapper
+
+
+def _linear_from_products(products: numpy.ndarray, c: float = 0, *p) -> numpy.ndarray:
+    return products + c
+
+
+def _polynomial_from_products(products: numpy.ndarray, c: float = 0, alpha: float = 0, d: float = 2,
+                              *p) -> numpy.ndarray:
+    return (alpha * products + c) ** d
+
+
+def _gaussian_from_distances(squared: numpy.ndarray, sigma: float = 1, *p) -> numpy.ndarray:
+    return numpy.exp(-squared / (2 * (sigma ** 2)))
+
+
+def _exponential_from_distances(squared: numpy.ndarray, sigma: float = 1, *p) -> numpy.ndarray:
+    return numpy.exp(-numpy.sqrt(squared) / (2 * (sigma ** 2)))
+
+
+def _laplacian_from_distances(squared: numpy.ndarray, sigma: float = 1, *p) -> numpy.ndarray:
+    return numpy.exp(-numpy.sqrt(squared) / sigma)
+
+
+@_batched
+def linear_kernel_matrix(X: numpy.ndarray, Y: numpy.ndarray, c: float = 0, *p) -> numpy.ndarray:
+    """
+    Batched version of linear_kernel
+    :param X: matrix n x d
+    :param Y: matrix m x d or vector d
+    :param c: coefficient c
+    :param p: other parameters, in case the method receives more
+    :return: matrix n x m (vector n if Y is a vector) of kernel values
+    """
+    return _linear_from_products(numpy.dot(X, Y.T), c)
+
+
+@_batched
+def polynomial_kernel_matrix(X: numpy.ndarray, Y: numpy.ndarray, c: float = 0, alpha: float = 0, d: float = 2,
+                             *p) -> numpy.ndarray:
+    """
+    Batched version of polynomial_kernel
+    :param X: matrix n x d
+    :param Y: matrix m x d or vector d
+    :param c: coefficient c
+    :param alpha: coefficient alpha
+    :param d: coefficient d
+    :param p: other parameters, in case the method receives more
+    :return: matrix n x m (vector n if Y is a vector) of kernel values
+    """
+    return _polynomial_from_products(numpy.dot(X, Y.T), c, alpha, d)
+
+
+@_batched
+def gaussian_kernel_matrix(X: numpy.ndarray, Y: numpy.ndarray, sigma: float = 1, *p) -> numpy.ndarray:
+    """
+    Batched version of gaussian_kernel
+    :param X: matrix n x d
+    :param Y: matrix m x d or vector d
+    :param sigma: coefficient sigma
+    :param p: other parameters, in case the method receives more
+    :return: matrix n x m (vector n if Y is a vector) of kernel values
+    """
+    return _gaussian_from_distances(utility.squared_distance_matrix(X, Y), sigma)
+
+
+@_batched
+def exponential_kernel_matrix(X: numpy.ndarray, Y: numpy.ndarray, sigma: float = 1, *p) -> numpy.ndarray:
+    """
+    Batched version of exponential_kernel
+    :param X: matrix n x d
+    :param Y: matrix m x d or vector d
+    :param sigma: coefficient sigma
+    :param p: other parameters, in case the method receives more
+    :return: matrix n x m (vector n if Y is a vector) of kernel values
+    """
+    return _exponential_from_distances(utility.squared_distance_matrix(X, Y), sigma)
+
+
+@_batched
+def laplacian_kernel_matrix(X: numpy.ndarray, Y: numpy.ndarray, sigma: float = 1, *p) -> numpy.ndarray:
+    """
+    Batched version of laplacian_kernel
+    :param X: matrix n x d
+    :param Y: matrix m x d or vector d
+    :param sigma: coefficient sigma
+    :param p: other parameters, in case the method receives more
+    :return: matrix n x m (vector n if Y is a vector) of kernel values
+    """
+    return _laplacian_from_distances(utility.squared_distance_matrix(X, Y), sigma)
+
+
+def kernel_diagonal(kernel_type: str, X, params: list) -> numpy.ndarray:
+    """
+    Calculates kernel values K(X_i, X_i) for every vector of X without building the whole kernel matrix
+    :param kernel_type: name of kernel type. The constants defined in this file must be used.
+    :param X: matrix n x d
+    :param params: params for kernel
+    :return: vector n of kernel values
+    :except ValueError: unknown kernel type
+    """
+    if kernel_type not in kernel_matrices:
+        raise ValueError("Unknown kernel type {}".format(kernel_type))
+    X = as_matrix(X)
+    if kernel_type in PRODUCT_KERNELS:
+        return kernel_from_argument(kernel_type, numpy.einsum('ij,ij->i', X, X), params)
+    #  All distance based kernels are equal to exp(0) on the diagonal
+    return numpy.ones(len(X))
+
+
+kernel_matrices = {LINEAR: linear_kernel_matrix, POLYNOMIAL: polynomial_kernel_matrix,
+                   GAUSSIAN: gaussian_kernel_matrix, EXPONENTIAL: exponential_kernel_matrix,
+                   LAPLICAN: laplacian_kernel_matrix}
+
+
+#  Kernels which depend only on the dot product of vectors and only on the distance between them
+PRODUCT_KERNELS = (LINEAR, POLYNOMIAL)
+DISTANCE_KERNELS = (GAUSSIAN, EXPONENTIAL, LAPLICAN)
+
+_from_argument = {LINEAR: _linear_from_products, POLYNOMIAL: _polynomial_from_products,
+                  GAUSSIAN: _gaussian_from_distances, EXPONENTIAL: _exponential_from_distances,
+                  LAPLICAN: _laplacian_from_distances}
+
+
+def kernel_argument(kernel_type: str, X, Y) -> numpy.ndarray:
+    """
+    Calculates the matrix the kernel depends on: dot products for linear and polynomial kernels and squared distances
+    for the other ones. It does not depend on the kernel params, so it may be computed once for many params.
+    :param kernel_type: name of kernel type. The constants defined in this file must be used.
+    :param X: matrix n x d
+    :param Y: matrix m x d
+    :return: matrix n x m
+    :except ValueError: unknown kernel type
+    """
+    if kernel_type not in _from_argument:
+        raise ValueError("Unknown kernel type {}".format(kernel_type))
+    A = as_matrix(X)
+    B = A if Y is X else as_matrix(Y)
+    if kernel_type in PRODUCT_KERNELS:
+        return numpy.dot(A, B.T)
+    return utility.squared_distance_matrix(A, B)
+
+
+def kernel_from_argument(kernel_type: str, argument: numpy.ndarray, params: list) -> numpy.ndarray:
+    """
+    Calculates kernel values from the result of kernel_argument. Gives the same values as kernel_matrix.
+    :param kernel_type: name of kernel type. The constants defined in this file must be used.
+    :param argument: dot products or squared distances
+    :param params: params for kernel
+    :return: matrix of kernel values
+    :except ValueError: unknown kernel type
+    """
+    if kernel_type not in _from_argument:
+        raise ValueError("Unknown kernel type {}".format(kernel_type))
+    return _from_argument[kernel_type](argument, *params)
+
+
+def kernel_matrix(kernel_type: str, X, Y, params: list, dtype=numpy.float64) -> numpy.ndarray:
+    """
+    Calculates kernel values for every pair of vectors from X and Y
+    :param kernel_type: name of kernel type. The constants defined in this file must be used.
+    :param X: matrix n x d
+    :param Y: matrix m x d or vector d
+    :param params: params for kernel
+    :param dtype: float type of the result, one of FLOAT_TYPES. The values are computed in float64.
+    :return: matrix n x m (vector n if Y is a vector) of kernel values
+    :except ValueError: unknown kernel type
+    """
+    if kernel_type not in kernel_matrices:
+        raise ValueError("Unknown kernel type {}".format(kernel_type))
+    with instrumentation.stage('kernel'):
+        result = kernel_matrices[kernel_type](X, Y, *params, dtype=dtype)
+    instrumentation.count('kernel', 'evaluations', result.size)
+    return result
@@ -1,41 +1,14 @@
-import os
-import random
-from os.path import isfile, join
-
-import pickle
-
 import ovr
+import validation
+from dataset import load_dataset
 from kernels import GAUSSIAN
 
 if __name__ == '__main__':
-    wrong = 72
-    while (wrong / 72) > 0.05:
-        machine = ovr.OVR()
-        X = []
-        Y = []
-        t = 0
-        for name in [f for f in os.listdir('train_data/') if isfile(join('train_data/', f))]:
-            if t == 55:
-                break
-            t += 1
-            with open('train_data/{}'.format(name), 'rb') as f:
-                X.append(pickle.load(f))
-            with open('diagnoses/{}'.format(name), 'r') as f:
-                data = f.readline().rstrip()
-                Y.append(int(data))
-        sigma = 2
-        C = 100
-        machine.train(40, GAUSSIAN, [sigma], X, Y, C)
-        wrong = 0
-        X_n = []
-        Y_n = []
-        for name in [f for f in os.listdir('train_data/') if isfile(join('train_data/', f))]:
-            with open('train_data/{}'.format(name), 'rb') as f:
-                X_n.append(pickle.load(f))
-            with open('diagnoses/{}'.format(name), 'r') as f:
-                data = f.readline().rstrip()
-                Y_n.append(int(data))
-        for x, y in zip(X_n, Y_n):
-            if machine.classify(x) != y:
-                wrong += 1
-        print(wrong / 72, sigma, C)
+    #  The dataset is read from disk only once and is reloaded only if its files change
+    data = load_dataset()
+    sigma = 2
+    C = 100
+    #  Every record is predicted by a classifier which was trained without it
+    results = validation.cross_validate(GAUSSIAN, [sigma], data.X, data.Y, C, classifier=ovr.OVR,
+                                        number_of_classes=40, folds=5, seed=0)
+    print(validation.format_folds(results))
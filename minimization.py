@@ -3,6 +3,12 @@ import quadprog
 import typing
 import numpy
 
+import instrumentation
+
+QUADPROG = "quadprog"
+SMO = "smo"
+COORDINATE_DESCENT = "coordinate_descent"
+
 Equations = typing.List[typing.Dict[str, typing.List[float]]]
 Equation = typing.Dict[str, typing.List[float]]
 Matrix = typing.List[typing.List[float]]
@@ -16,7 +22,29 @@ def generate_a(n: int) -> numpy.ndarray:
 
 
 def generate_g(g: Matrix) -> numpy.ndarray:
-    return numpy.array([[float(element) for element in line] for line in g])
+    return numpy.array(g, dtype=numpy.float64)
+
+
+def regularize(G: numpy.ndarray, ridge: float = 1e-8) -> numpy.ndarray:
+    """
+    Makes the matrix positive definite, as quadprog requires. Gram matrices of the linear and polynomial kernels have
+    the rank of at most the number of features, so with more samples than features they are only semi-definite.
+    A ridge relative to the mean of the diagonal is added to the diagonal, the matrix is returned as is if it is
+    positive definite already. A ridge which merely passes the Cholesky factorization is not enough: the matrix stays
+    so ill-conditioned that variables at the bounds are off by 1e-5, and a wrong free variable is chosen for the bias.
+    :param G: symmetric positive semi-definite matrix
+    :param ridge: ridge relative to the mean of the diagonal, it is multiplied by 10 until the factorization succeeds
+    :return: positive definite matrix
+    """
+    scale = max(float(numpy.mean(numpy.diag(G))), 1.) if len(G) else 1.
+    shift = 0.
+    while True:
+        try:
+            numpy.linalg.cholesky(G + shift * numpy.eye(len(G)) if shift else G)
+            break
+        except numpy.linalg.LinAlgError:
+            shift = ridge * scale if not shift else shift * 10
+    return G + shift * numpy.eye(len(G)) if shift else G
 
 
 def generate_c(n: int, y: list) -> numpy.ndarray:
@@ -29,5 +57,222 @@ def generate_b(n: int, c: float) -> numpy.ndarray:
     return numpy.array([0. for i in range(n + 1)] + [float(-c) for i in range(n)])
 
 
-def minimize(g: Matrix, n: int, y: list, c: float):
-    return quadprog.solve_qp(G=generate_g(g), a=generate_a(n), C=generate_c(n, y), b=generate_b(n, c), meq=1)[0]
\ No newline at end of file
+def minimize(g: Matrix, n: int, y: list, c: float, full_output: bool = False):
+    if n and (min(y) > 0 or max(y) < 0):
+        #  transpose(y) * a = 0 with a >= 0 allows the zero solution only, while quadprog finds the constraints
+        #  inconsistent. The bias is found from the label then.
+        result = numpy.zeros(n)
+        return (result, 0) if full_output else result
+    with instrumentation.stage('qp.setup'):
+        G, a, C, b = regularize(generate_g(g)), generate_a(n), generate_c(n, y), generate_b(n, c)
+    with instrumentation.stage('qp.solve'):
+        result = quadprog.solve_qp(G=G, a=a, C=C, b=b, meq=1)
+    instrumentation.count('qp.solve', 'iterations', int(result[3][0]))
+    if full_output:
+        return result[0], int(result[3][0])
+    return result[0]
+
+
+class SMOSolver:
+    """
+    Sequential Minimal Optimization solver for the dual problem
+    min 1/2 * transpose(a) * Q * a - sum(a), transpose(y) * a = 0, 0 <= a <= c.
+    Works on the pair of variables chosen with second order information (Fan, Chen, Lin 2005),
+    so only two rows of Q are requested on every iteration.
+    """
+
+    tau = 1e-12
+
+    def __init__(self, kernel_row: typing.Callable[[int], numpy.ndarray], diagonal: numpy.ndarray, y: list, c: float,
+                 tol: float = 1e-3, max_iter: int = 1000000, initial: numpy.ndarray = None):
+        """
+        Constructor. Assigns the initial values to the fields of the class.
+        :param kernel_row: function returning row i of Q, where Q[i][j] = y[i] * y[j] * K(X[i], X[j])
+        :param diagonal: vector of Q[i][i]
+        :param y: output values set. Should contains only 1 and -1
+        :param c: upper bound of variables
+        :param tol: tolerance of the KKT conditions violation used as stopping criterion
+        :param max_iter: maximum number of iterations
+        :param initial: starting point, for example the solution for a close c or for the part of the samples.
+        A shorter vector is padded with zeros. It is made feasible by warm_start.
+        """
+        self.kernel_row = kernel_row
+        self.diagonal = numpy.asarray(diagonal, dtype=numpy.float64)
+        self.y = numpy.asarray(y, dtype=numpy.float64)
+        self.c = float(c)
+        self.tol = tol
+        self.max_iter = max_iter
+        self.alpha = numpy.zeros(len(self.y))
+        self.gradient = -numpy.ones(len(self.y))
+        self.iterations = 0
+        if initial is not None:
+            self.warm_start(initial)
+
+    def warm_start(self, initial: numpy.ndarray) -> None:
+        """
+        Moves the solver to the nearest feasible point of the starting point. Variables are clipped into the box,
+        then the variables of the class with the greater sum are scaled down until transpose(y) * a = 0.
+        The gradient is computed from the rows of nonzero variables only.
+        :param initial: starting point. A shorter vector is padded with zeros.
+        :return: None
+        :except ValueError: the starting point is longer than the number of variables
+        """
+        initial = numpy.asarray(initial, dtype=numpy.float64)
+        if len(initial) > len(self.y):
+            raise ValueError("Starting point should not be longer than y")
+        alpha = numpy.zeros(len(self.y))
+        alpha[:len(initial)] = numpy.clip(initial, 0., self.c)
+        excess = numpy.dot(self.y, alpha)
+        side = self.y > 0 if excess > 0 else self.y < 0
+        total = alpha[side].sum()
+        if total > 0:
+            alpha[side] *= (total - abs(excess)) / total
+        self.alpha = alpha
+        self.gradient = -numpy.ones(len(self.y))
+        for i in numpy.flatnonzero(alpha):
+            self.gradient += alpha[i] * self.kernel_row(i)
+
+    def __select_working_set(self) -> typing.Tuple[int, int]:
+        """
+        Private method choosing the maximal violating pair with second order information
+        :return: indexes of the pair, -1 if KKT conditions are satisfied within tolerance
+        """
+        y, alpha, c = self.y, self.alpha, self.c
+        score = -y * self.gradient
+        up = ((y > 0) & (alpha < c)) | ((y < 0) & (alpha > 0))
+        low = ((y > 0) & (alpha > 0)) | ((y < 0) & (alpha < c))
+        if not up.any() or not low.any():
+            return -1, -1
+        i = int(numpy.argmax(numpy.where(up, score, -numpy.inf)))
+        maximum = score[i]
+        if maximum - numpy.min(numpy.where(low, score, numpy.inf)) < self.tol:
+            return -1, -1
+        row = self.kernel_row(i)
+        candidates = low & (score < maximum)
+        b = maximum - score
+        a = self.diagonal[i] + self.diagonal - 2 * y[i] * y * row
+        a = numpy.where(a > 0, a, self.tau)
+        j = int(numpy.argmin(numpy.where(candidates, -(b ** 2) / a, numpy.inf)))
+        return i, j
+
+    def solve(self) -> numpy.ndarray:
+        """
+        Runs the optimization until the stopping criterion is satisfied
+        :return: vector of variables a
+        """
+        y, alpha = self.y, self.alpha
+        while self.iterations < self.max_iter:
+            i, j = self.__select_working_set()
+            if i == -1:
+                break
+            self.iterations += 1
+            row_i = self.kernel_row(i)
+            row_j = self.kernel_row(j)
+            # Moves along the direction a_i += y_i * t, a_j -= y_j * t which keeps transpose(y) * a constant
+            quad = self.diagonal[i] + self.diagonal[j] - 2 * y[i] * y[j] * row_i[j]
+            step = (-y[i] * self.gradient[i] + y[j] * self.gradient[j]) / max(quad, self.tau)
+            step = min(step, self.c - alpha[i] if y[i] > 0 else alpha[i],
+                       alpha[j] if y[j] > 0 else self.c - alpha[j])
+            delta_i = min(max(alpha[i] + y[i] * step, 0.), self.c) - alpha[i]
+            delta_j = min(max(alpha[j] - y[j] * step, 0.), self.c) - alpha[j]
+            alpha[i] += delta_i
+            alpha[j] += delta_j
+            self.gradient += delta_i * row_i + delta_j * row_j
+        return alpha
+
+
+def minimize_smo(kernel_row: typing.Callable[[int], numpy.ndarray], diagonal: numpy.ndarray, y: list, c: float,
+                 tol: float = 1e-3, initial: numpy.ndarray = None, full_output: bool = False):
+    with instrumentation.stage('smo.solve'):
+        solver = SMOSolver(kernel_row, diagonal, y, c, tol, initial=initial)
+        result = solver.solve()
+    instrumentation.count('smo.solve', 'iterations', solver.iterations)
+    if full_output:
+        return result, solver.iterations
+    return result
+
+
+def minimize_coordinate_descent(Z: numpy.ndarray, y: list, c: float, tol: float = 1e-1, max_epochs: int = 1000,
+                                seed: int = 0, initial: numpy.ndarray = None, full_output: bool = False):
+    """
+    Dual coordinate descent for the linear svm with shrinking (Hsieh et al. 2008). Solves
+    min 1/2 * transpose(a) * Q * a - sum(a), 0 <= a <= c, where Q[i][j] = y[i] * y[j] * transpose(Z[i]) * Z[j].
+    The weights w = sum(a[i] * y[i] * Z[i]) are updated together with every variable, so one epoch costs as much as
+    one pass over Z. Variables at bounds whose gradient points outside of the box are skipped until the end.
+    There is no equality constraint, the bias should be a constant column of Z.
+    :param Z: matrix samples x features
+    :param y: output values set. Should contains only 1 and -1
+    :param c: upper bound of variables
+    :param tol: tolerance of the projected gradient used as stopping criterion. The default is the one of LIBLINEAR,
+    the solution is not used far beyond the accuracy of the approximation anyway.
+    :param max_epochs: maximum number of passes over the samples
+    :param seed: seed of the random order of variables
+    :param initial: starting point. A shorter vector is padded with zeros, then it is clipped into the box.
+    :param full_output: whether the number of epochs is returned too
+    :return: vector of variables a, and the number of epochs if full_output is set
+    :except ValueError: the starting point is longer than the number of variables
+    """
+    with instrumentation.stage('cd.solve'):
+        alpha, epochs = _coordinate_descent(Z, y, c, tol, max_epochs, seed, initial)
+    instrumentation.count('cd.solve', 'epochs', epochs)
+    if full_output:
+        return alpha, epochs
+    return alpha
+
+
+def _coordinate_descent(Z: numpy.ndarray, y: list, c: float, tol: float, max_epochs: int, seed: int,
+                        initial: numpy.ndarray) -> typing.Tuple[numpy.ndarray, int]:
+    Z = numpy.asarray(Z, dtype=numpy.float64)
+    y = numpy.asarray(y, dtype=numpy.float64)
+    c = float(c)
+    alpha = numpy.zeros(len(y))
+    if initial is not None:
+        initial = numpy.asarray(initial, dtype=numpy.float64)
+        if len(initial) > len(y):
+            raise ValueError("Starting point should not be longer than y")
+        alpha[:len(initial)] = numpy.clip(initial, 0., c)
+    signed = Z * y[:, numpy.newaxis]
+    w = numpy.dot(alpha, signed)
+    diagonal = numpy.einsum('ij,ij->i', Z, Z)
+    generator = numpy.random.default_rng(seed)
+    candidates = numpy.flatnonzero(diagonal > 0)
+    active = candidates
+    #  Bounds of the projected gradient in the previous epoch, used to shrink variables
+    upper, lower = numpy.inf, -numpy.inf
+    epochs = 0
+    while epochs < max_epochs:
+        epochs += 1
+        largest, smallest = -numpy.inf, numpy.inf
+        shrunk = []
+        for i in generator.permutation(active):
+            row = signed[i]
+            gradient = float(numpy.dot(w, row)) - 1
+            a = alpha[i]
+            if a <= 0:
+                if gradient > upper:
+                    shrunk.append(i)
+                    continue
+                projected = min(gradient, 0.)
+            elif a >= c:
+                if gradient < lower:
+                    shrunk.append(i)
+                    continue
+                projected = max(gradient, 0.)
+            else:
+                projected = gradient
+            largest, smallest = max(largest, projected), min(smallest, projected)
+            if projected != 0:
+                alpha[i] = min(max(a - gradient / diagonal[i], 0.), c)
+                w += (alpha[i] - a) * row
+        if shrunk:
+            active = numpy.setdiff1d(active, shrunk, assume_unique=True)
+        if largest - smallest < tol or not len(active):
+            if not shrunk and len(active) == len(candidates):
+                break
+            #  The shrunk problem is solved, so the whole one is checked again
+            active = candidates
+            upper, lower = numpy.inf, -numpy.inf
+            continue
+        upper = largest if largest > 0 else numpy.inf
+        lower = smallest if smallest < 0 else -numpy.inf
+    return alpha, epochs
\ No newline at end of file
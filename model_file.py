@@ -0,0 +1,210 @@
+"""
+This file implements the binary file of trained models. Only the data used by prediction is stored: support vectors,
+their coefficients, biases, kernel names and params of all internal svm, and the feature maps of approximated kernels.
+The file consists of a fixed header, a JSON description and raw arrays aligned to ALIGNMENT bytes, so the arrays are
+memory mapped on loading without copying or parsing them, and processes loading the same file share their pages.
+
+Layout: MAGIC, version (uint32), length of the description (uint32), description, arrays.
+"""
+import json
+import struct
+
+import numpy
+
+import approximation
+import ovr
+import pairwise
+import svm
+
+MAGIC = b'SVMMODEL'
+VERSION = 1
+ALIGNMENT = 64
+
+_HEADER = struct.Struct('<8sII')
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+class _Writer:
+    """
+    Collects the arrays of the model and their places in the file
+    """
+
+    def __init__(self):
+        self.arrays = []
+        self.size = 0
+
+    def add(self, array: numpy.ndarray) -> dict:
+        """
+        Registers the array
+        :param array: array to store
+        :return: description of the array: its offset from the beginning of the data, shape and dtype
+        """
+        array = numpy.ascontiguousarray(array)
+        array = array.astype(array.dtype.newbyteorder('<'), copy=False)
+        offset = _align(self.size)
+        self.arrays.append((offset, array))
+        self.size = offset + array.nbytes
+        return {'offset': offset, 'shape': list(array.shape), 'dtype': array.dtype.str}
+
+
+def _describe_map(feature_map: approximation.FeatureMap, writer: _Writer) -> dict:
+    """
+    Private function describing the feature map
+    :param feature_map: fitted feature map
+    :param writer: writer collecting the arrays
+    :return: description of the map
+    """
+    names = {cls: name for name, cls in approximation.feature_maps.items()}
+    return {'method': names[type(feature_map)], 'kernel_type': feature_map.kernel_type,
+            'params': [float(element) for element in feature_map.params], 'n_components': int(feature_map.n_components),
+            'seed': None if feature_map.seed is None else int(feature_map.seed),
+            'arrays': {name: writer.add(value) for name, value in vars(feature_map).items()
+                       if isinstance(value, numpy.ndarray)}}
+
+
+def _describe_machine(machine: svm.SVM, writer: _Writer, maps: list) -> dict:
+    """
+    Private function describing the trained svm
+    :param machine: trained svm
+    :param writer: writer collecting the arrays
+    :param maps: feature maps already described. Maps shared by several svm are stored once.
+    :return: description of the svm
+    """
+    #  Hyperparameters are often numpy scalars, for example taken from a search grid, which json can not write
+    description = {'kernel_type': machine.kernel_type, 'params': [float(element) for element in machine.params],
+                   'c': float(machine.c), 'b': float(machine.b), 'feature_map': None}
+    if machine.feature_map is None:
+        description['support_vectors'] = writer.add(machine.support_vectors)
+        description['dual_coef'] = writer.add(machine.dual_coef)
+        return description
+    #  Approximated svm predict with the weights in the feature space only
+    if not any(element is machine.feature_map for element in maps):
+        maps.append(machine.feature_map)
+    description['feature_map'] = next(i for i, element in enumerate(maps) if element is machine.feature_map)
+    description['weights'] = writer.add(machine.weights)
+    return description
+
+
+def save_model(machine, path: str) -> None:
+    """
+    Writes the trained model
+    :param machine: trained svm.SVM, ovr.OVR or pairwise.PairwiseClassifier
+    :param path: path of the file
+    :return: None
+    :except ValueError: the model is not trained or has unsupported type
+    """
+    writer = _Writer()
+    maps = []
+    if isinstance(machine, svm.SVM):
+        if machine.kernel_type is None:
+            raise ValueError("SVM should be trained before saving")
+        description = {'type': 'svm', 'machines': [_describe_machine(machine, writer, maps)]}
+    elif isinstance(machine, (ovr.OVR, pairwise.PairwiseClassifier)):
+        if machine.machine is None:
+            raise ValueError("Classifier should be trained before saving")
+        description = {'type': 'ovr' if isinstance(machine, ovr.OVR) else 'pairwise',
+                       'number_of_classes': int(machine.number_of_classes), 'kernel_type': machine.kernel_type,
+                       'c': float(machine.c), 'machines': [_describe_machine(element, writer, maps)
+                                                           for element in machine.machine]}
+        if isinstance(machine, pairwise.PairwiseClassifier):
+            description['pairs'] = machine.pairs.tolist()
+    else:
+        raise ValueError("Unsupported model type {}".format(type(machine).__name__))
+    description['feature_maps'] = [_describe_map(element, writer) for element in maps]
+    text = json.dumps(description).encode('utf-8')
+    start = _align(_HEADER.size + len(text))
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(text)))
+        f.write(text)
+        for offset, array in writer.arrays:
+            f.seek(start + offset)
+            f.write(array.tobytes())
+        f.truncate(start + writer.size)
+
+
+def _array(data: numpy.ndarray, start: int, description: dict) -> numpy.ndarray:
+    """
+    Private function returning the view of the stored array
+    :param data: bytes of the file
+    :param start: offset of the arrays in the file
+    :param description: description of the array
+    :return: array sharing the memory with data
+    """
+    dtype = numpy.dtype(description['dtype'])
+    shape = tuple(description['shape'])
+    count = int(numpy.prod(shape))
+    offset = start + description['offset']
+    return data[offset:offset + count * dtype.itemsize].view(dtype).reshape(shape)
+
+
+def _restore_machine(description: dict, data: numpy.ndarray, start: int, maps: list) -> svm.SVM:
+    """
+    Private function restoring svm for prediction
+    :param description: description of the svm
+    :param data: bytes of the file
+    :param start: offset of the arrays in the file
+    :param maps: restored feature maps
+    :return: svm ready for prediction
+    """
+    machine = svm.SVM()
+    machine.kernel_type = description['kernel_type']
+    machine.kernel = svm.SVM.kernel_types[machine.kernel_type]
+    machine.params = description['params']
+    machine.c = description['c']
+    machine.b = description['b']
+    if description['feature_map'] is not None:
+        machine.feature_map = maps[description['feature_map']]
+        machine.weights = _array(data, start, description['weights'])
+        return machine
+    machine.support_vectors = _array(data, start, description['support_vectors'])
+    machine.dual_coef = _array(data, start, description['dual_coef'])
+    machine.dtype = machine.support_vectors.dtype.newbyteorder('=')
+    #  Only the support vectors are known, so they become the training set of the restored svm
+    machine.support = numpy.arange(len(machine.dual_coef))
+    machine.results = numpy.abs(machine.dual_coef)
+    machine.Y = numpy.where(machine.dual_coef < 0, -1., 1.)
+    machine.X = machine.support_vectors
+    return machine
+
+
+def load_model(path: str, mmap: bool = True):
+    """
+    Reads the model written by save_model
+    :param path: path of the file
+    :param mmap: whether the arrays are memory mapped views of the file, otherwise the file is read into memory
+    :return: svm.SVM, ovr.OVR or pairwise.PairwiseClassifier ready for prediction
+    :except ValueError: the file is not a model or has unsupported version
+    """
+    with open(path, 'rb') as f:
+        header = f.read(_HEADER.size)
+        if len(header) != _HEADER.size:
+            raise ValueError("{} is not a model file".format(path))
+        magic, version, length = _HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError("{} is not a model file".format(path))
+        if version != VERSION:
+            raise ValueError("Unsupported model file version {}".format(version))
+        description = json.loads(f.read(length).decode('utf-8'))
+    start = _align(_HEADER.size + length)
+    data = numpy.memmap(path, dtype=numpy.uint8, mode='r') if mmap else numpy.fromfile(path, dtype=numpy.uint8)
+    maps = []
+    for element in description['feature_maps']:
+        feature_map = approximation.feature_map(element['method'], element['kernel_type'], element['params'],
+                                                element['n_components'], element['seed'])
+        for name, array in element['arrays'].items():
+            setattr(feature_map, name, _array(data, start, array))
+        maps.append(feature_map)
+    machines = [_restore_machine(element, data, start, maps) for element in description['machines']]
+    if description['type'] == 'svm':
+        return machines[0]
+    result = ovr.OVR() if description['type'] == 'ovr' else pairwise.PairwiseClassifier()
+    result.number_of_classes = description['number_of_classes']
+    result.kernel_type = description['kernel_type']
+    result.c = description['c']
+    result.machine = machines
+    if description['type'] == 'pairwise':
+        result.pairs = numpy.array(description['pairs'], dtype=numpy.int64).reshape(-1, 2)
+    return result
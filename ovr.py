@@ -1,5 +1,12 @@
+import numpy
+
+import instrumentation
+import minimization
+import parallel
 import svm
+from approximation import DEFAULT_COMPONENTS, LINEAR_FEATURES, FeatureMap, feature_map
 from classifier import Classifier
+from kernel_cache import KernelCache, DEFAULT_BUDGET
 from kernels import *
 
 
@@ -12,8 +19,13 @@ class OVR(Classifier):
         Constructor. Invokes the parent class constructor.
         """
         super().__init__()
+        self.statistics = {}
 
-    def train(self, number_of_classes: int, kernel_type: str, params: list, X: list, Y: list, c: float):
+    @instrumentation.timed('ovr.train', profile=True)
+    def train(self, number_of_classes: int, kernel_type: str, params: list, X: list, Y: list, c: float,
+              solver: str = minimization.QUADPROG, cache_size: int = DEFAULT_BUDGET, n_jobs: int = 1,
+              cache: KernelCache = None, warm_start: 'OVR' = None, approximation=None,
+              n_components: int = DEFAULT_COMPONENTS, seed: int = None, dtype=numpy.float64):
         """
         This method builds svm and must be called before using the class
         :param number_of_classes: the number of classes to which the input object
@@ -23,12 +35,112 @@ class OVR(Classifier):
         :param Y: output values set. Shows the number of the class to which the learning vector should be assigned.
         Must be in range 0..number_of_classes
         :param c: param for all internal svm
+        :param solver: name of the quadratic problem solver for all internal svm. COORDINATE_DESCENT with the linear
+        kernel trains every svm as one weight vector, see svm.SVM.train.
+        :param cache_size: memory budget of the kernel rows cache in bytes. The cache is shared by all internal svm,
+        because they use the same X and differ only in the signs of Y.
+        :param n_jobs: number of processes training internal svm concurrently, -1 means all CPUs. The whole kernel
+        matrix is shared with the processes, so cache_size is not applied if n_jobs is not 1.
+        :param cache: kernel cache built for the same kernel, params and X, for example over a precomputed matrix.
+        It is used instead of a new one and its rows are not released. cache_size and n_jobs are ignored in this case.
+        :param warm_start: classifier trained before with a close c or on the first samples of X. Internal svm start
+        from the alphas of its svm of the same class. Supported by SMO, COORDINATE_DESCENT and approximated training.
+        :param approximation: name of the kernel approximation or a fitted approximation.FeatureMap. The map is fitted
+        once and is shared by all internal svm, see svm.SVM.train. solver, cache_size, n_jobs and cache are ignored in
+        this case.
+        :param n_components: dimension of the feature space of the approximation
+        :param seed: seed of the random generator of the approximation
+        :param dtype: float type of kernel rows, support vectors and prediction of all internal svm, see svm.SVM.train
         """
+        self.number_of_classes = number_of_classes
+        self.kernel_type = kernel_type
+        self.c = c
+        labels = [[1 if element == n else -1 for element in Y] for n in range(number_of_classes)]
+        initial = [None] * number_of_classes
+        if warm_start is not None:
+            initial[:len(warm_start.machine)] = [machine.results for machine in warm_start.machine][:number_of_classes]
+        if approximation is None and solver == minimization.COORDINATE_DESCENT and kernel_type == LINEAR:
+            #  All internal svm share the linear features and are predicted with one product by their weights
+            approximation = LINEAR_FEATURES
+        if approximation is not None:
+            if not isinstance(approximation, FeatureMap):
+                approximation = feature_map(approximation, kernel_type, params, n_components, seed).fit(X)
+            #  X is mapped once for all internal svm
+            features = approximation.transform(X)
+            self.machine = [svm.SVM().train(kernel_type, params, X, y_for_svm, c, initial=start,
+                                            approximation=approximation, seed=seed, features=features)
+                            for y_for_svm, start in zip(labels, initial)]
+            self.statistics = {}
+            return
+        if n_jobs != 1 and cache is None:
+            self.machine = parallel.train_machines(kernel_type, params, X, c, [(None, y) for y in labels], solver,
+                                                   n_jobs, initial, dtype)
+            self.statistics = {}
+            return
+        shared = cache is not None
+        if not shared:
+            cache = KernelCache(kernel_type, params, X, budget=cache_size, dtype=dtype)
         self.machine = [svm.SVM() for element in range(number_of_classes)]
+        for machine, y_for_svm, start in zip(self.machine, labels, initial):
+            machine.train(kernel_type, params, X, y_for_svm, c, solver=solver, cache=cache, initial=start)
+        self.statistics = cache.statistics()
+        if not shared:
+            cache.clear()
+
+    def partial_fit(self, X: list, Y: list, budget: int = None, cache_size: int = DEFAULT_BUDGET) -> 'OVR':
+        """
+        This method updates the trained classifier with new samples. Every internal svm is updated with
+        svm.SVM.partial_fit, so it keeps only its own support vectors.
+        :param X: new input vectors
+        :param Y: class numbers of the new vectors. Must be in range 0..number_of_classes
+        :param budget: maximum number of support vectors of every internal svm, None means no limit
+        :param cache_size: memory budget of the kernel rows cache of every internal svm in bytes
+        :except ValueError: raises if the classifier is not trained or Y has wrong values
+        :return: classifier after training
+        """
+        if not self.machine:
+            raise ValueError("OVR should be trained before partial_fit")
+        Y = numpy.asarray(Y)
+        if len(Y) and (Y.min() < 0 or Y.max() >= self.number_of_classes):
+            raise ValueError("Y should be in range 0..number_of_classes")
         for n, machine in enumerate(self.machine):
-            y_for_svm = [1 if element == n else -1 for element in Y]
-            machine.train(kernel_type, params, X, y_for_svm, c)
+            machine.partial_fit(X, numpy.where(Y == n, 1, -1), budget, cache_size)
+        return self
+
+    def remove(self, X: list, budget: int = None, cache_size: int = DEFAULT_BUDGET) -> 'OVR':
+        """
+        This method retires samples from all internal svm with svm.SVM.remove
+        :param X: input vectors to remove
+        :param budget: maximum number of support vectors of every internal svm, None means no limit
+        :param cache_size: memory budget of the kernel rows cache of every internal svm in bytes
+        :except ValueError: raises if the classifier is not trained
+        :return: classifier after training
+        """
+        if not self.machine:
+            raise ValueError("OVR should be trained before remove")
+        for machine in self.machine:
+            machine.remove(X, budget, cache_size)
+        return self
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Memory used by the arrays of internal svm which are needed for prediction. A shared feature map is counted
+        once.
+        """
+        maps = {id(machine.feature_map): machine.feature_map for machine in self.machine or []
+                if machine.feature_map is not None}
+        return sum(machine.nbytes - (machine.feature_map.nbytes if machine.feature_map is not None else 0)
+                   for machine in self.machine or []) + sum(element.nbytes for element in maps.values())
+
+    @property
+    def iterations(self) -> int:
+        """
+        Total number of iterations made by the solvers of all internal svm
+        """
+        return sum(machine.iterations for machine in self.machine or [])
 
+    @instrumentation.timed('ovr.classify')
     def classify(self, vector: list) -> int:
         """
         The method classifies the input sample.
@@ -39,6 +151,51 @@ class OVR(Classifier):
         maximum = max(results)
         return results.index(maximum)
 
+    def decision_function_batch(self, X, batch_size: int = svm.BATCH_SIZE) -> numpy.ndarray:
+        """
+        The method calculates the distances from many samples to the hyperplanes of all internal svm
+        :param X: matrix of input samples
+        :param batch_size: number of samples processed by one kernel matrix evaluation
+        :return: matrix samples x classes of distances
+        """
+        X = as_matrix(X)
+        shared = self.machine[0].feature_map if self.machine else None
+        if shared is not None and all(element.feature_map is shared for element in self.machine):
+            #  All internal svm are linear in the same feature space, so every chunk is mapped once and multiplied
+            #  by the matrix of their weights
+            weights = numpy.column_stack([element.weights for element in self.machine])
+            biases = numpy.array([element.b for element in self.machine])
+            return numpy.concatenate([numpy.dot(shared.transform(X[start:start + batch_size]), weights) + biases
+                                      for start in range(0, len(X), batch_size)] or [numpy.zeros((0, len(biases)))])
+        return numpy.column_stack([element.decision_function_batch(X, batch_size) for element in self.machine])
+
+    def decision_function_precomputed(self, K) -> numpy.ndarray:
+        """
+        The method calculates the distances from many samples to the hyperplanes of all internal svm with the kernel
+        values computed elsewhere
+        :param K: matrix samples x training samples of kernel values
+        :return: matrix samples x classes of distances
+        """
+        return numpy.column_stack([element.decision_function_precomputed(K) for element in self.machine])
+
+    def predict_precomputed(self, K) -> numpy.ndarray:
+        """
+        The method classifies many input samples with the kernel values computed elsewhere
+        :param K: matrix samples x training samples of kernel values
+        :return: vector of class numbers to which the samples belong
+        """
+        return numpy.argmax(self.decision_function_precomputed(K), axis=1)
+
+    @instrumentation.timed('ovr.predict')
+    def predict_batch(self, X, batch_size: int = svm.BATCH_SIZE) -> numpy.ndarray:
+        """
+        The method classifies many input samples at once.
+        :param X: matrix of input samples
+        :param batch_size: number of samples processed by one kernel matrix evaluation
+        :return: vector of class numbers to which the samples belong
+        """
+        return numpy.argmax(self.decision_function_batch(X, batch_size), axis=1)
+
 if __name__ == '__main__':
     machine = OVR()
     machine.train(2, POLYNOMIAL, [1, 1, 2], [[-1, -1], [-1, 1], [1, -1], [1, 1]], [1, 0, 0, 1], 5)
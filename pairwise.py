@@ -1,58 +1,190 @@
+import numpy
+
+import instrumentation
+import minimization
+import parallel
 import svm
 from classifier import Classifier
+from kernel_cache import KernelCache, DEFAULT_BUDGET
+from kernels import as_matrix
 
 
 class PairwiseClassifier(Classifier):
     """
-    This class implements a pairwise multi-class classifier
+    This class implements a pairwise multi-class classifier. An internal svm is built for every pair of classes on the
+    samples of these two classes only, and the class with the most votes wins.
     """
-    def train(self, number_of_classes: int, kernel_type: str, params: list, X: list, Y: list, c: float):
+    def __init__(self):
+        """
+        Constructor. Invokes the parent class constructor.
+        """
+        super().__init__()
+        self.pairs = numpy.zeros((0, 2), dtype=numpy.int64)
+        self.subsets = []
+
+    @instrumentation.timed('pairwise.train', profile=True)
+    def train(self, number_of_classes: int, kernel_type: str, params: list, X: list, Y: list, c: float,
+              solver: str = minimization.QUADPROG, cache_size: int = DEFAULT_BUDGET, n_jobs: int = 1,
+              cache: KernelCache = None, warm_start: 'PairwiseClassifier' = None, dtype=numpy.float64):
         """
         This method builds svm and must be called before using the class
         :param number_of_classes: the number of classes to which the input object
         :param kernel_type: name of kernel type for internal svm. The constants defined in svm namespace must be used.
         :param params: params for internal svm kernel
         :param X: input vectors set
-        :param Y: output values set. Must be the list of lists. Each list for input vector must contain 1 or -1 for each
-         possible pair of classes.
+        :param Y: output values set. Shows the number of the class to which the learning vector should be assigned.
+        Must be in range 0..number_of_classes
         :param c: param for all internal svm
+        :param solver: name of the quadratic problem solver for all internal svm
+        :param cache_size: memory budget of the kernel rows cache in bytes. The cache is shared by all internal svm,
+        each of them reads the rows of its own samples.
+        :param n_jobs: number of processes training internal svm concurrently, -1 means all CPUs. The whole kernel
+        matrix is shared with the processes, so cache_size is not applied if n_jobs is not 1.
+        :param cache: kernel cache built for the same kernel, params and X, for example over a precomputed matrix.
+        It is used instead of a new one and its rows are not released. cache_size and n_jobs are ignored in this case.
+        :param warm_start: classifier trained before with a close c or on the first samples of X. Internal svm start
+        from the alphas of its svm of the same pair. Supported by SMO only.
+        :param dtype: float type of kernel rows, support vectors and prediction of all internal svm, see svm.SVM.train
         """
-        number_of_svm = (number_of_classes - 1) * number_of_classes / 2
-        self.machine = [svm.SVM() for machine in range(number_of_svm)]
-        for n, machine in enumerate(self.machine):
-            y_for_svm = [element[n] for element in Y]
-            machine.train(kernel_type, params, X, y_for_svm, c)
+        self.number_of_classes = number_of_classes
+        self.kernel_type = kernel_type
+        self.c = c
+        Y = numpy.asarray(Y)
+        tasks = []
+        pairs = []
+        for first, second in zip(*numpy.triu_indices(number_of_classes, 1)):
+            indices = numpy.flatnonzero((Y == first) | (Y == second))
+            labels = numpy.where(Y[indices] == first, 1, -1)
+            #  A pair without samples of one of its classes can not be trained and does not vote
+            if len(indices) and labels.min() < 0 < labels.max():
+                pairs.append((first, second))
+                tasks.append((indices, labels.tolist()))
+        self.pairs = numpy.array(pairs, dtype=numpy.int64).reshape(-1, 2)
+        self.subsets = [indices for indices, labels in tasks]
+        previous = {} if warm_start is None else {
+            tuple(pair): machine.results for pair, machine in zip(warm_start.pairs.tolist(), warm_start.machine)}
+        initial = [previous.get(pair) for pair in pairs]
+        if n_jobs != 1 and cache is None:
+            self.machine = parallel.train_machines(kernel_type, params, X, c, tasks, solver, n_jobs, initial, dtype)
+            return
+        shared = cache is not None
+        if not shared:
+            cache = KernelCache(kernel_type, params, X, budget=cache_size, dtype=dtype)
+        self.machine = []
+        for (indices, labels), start in zip(tasks, initial):
+            subset = cache.subset(indices)
+            self.machine.append(svm.SVM().train(kernel_type, params, subset.points, labels, c, solver=solver,
+                                                cache=subset, initial=start))
+        if not shared:
+            cache.clear()
+
+    @property
+    def iterations(self) -> int:
+        """
+        Total number of iterations made by the solvers of all internal svm
+        """
+        return sum(machine.iterations for machine in self.machine or [])
 
     def classify(self, vector: list) -> int:
         """
         The method classifies the input sample.
         :param vector: input sample
-        :return: class number to which the object belongs
+        :return: class number to which the object belongs, -1 if no pair of classes was trained
+        """
+        return int(self.predict_batch([vector])[0])
+
+    def decision_function_batch(self, X, batch_size: int = svm.BATCH_SIZE) -> numpy.ndarray:
+        """
+        The method calculates the distances from many samples to the hyperplanes of all internal svm
+        :param X: matrix of input samples
+        :param batch_size: number of samples processed by one kernel matrix evaluation
+        :return: matrix samples x trained pairs of distances. Columns are ordered as pairs field.
+        """
+        X = as_matrix(X)
+        if not self.machine:
+            return numpy.zeros((len(X), 0))
+        return numpy.column_stack([machine.decision_function_batch(X, batch_size) for machine in self.machine])
+
+    @instrumentation.timed('pairwise.predict')
+    def predict_batch(self, X, batch_size: int = svm.BATCH_SIZE) -> numpy.ndarray:
+        """
+        The method classifies many input samples at once. Every internal svm votes for one class of its pair.
+        Ties are resolved in favor of the class with the greatest sum of distances as in identify_affiliation.
+        :param X: matrix of input samples
+        :param batch_size: number of samples processed by one kernel matrix evaluation
+        :return: vector of class numbers to which the samples belong, -1 if no pair of classes was trained
+        """
+        return self.__vote(self.decision_function_batch(X, batch_size))
+
+    def decision_function_precomputed(self, K) -> numpy.ndarray:
+        """
+        The method calculates the distances from many samples to the hyperplanes of all internal svm with the kernel
+        values computed elsewhere
+        :param K: matrix samples x training samples of kernel values for all input vectors of the training
+        :return: matrix samples x trained pairs of distances. Columns are ordered as pairs field.
+        :except ValueError: the classifier does not know the training samples of its pairs, for example it is loaded
+        by model_file.load_model
+        """
+        K = numpy.asarray(K)
+        if not self.machine:
+            return numpy.zeros((len(K), 0))
+        if len(self.subsets) != len(self.machine):
+            raise ValueError("Training samples of the pairs are unknown, use decision_function_batch instead")
+        return numpy.column_stack([machine.decision_function_precomputed(K[:, indices])
+                                   for machine, indices in zip(self.machine, self.subsets)])
+
+    def predict_precomputed(self, K) -> numpy.ndarray:
+        """
+        The method classifies many input samples with the kernel values computed elsewhere
+        :param K: matrix samples x training samples of kernel values for all input vectors of the training
+        :return: vector of class numbers to which the samples belong, -1 if no pair of classes was trained
+        :except ValueError: the training samples of the pairs are unknown, see decision_function_precomputed
+        """
+        return self.__vote(self.decision_function_precomputed(K))
+
+    def __vote(self, results: numpy.ndarray) -> numpy.ndarray:
+        """
+        Private method counting the votes of internal svm
+        :param results: matrix samples x trained pairs of distances
+        :return: vector of class numbers which won, -1 if no pair of classes was trained
         """
-        results = [machine.get_distance(vector) for machine in self.machine]
-        classes = [sum(element) for element in self.identify_affiliation(results)]
-        maximum = max(classes)
-        if maximum > 0:
-            return classes.index(max(results))
-        else:
-            return -1
+        if not len(self.pairs):
+            return numpy.full(len(results), -1)
+        winners = numpy.where(results < 0, self.pairs[:, 1], self.pairs[:, 0])
+        offsets = numpy.arange(len(results))[:, numpy.newaxis] * self.number_of_classes
+        votes = numpy.bincount((winners + offsets).ravel(), minlength=len(results) * self.number_of_classes)
+        votes = votes.reshape(len(results), self.number_of_classes)
+        signs = numpy.zeros((len(self.pairs), self.number_of_classes))
+        signs[numpy.arange(len(self.pairs)), self.pairs[:, 0]] = 1
+        signs[numpy.arange(len(self.pairs)), self.pairs[:, 1]] = -1
+        sums = numpy.where(votes == votes.max(axis=1, keepdims=True), numpy.dot(results, signs), -numpy.inf)
+        return numpy.argmax(sums, axis=1)
 
     @staticmethod
-    def identify_affiliation(data: list) -> list:
+    def affiliation_matrix(number_of_pairs: int) -> numpy.ndarray:
         """
-        For each class in the group of pairs of possible classes returns a vector of values belonging to it.
-        :param data: vector of values for all possible pairs of classes
-        :return: vector values for each class
+        Builds the matrix pairs x classes which contains 1 if the class is the first one in the pair and -1 if it is
+        the second one. Pairs are ordered as (0, 1), (0, 2), ..., (1, 2), ...
+        :param number_of_pairs: number of possible pairs of classes
+        :return: matrix of signs
         """
-        n = (1 + (1 + 8 * len(data)) ** 0.5) / 2
+        n = (1 + (1 + 8 * number_of_pairs) ** 0.5) / 2
         if int(n) != n:
             raise ValueError("Data is wrong size")
-        result = []
         n = int(n)
-        for i in range(n):
-            temp = []
-            for element in result:
-                temp.append(-element[i - 1])
-            temp += data[sum(list(range(n - 1, n - 1 - i, -1))):sum(list(range(n - 1, n - 2 - i, -1)))]
-            result.append(temp)
+        first, second = numpy.triu_indices(n, 1)
+        result = numpy.zeros((number_of_pairs, n))
+        result[numpy.arange(number_of_pairs), first] = 1
+        result[numpy.arange(number_of_pairs), second] = -1
         return result
+
+    @staticmethod
+    def identify_affiliation(data: list) -> list:
+        """
+        For each class in the group of pairs of possible classes returns a vector of values belonging to it.
+        :param data: vector of values for all possible pairs of classes
+        :return: vector values for each class
+        """
+        signs = PairwiseClassifier.affiliation_matrix(len(data))
+        values = signs * numpy.asarray(data, dtype=numpy.float64)[:, numpy.newaxis]
+        return [values[signs[:, i] != 0, i].tolist() for i in range(signs.shape[1])]
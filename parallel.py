@@ -0,0 +1,134 @@
+"""
+This file contains helpers for training independent svm in a pool of processes. Large arrays are passed to the
+workers through shared memory instead of being pickled for every task.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy
+
+import minimization
+import svm
+from kernel_cache import KernelCache
+from kernels import as_matrix, kernel_matrix
+
+#  Arrays attached by the worker process. Keeps shared memory blocks alive while the worker is running.
+_shared = {}
+
+
+def number_of_workers(n_jobs: int) -> int:
+    """
+    Converts the n_jobs option to the number of processes. Negative values are counted from the number of CPUs,
+    so -1 means all CPUs.
+    :param n_jobs: requested number of processes
+    :return: number of processes, at least 1
+    """
+    if n_jobs < 0:
+        n_jobs = (os.cpu_count() or 1) + 1 + n_jobs
+    return max(1, n_jobs)
+
+
+class SharedArrays:
+    """
+    This class copies arrays into shared memory blocks and releases them on exit from the context
+    """
+
+    def __init__(self, **arrays):
+        """
+        Constructor. Assigns the initial values to the fields of the class.
+        :param arrays: arrays to share by their names
+        """
+        self.arrays = arrays
+        self.blocks = []
+        self.specification = {}
+
+    def __enter__(self) -> dict:
+        """
+        Creates shared memory blocks
+        :return: specification of blocks which should be passed to attach in the worker
+        """
+        for name, array in self.arrays.items():
+            array = numpy.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(1, array.nbytes))
+            self.blocks.append(block)
+            numpy.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+            self.specification[name] = (block.name, array.shape, array.dtype.str)
+        return self.specification
+
+    def __exit__(self, *exception) -> None:
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.blocks = []
+
+
+def attach(specification: dict) -> None:
+    """
+    Initializer of the worker process. Attaches to the shared memory blocks created by SharedArrays.
+    :param specification: specification of blocks returned by SharedArrays
+    :return: None
+    """
+    for name, (block_name, shape, dtype) in specification.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        _shared[name] = (block, numpy.ndarray(shape, numpy.dtype(dtype), buffer=block.buf))
+
+
+def shared(name: str) -> numpy.ndarray:
+    """
+    Returns the array attached by the worker
+    :param name: name of the array
+    :return: array placed in shared memory
+    """
+    return _shared[name][1]
+
+
+def _train_machine(task: tuple) -> tuple:
+    """
+    Trains one svm in the worker process on the shared X and kernel matrix
+    :param task: indices of the used samples (None for all samples), labels, starting alphas, kernel type, params, c
+    and solver
+    :return: alphas, bias and number of iterations of the trained svm
+    """
+    indices, labels, initial, kernel_type, params, c, solver = task
+    X, gram = shared("X"), shared("gram")
+    if indices is not None:
+        X, gram = X[indices], gram[numpy.ix_(indices, indices)]
+    cache = KernelCache.from_matrix(kernel_type, params, X, gram)
+    machine = svm.SVM().train(kernel_type, params, X, labels, c, solver=solver, cache=cache, initial=initial)
+    return machine.results, machine.b, machine.iterations
+
+
+def train_machines(kernel_type: str, params: list, X: list, c: float, tasks: list,
+                   solver: str = minimization.QUADPROG, n_jobs: int = -1, initial: list = None,
+                   dtype=numpy.float64) -> list:
+    """
+    Trains independent svm on subsets of the same input vectors set in a pool of processes. The kernel matrix is
+    computed once and is shared with the workers together with X. The result does not depend on n_jobs.
+    :param kernel_type: name of kernel type for all svm. The constants defined in kernels namespace must be used.
+    :param params: params for kernel
+    :param X: input vectors set
+    :param c: param for all svm
+    :param tasks: list of pairs (indices, labels). Indices select the samples of X used by svm, None means all samples.
+    Labels contain 1 and -1 for the selected samples.
+    :param solver: name of the quadratic problem solver. The constants defined in minimization namespace must be used.
+    :param n_jobs: number of processes, -1 means all CPUs
+    :param initial: starting alphas of every task (see svm.SVM.train), None means training from scratch
+    :param dtype: float type of the shared X and kernel matrix and of the support vectors
+    :return: list of trained svm in the order of tasks
+    """
+    points = as_matrix(X, dtype)
+    gram = kernel_matrix(kernel_type, points, points, params, dtype)
+    if initial is None:
+        initial = [None] * len(tasks)
+    jobs = [(indices, labels, start, kernel_type, params, c, solver)
+            for (indices, labels), start in zip(tasks, initial)]
+    with SharedArrays(X=points, gram=gram) as specification:
+        with ProcessPoolExecutor(max_workers=min(number_of_workers(n_jobs), max(1, len(jobs))),
+                                 initializer=attach, initargs=(specification,)) as executor:
+            solutions = list(executor.map(_train_machine, jobs))
+    machines = []
+    for (indices, labels), (results, b, iterations) in zip(tasks, solutions):
+        subset = points if indices is None else points[indices]
+        machines.append(svm.SVM().restore(kernel_type, params, subset, labels, c, results, b, iterations, dtype))
+    return machines
@@ -0,0 +1,191 @@
+"""
+This file implements the search of kernel params and c on a validation set. The matrices kernels depend on (dot
+products or squared distances) are computed once for all configurations and are shared with the pool of processes,
+the kernel matrix of one kernel and params is computed once for all values of c.
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+import minimization
+import ovr
+import parallel
+from kernel_cache import KernelCache
+from kernels import *
+
+
+def _argument_name(kernel_type: str, part: str) -> str:
+    """
+    Private function naming the shared matrix the kernel depends on
+    :param kernel_type: name of kernel type
+    :param part: 'train' for the matrix of the training set, 'validation' for the validation x training one
+    :return: name of the shared array
+    """
+    return '{}_{}'.format(part, 'products' if kernel_type in PRODUCT_KERNELS else 'distances')
+
+
+def _evaluate(task: tuple, arrays) -> list:
+    """
+    Private function training and checking the classifier for one kernel and params and all values of c
+    :param task: kernel type, params, values of c, classifier class, number of classes and solver
+    :param arrays: function returning the array by its name
+    :return: list of results, one for each value of c
+    """
+    kernel_type, params, c_values, classifier, number_of_classes, solver = task
+    X, Y, Y_validation = arrays('X'), arrays('Y'), arrays('Y_validation')
+    start = time.perf_counter()
+    gram = kernel_from_argument(kernel_type, arrays(_argument_name(kernel_type, 'train')), params)
+    cross = kernel_from_argument(kernel_type, arrays(_argument_name(kernel_type, 'validation')), params)
+    cache = KernelCache.from_matrix(kernel_type, params, X, gram)
+    kernel_time = time.perf_counter() - start
+    results = []
+    previous = None
+    #  SMO starts from the solution for the previous c, which is close when values of c are sorted
+    for c in sorted(c_values):
+        machine = classifier()
+        start = time.perf_counter()
+        machine.train(number_of_classes, kernel_type, params, X, Y, c, solver=solver, cache=cache,
+                      warm_start=previous if solver == minimization.SMO else None)
+        previous = machine
+        train_time = time.perf_counter() - start
+        start = time.perf_counter()
+        predicted = machine.predict_precomputed(cross)
+        predict_time = time.perf_counter() - start
+        results.append({'kernel_type': kernel_type, 'params': list(params), 'c': c,
+                        'accuracy': float(numpy.mean(predicted == Y_validation)),
+                        'errors': int(numpy.sum(predicted != Y_validation)), 'iterations': machine.iterations,
+                        'kernel_time': kernel_time, 'train_time': train_time, 'predict_time': predict_time})
+    return results
+
+
+def _evaluate_shared(task: tuple) -> list:
+    """
+    Private function evaluating the task in the worker process on the shared arrays
+    :param task: task as in _evaluate
+    :return: list of results
+    """
+    return _evaluate(task, parallel.shared)
+
+
+def search(X, Y, X_validation, Y_validation, configurations: list, classifier=ovr.OVR, number_of_classes: int = None,
+           solver: str = minimization.QUADPROG, n_jobs: int = -1) -> list:
+    """
+    Trains the classifier for every configuration and measures its accuracy on the validation set
+    :param X: training input vectors set
+    :param Y: training class numbers
+    :param X_validation: validation input vectors set
+    :param Y_validation: validation class numbers
+    :param configurations: list of triples (kernel type, params, list of values of c)
+    :param classifier: multi-class classifier class with train and predict_precomputed methods (OVR or
+    PairwiseClassifier)
+    :param number_of_classes: number of classes, by default the greatest class number plus one
+    :param solver: name of the quadratic problem solver. SMO is warm started from the solution for the previous c.
+    :param n_jobs: number of processes, -1 means all CPUs
+    :return: list of results sorted by rank. Every result is a dictionary with kernel_type, params, c, accuracy,
+    errors, rank, iterations of the solvers and the times in seconds: kernel_time (kernel matrices of the params,
+    shared by all c), train_time and predict_time. The time spent on the shared matrices is in argument_time of every
+    result.
+    :except ValueError: unknown kernel type
+    """
+    X, X_validation = as_matrix(X), as_matrix(X_validation)
+    Y, Y_validation = numpy.asarray(Y, dtype=numpy.int64), numpy.asarray(Y_validation, dtype=numpy.int64)
+    if len(X) != len(Y) or len(X_validation) != len(Y_validation):
+        raise ValueError("X and Y should be the same size")
+    if number_of_classes is None:
+        number_of_classes = int(max(Y.max(initial=-1), Y_validation.max(initial=-1))) + 1
+    arrays = {'X': X, 'Y': Y, 'Y_validation': Y_validation}
+    start = time.perf_counter()
+    for kernel_type in {kernel_type for kernel_type, params, c_values in configurations}:
+        name = _argument_name(kernel_type, 'train')
+        if name not in arrays:
+            arrays[name] = kernel_argument(kernel_type, X, X)
+            arrays[_argument_name(kernel_type, 'validation')] = kernel_argument(kernel_type, X_validation, X)
+    argument_time = time.perf_counter() - start
+    tasks = [(kernel_type, list(params), list(c_values), classifier, number_of_classes, solver)
+             for kernel_type, params, c_values in configurations]
+    workers = min(parallel.number_of_workers(n_jobs), max(1, len(tasks)))
+    if workers == 1:
+        evaluated = [_evaluate(task, arrays.__getitem__) for task in tasks]
+    else:
+        with parallel.SharedArrays(**arrays) as specification:
+            with ProcessPoolExecutor(max_workers=workers, initializer=parallel.attach,
+                                     initargs=(specification,)) as executor:
+                evaluated = list(executor.map(_evaluate_shared, tasks))
+    results = [dict(result, argument_time=argument_time) for results in evaluated for result in results]
+    results.sort(key=lambda result: (-result['accuracy'], result['train_time'] + result['predict_time']))
+    for rank, result in enumerate(results, 1):
+        result['rank'] = rank
+    return results
+
+
+def grid_search(X, Y, X_validation, Y_validation, grid: dict, c_values: list, **options) -> list:
+    """
+    Checks all combinations of kernel params and c
+    :param X: training input vectors set
+    :param Y: training class numbers
+    :param X_validation: validation input vectors set
+    :param Y_validation: validation class numbers
+    :param grid: lists of params by kernel types, for example {GAUSSIAN: [[1], [2], [4]]}
+    :param c_values: values of c checked with every kernel and params
+    :param options: classifier, number_of_classes, solver and n_jobs as in search
+    :return: list of results sorted by rank as in search
+    """
+    configurations = [(kernel_type, params, c_values) for kernel_type, values in grid.items() for params in values]
+    return search(X, Y, X_validation, Y_validation, configurations, **options)
+
+
+def random_search(X, Y, X_validation, Y_validation, ranges: dict, c_range: tuple, iterations: int = 10,
+                  c_per_params: int = 3, seed: int = None, **options) -> list:
+    """
+    Checks random kernel params and values of c. All values are sampled log-uniformly, so the ranges should be
+    positive. Several values of c are checked for every sampled params to reuse their kernel matrix.
+    :param X: training input vectors set
+    :param Y: training class numbers
+    :param X_validation: validation input vectors set
+    :param Y_validation: validation class numbers
+    :param ranges: lists of pairs (low, high), one for every kernel param, by kernel types,
+    for example {GAUSSIAN: [(0.1, 10)]}
+    :param c_range: pair (low, high) of c
+    :param iterations: number of sampled params of every kernel type
+    :param c_per_params: number of values of c sampled for every params
+    :param seed: seed of the random generator
+    :param options: classifier, number_of_classes, solver and n_jobs as in search
+    :return: list of results sorted by rank as in search
+    """
+    generator = numpy.random.default_rng(seed)
+
+    def sample(low: float, high: float, size: int = None):
+        return numpy.exp(generator.uniform(numpy.log(low), numpy.log(high), size))
+
+    configurations = []
+    for kernel_type, bounds in ranges.items():
+        for iteration in range(iterations):
+            params = [float(sample(low, high)) for low, high in bounds]
+            configurations.append((kernel_type, params, sample(*c_range, c_per_params).tolist()))
+    return search(X, Y, X_validation, Y_validation, configurations, **options)
+
+
+def format_results(results: list, limit: int = None) -> str:
+    """
+    Formats the results of the search as a table
+    :param results: list of results returned by search
+    :param limit: maximum number of rows, all rows if it is None
+    :return: text of the table
+    """
+    lines = ['{:>4} {:<12} {:<20} {:>10} {:>8} {:>10} {:>10} {:>10}'.format(
+        'rank', 'kernel', 'params', 'c', 'accuracy', 'kernel, s', 'train, s', 'predict, s')]
+    for result in results[:limit]:
+        lines.append('{:>4} {:<12} {:<20} {:>10.4g} {:>8.4f} {:>10.4f} {:>10.4f} {:>10.4f}'.format(
+            result['rank'], result['kernel_type'], ', '.join('{:.4g}'.format(p) for p in result['params']),
+            result['c'], result['accuracy'], result['kernel_time'], result['train_time'], result['predict_time']))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    from dataset import load_dataset
+
+    training, validation = load_dataset().split(55)
+    print(format_results(grid_search(training.X, training.Y, validation.X, validation.Y,
+                                     {GAUSSIAN: [[0.5], [1], [2], [4]], LAPLICAN: [[1], [2], [4]]},
+                                     [1, 10, 100, 1000], number_of_classes=40)))
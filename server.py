@@ -0,0 +1,281 @@
+"""
+This file implements the local prediction service. The model is loaded once, concurrent requests are gathered into
+micro-batches within a latency window and every batch is classified by predict_batch, that is with one kernel matrix
+evaluation per internal svm instead of a Python loop over the support vectors for every request. predict_batch runs in
+a worker thread, so the event loop keeps reading requests, which form the next batch, while a batch is classified.
+
+Protocol: every request is one line of JSON. {"x": [features]} is answered with {"class": number}, {"stats": true}
+with the counters of the server (see PredictionServer.statistics), a wrong request with {"error": message}.
+Answers are written in the order of requests, so a client may send many requests without waiting.
+
+Usage: python server.py model.bin [--unix path | --host 127.0.0.1 --port 8765] [--window 0.002] [--max-batch 64]
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+
+import numpy
+
+import instrumentation
+import model_file
+
+DEFAULT_WINDOW = 0.002
+DEFAULT_MAX_BATCH = 64
+
+#  Number of the latest requests the latency percentiles are computed from
+LATENCY_SAMPLES = 10000
+
+
+class PredictionServer:
+    """
+    This class gathers requests into micro-batches and serves them over a Unix or TCP socket. A batch is classified
+    when it has max_batch requests or when window seconds have passed since the first of them arrived.
+    """
+
+    def __init__(self, model, window: float = DEFAULT_WINDOW, max_batch: int = DEFAULT_MAX_BATCH):
+        """
+        Constructor. Assigns the initial values to the fields of the class.
+        :param model: trained classifier with predict_batch method or path of the model file (see model_file)
+        :param window: maximum time in seconds the first request of a batch waits for the others
+        :param max_batch: maximum number of requests in a batch
+        :except ValueError: raises if params has wrong values
+        """
+        if window < 0:
+            raise ValueError("Window should not be negative")
+        if max_batch < 1:
+            raise ValueError("Batch should contain at least one request")
+        self.model = model_file.load_model(model) if isinstance(model, str) else model
+        self.window = window
+        self.max_batch = max_batch
+        self.counters = {'requests': 0, 'classified': 0, 'errors': 0, 'batches': 0}
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.started = time.perf_counter()
+        self.__pending = []
+        self.__arrived = asyncio.Event()
+        self.__full = asyncio.Event()
+        self.__batcher = None
+        self.__classifying = []
+        self.__connections = {}
+
+    async def start(self, path: str = None, host: str = '127.0.0.1', port: int = 0):
+        """
+        Starts serving
+        :param path: path of the Unix socket. If it is None the TCP socket is opened.
+        :param host: host of the TCP socket
+        :param port: port of the TCP socket, 0 means any free port
+        :return: asyncio server, its sockets field contains the address
+        """
+        self.started = time.perf_counter()
+        self.__batcher = asyncio.ensure_future(self.__run_batches())
+        if path is not None:
+            return await asyncio.start_unix_server(self.__handle, path)
+        return await asyncio.start_server(self.__handle, host, port)
+
+    async def stop(self) -> None:
+        """
+        Closes the open connections and stops classifying batches. Requests waiting for a batch fail.
+        :return: None
+        """
+        for writer in self.__connections.values():
+            writer.close()
+        await asyncio.gather(*self.__connections, return_exceptions=True)
+        if self.__batcher is not None:
+            self.__batcher.cancel()
+            try:
+                await self.__batcher
+            except asyncio.CancelledError:
+                pass
+            self.__batcher = None
+        for vector, start, future in self.__classifying + self.__pending:
+            if not future.done():
+                future.set_exception(ConnectionAbortedError("Server is stopped"))
+        self.__classifying = []
+        self.__pending = []
+
+    async def predict(self, x) -> int:
+        """
+        Classifies the sample together with the other requests of its batch
+        :param x: input sample
+        :return: class number to which the sample belongs
+        :except ValueError: the sample is not a vector of numbers or the model can not classify it. Other exceptions
+        of the model are raised as they are.
+        """
+        vector = numpy.asarray(x, dtype=numpy.float64)
+        if vector.ndim != 1 or not len(vector):
+            raise ValueError("Request should contain one vector")
+        future = asyncio.get_running_loop().create_future()
+        self.__pending.append((vector, time.perf_counter(), future))
+        self.__arrived.set()
+        if len(self.__pending) >= self.max_batch:
+            self.__full.set()
+        return await future
+
+    def statistics(self) -> dict:
+        """
+        Returns the counters of the server
+        :return: dictionary with the numbers of requests (statistics requests are not counted), classified requests,
+        answers with errors and batches, mean_batch
+        (classified requests per batch), throughput (classified requests per second since the start) and the
+        percentiles p50 and p99 of the latency from the arrival of a request to its classification in seconds, None
+        before the first classified request
+        """
+        classified, batches = self.counters['classified'], self.counters['batches']
+        uptime = time.perf_counter() - self.started
+        p50, p99 = numpy.percentile(self.latencies, [50, 99]).tolist() if self.latencies else (None, None)
+        return dict(self.counters, mean_batch=classified / batches if batches else 0.,
+                    throughput=classified / uptime if uptime > 0 else 0., p50=p50, p99=p99)
+
+    async def __run_batches(self) -> None:
+        """
+        Private method classifying the gathered requests until the server is stopped
+        :return: None
+        """
+        while True:
+            await self.__arrived.wait()
+            if len(self.__pending) < self.max_batch and self.window > 0:
+                try:
+                    await asyncio.wait_for(self.__full.wait(), self.window)
+                except asyncio.TimeoutError:
+                    pass
+            batch = self.__pending[:self.max_batch]
+            del self.__pending[:self.max_batch]
+            if not self.__pending:
+                self.__arrived.clear()
+            if len(self.__pending) < self.max_batch:
+                self.__full.clear()
+            self.__classifying = batch
+            await self.__classify(batch)
+            self.__classifying = []
+
+    async def __classify(self, batch: list) -> None:
+        """
+        Private method classifying the batch in a worker thread and resolving the futures of its requests. Vectors of
+        different sizes are classified separately, so a wrong request does not fail the others. Any exception of the
+        model is passed to the requests of its group, the batcher itself never fails.
+        :param batch: list of triples (vector, arrival time, future)
+        :return: None
+        """
+        loop = asyncio.get_running_loop()
+        groups = {}
+        for request in batch:
+            groups.setdefault(len(request[0]), []).append(request)
+        for group in groups.values():
+            try:
+                with instrumentation.stage('server.batch'):
+                    vectors = numpy.stack([vector for vector, start, future in group])
+                    classes = await loop.run_in_executor(None, self.model.predict_batch, vectors)
+            except Exception as error:
+                for vector, start, future in group:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            end = time.perf_counter()
+            self.counters['batches'] += 1
+            self.counters['classified'] += len(group)
+            instrumentation.count('server.batch', 'samples', len(group))
+            for (vector, start, future), value in zip(group, classes):
+                self.latencies.append(end - start)
+                if not future.done():
+                    future.set_result(int(value))
+
+    async def __answer(self, line: bytes) -> dict:
+        """
+        Private method answering one request of the protocol. Every request except the statistics one is counted
+        here, and every answer with an error is counted as an error.
+        :param line: line of JSON
+        :return: answer
+        """
+        try:
+            request = json.loads(line)
+        except ValueError:
+            request = None
+        if isinstance(request, dict) and 'x' not in request and request.get('stats'):
+            return self.statistics()
+        self.counters['requests'] += 1
+        try:
+            if not isinstance(request, dict) or 'x' not in request:
+                raise ValueError("Request should be a JSON object with x or stats")
+            return {'class': await self.predict(request['x'])}
+        except Exception as error:
+            self.counters['errors'] += 1
+            return {'error': str(error)}
+
+    async def __handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Private method serving one connection. Requests are answered concurrently, so the requests of one connection
+        get into the same batch, and the answers are written in the order of requests.
+        :param reader: stream of requests
+        :param writer: stream of answers
+        :return: None
+        """
+        answers = asyncio.Queue()
+
+        async def respond():
+            while True:
+                answer = await answers.get()
+                if answer is None:
+                    return
+                writer.write(json.dumps(await answer).encode('utf-8') + b'\n')
+                await writer.drain()
+
+        responder = asyncio.ensure_future(respond())
+        connection = asyncio.current_task()
+        self.__connections[connection] = writer
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    answers.put_nowait(asyncio.ensure_future(self.__answer(line)))
+        except (ConnectionError, ValueError):
+            #  ValueError is raised for a line longer than the limit of the stream, the connection is closed then
+            pass
+        finally:
+            answers.put_nowait(None)
+            try:
+                await responder
+            except ConnectionError:
+                pass
+            writer.close()
+            del self.__connections[connection]
+
+
+async def serve(model, path: str = None, host: str = '127.0.0.1', port: int = 8765, window: float = DEFAULT_WINDOW,
+                max_batch: int = DEFAULT_MAX_BATCH) -> None:
+    """
+    Serves the model until the task is cancelled
+    :param model: trained classifier or path of the model file
+    :param path: path of the Unix socket. If it is None the TCP socket is opened.
+    :param host: host of the TCP socket
+    :param port: port of the TCP socket
+    :param window: maximum time in seconds the first request of a batch waits for the others
+    :param max_batch: maximum number of requests in a batch
+    :return: None
+    """
+    server = PredictionServer(model, window, max_batch)
+    listener = await server.start(path, host, port)
+    print('Serving on {}'.format(', '.join(str(element.getsockname()) for element in listener.sockets)))
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await server.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Prediction server of a saved model")
+    parser.add_argument('model', help="model file written by model_file.save_model")
+    parser.add_argument('--unix', help="path of the Unix socket, otherwise TCP is used")
+    parser.add_argument('--host', default='127.0.0.1', help="host of the TCP socket")
+    parser.add_argument('--port', type=int, default=8765, help="port of the TCP socket")
+    parser.add_argument('--window', type=float, default=DEFAULT_WINDOW, help="latency window of a batch in seconds")
+    parser.add_argument('--max-batch', type=int, default=DEFAULT_MAX_BATCH, help="maximum requests in a batch")
+    options = parser.parse_args()
+    try:
+        asyncio.run(serve(options.model, options.unix, options.host, options.port, options.window,
+                          options.max_batch))
+    except KeyboardInterrupt:
+        pass
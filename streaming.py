@@ -0,0 +1,167 @@
+"""
+This file implements classification of an ECG stream. Samples are consumed in chunks, R-peaks and heartbeat templates
+are detected on a sliding window and only running statistics of them are kept, so memory and the time spent on every
+chunk do not grow with the length of the signal.
+"""
+import numpy
+
+import features
+from utility import RunningStatistics
+
+
+def biosppy_detector(signal: numpy.ndarray, sampling_rate: float) -> tuple:
+    """
+    Detects R-peaks and extracts heartbeat templates with biosppy, the same way as data_predprocessor does
+    :param signal: samples of one channel
+    :param sampling_rate: sampling rate of the signal
+    :return: positions of R-peaks in the signal and matrix of templates, one row for each R-peak
+    """
+    #  Imported here, so the stream may be used with other detectors when biosppy is not installed
+    import biosppy
+    result = biosppy.ecg.ecg(signal=signal, sampling_rate=sampling_rate, show=False)
+    return numpy.asarray(result[2]), numpy.asarray(result[4])
+
+
+class StreamingClassifier:
+    """
+    This class classifies an ECG stream with a trained classifier every beats_per_window beats. The feature vector has
+    the same layout as features.extract_features builds, but it is calculated from running statistics of all beats
+    seen so far: the R-R distance is averaged over leads by their expected values and the heart rate is calculated
+    from R-R distances of the first lead.
+    """
+
+    def __init__(self, machine, sampling_rate: float, channels: int, beats_per_window: int = 10,
+                 buffer_seconds: float = 10., hop_seconds: float = 1., margin_seconds: float = 1.,
+                 detector=biosppy_detector):
+        """
+        Constructor. Assigns the initial values to the fields of the class.
+        :param machine: trained classifier which has predict_batch method (SVM, OVR or PairwiseClassifier)
+        :param sampling_rate: sampling rate of the stream
+        :param channels: number of channels (leads) of the stream
+        :param beats_per_window: number of beats of the first lead between two classifications
+        :param buffer_seconds: length of the sliding window which is passed to the detector
+        :param hop_seconds: detection runs when at least this number of seconds is received after the previous one
+        :param margin_seconds: beats closer than the margin to the end of the window are not accepted yet, because
+        the filter of the detector and the template need samples after the R-peak
+        :param detector: function (signal, sampling_rate) -> (R-peak positions, templates)
+        """
+        if hop_seconds + 2 * margin_seconds > buffer_seconds:
+            raise ValueError("The buffer should be longer than the hop and two margins")
+        self.machine = machine
+        self.sampling_rate = sampling_rate
+        self.channels = channels
+        self.beats_per_window = beats_per_window
+        self.buffer_size = int(buffer_seconds * sampling_rate)
+        self.hop = int(hop_seconds * sampling_rate)
+        self.margin = int(margin_seconds * sampling_rate)
+        self.refractory = int(0.2 * sampling_rate)
+        self.detector = detector
+        self.buffer = numpy.zeros((0, channels))
+        self.received = 0
+        self.detected = 0
+        self.last_peaks = [None] * channels
+        self.template_sums = [None] * channels
+        self.template_counts = numpy.zeros(channels, dtype=numpy.int64)
+        self.distances = [RunningStatistics() for channel in range(channels)]
+        self.peak_times = [RunningStatistics() for channel in range(channels)]
+        self.heart_rate = RunningStatistics()
+        self.beats = 0
+        self.next_classification = beats_per_window
+
+    def __accept(self, channel: int, position: int, template: numpy.ndarray) -> None:
+        """
+        Private method updating statistics with a new beat
+        :param channel: channel number
+        :param position: position of the R-peak from the beginning of the stream
+        :param template: heartbeat template
+        :return: None
+        """
+        last = self.last_peaks[channel]
+        if last is not None:
+            self.distances[channel].add(position - last)
+            if channel == 0:
+                self.heart_rate.add(60. * self.sampling_rate / (position - last))
+        self.last_peaks[channel] = position
+        self.peak_times[channel].add(position / self.sampling_rate)
+        if self.template_sums[channel] is None:
+            self.template_sums[channel] = numpy.zeros(len(template))
+        self.template_sums[channel] += template
+        self.template_counts[channel] += 1
+        if channel == 0:
+            self.beats += 1
+
+    def __detect(self) -> None:
+        """
+        Private method running the detector on the window and accepting the beats which were not accepted before
+        :return: None
+        """
+        start = self.received - len(self.buffer)
+        limit = self.received - self.margin
+        for channel in range(self.channels):
+            rpeaks, templates = self.detector(self.buffer[:, channel], self.sampling_rate)
+            for position, template in zip(numpy.asarray(rpeaks, dtype=numpy.int64) + start, templates):
+                last = self.last_peaks[channel]
+                if position > limit or (last is not None and position <= last + self.refractory):
+                    continue
+                self.__accept(channel, int(position), numpy.asarray(template, dtype=numpy.float64))
+        self.detected = self.received
+
+    def feature_vector(self) -> numpy.ndarray:
+        """
+        Builds the feature vector from the statistics of all accepted beats
+        :return: feature vector, None if the first lead has no beats yet
+        """
+        if not self.template_counts[0] or any(element is None for element in self.template_sums):
+            return None
+        #  Every lead is divided by the number of templates of the first lead as in features.extract_features
+        y = sum(self.template_sums) / self.template_counts[0] / self.channels
+        peaks = features.template_peaks(y[numpy.newaxis, :])[0]
+        distance_ev = numpy.mean([statistics.ev for statistics in self.distances])
+        r_peaks = [value for statistics in self.peak_times for value in (statistics.ev, statistics.dispersion)]
+        rate = self.heart_rate
+        return numpy.concatenate([peaks, [distance_ev, rate.dispersion], r_peaks, [rate.ev, rate.dispersion]])
+
+    def update(self, chunk) -> list:
+        """
+        Consumes the next chunk of samples. A chunk of any length is split where the next detection is due, so every
+        detection sees at most hop new samples and no beat falls out of the window before it is detected.
+        :param chunk: matrix samples x channels (a vector for one channel)
+        :return: list of classes found after this chunk, usually empty or containing one class
+        """
+        chunk = numpy.asarray(chunk, dtype=numpy.float64).reshape(-1, self.channels)
+        results = []
+        start = 0
+        while start < len(chunk):
+            size = max(self.hop - (self.received - self.detected), 1)
+            results += self.__consume(chunk[start:start + size])
+            start += size
+        return results
+
+    def __consume(self, chunk: numpy.ndarray) -> list:
+        """
+        Private method consuming the part of a chunk which is not longer than the samples left until the detection
+        :param chunk: matrix samples x channels
+        :return: list of classes found after this part
+        """
+        self.buffer = numpy.concatenate([self.buffer, chunk])[-self.buffer_size:]
+        self.received += len(chunk)
+        if self.received - self.detected < self.hop:
+            return []
+        self.__detect()
+        if self.beats < self.next_classification:
+            return []
+        self.next_classification = (self.beats // self.beats_per_window + 1) * self.beats_per_window
+        vector = self.feature_vector()
+        if vector is None:
+            return []
+        return [int(self.machine.predict_batch([vector])[0])]
+
+    def run(self, chunks):
+        """
+        Classifies the stream
+        :param chunks: iterable of chunks of samples, for example a generator reading a device
+        :return: generator of pairs (number of beats, class)
+        """
+        for chunk in chunks:
+            for result in self.update(chunk):
+                yield self.beats, result
@@ -5,13 +5,20 @@ from math import exp
 from typing import TypeVar
 
 import matplotlib.pyplot as plt
+import numpy
 
+import instrumentation
 import utility
 
 import minimization
+from approximation import DEFAULT_COMPONENTS, LINEAR_FEATURES, FeatureMap, feature_map
+from kernel_cache import KernelCache, DEFAULT_BUDGET
 
 from kernels import *
 
+#  Number of samples predicted with one kernel matrix evaluation. Bounds the memory used by batch prediction.
+BATCH_SIZE = 1024
+
 
 class SVM:
     """
@@ -21,6 +28,9 @@ class SVM:
     kernel_types = {"linear": linear_kernel, "polynomial": polynomial_kernel, "gaussian": gaussian_kernel,
                     "exponential": exponential_kernel, "laplacian": laplacian_kernel}
 
+    #  Alphas not greater than support_tolerance * c are treated as zero
+    support_tolerance = 1e-8
+
     def __init__(self):
         """
         SVM constructor.
@@ -30,13 +40,58 @@ class SVM:
         self.Y = None
         self.b = 0
         self.params = None
+        self.kernel_type = None
         self.kernel = lambda *p: exec('raise ValueError("No kernel is defined")')
         self.c = None
         self.matrix = []
-        self.C = []
+        self.cache = None
         self.results = []
+        self.support = numpy.zeros(0, dtype=numpy.int64)
+        self.support_vectors = numpy.zeros((0, 0))
+        self.dual_coef = numpy.zeros(0)
+        self.iterations = 0
+        self.feature_map = None
+        self.weights = None
+        self.dtype = numpy.dtype(numpy.float64)
+
+    @property
+    def C(self) -> list:
+        """
+        Matrix Y_i * Y_j * K(X_i, X_j) of the training set. It is not stored and is built from the kernel cache.
+        """
+        if self.cache is None:
+            return []
+        return self.cache.matrix().tolist()
+
+    @property
+    def n_support(self) -> int:
+        """
+        Number of support vectors of the trained model
+        """
+        return len(self.support)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Memory used by the arrays of the trained model which are needed for prediction
+        """
+        result = self.support_vectors.nbytes + self.dual_coef.nbytes
+        if self.feature_map is not None:
+            result += self.weights.nbytes + self.feature_map.nbytes
+        return result
 
-    def train(self, kernel_type: str, params: list, X: list, Y: list, c: float):
+    @property
+    def support_ratio(self) -> float:
+        """
+        Share of the training samples which became support vectors
+        """
+        return self.n_support / len(self.results) if len(self.results) else 0.
+
+    @instrumentation.timed('svm.train', profile=True)
+    def train(self, kernel_type: str, params: list, X: list, Y: list, c: float, solver: str = minimization.QUADPROG,
+              cache_size: int = DEFAULT_BUDGET, cache: KernelCache = None, initial: numpy.ndarray = None,
+              approximation=None, n_components: int = DEFAULT_COMPONENTS, seed: int = None, dtype=numpy.float64,
+              features: numpy.ndarray = None):
         """
         This method builds svm and must be called before using the class
         :param kernel_type: name of kernel type. The constants defined in svm namespace must be used.
@@ -44,14 +99,36 @@ class SVM:
         :param X: input vectors set
         :param Y: output values set. Should contains only 1 for positive class and -1 for negative class
         :param c: param for svm
+        :param solver: name of the quadratic problem solver. The constants defined in minimization namespace must be
+        used. SMO computes kernel rows on demand and does not build the whole matrix. COORDINATE_DESCENT works with
+        the linear kernel or an approximation only: the linear svm is trained in the primal space as one weight vector
+        and predicts with one dot product.
+        :param cache_size: memory budget of the kernel rows cache in bytes
+        :param cache: kernel cache built for the same kernel, params and X which is shared with other svm.
+        The cached rows are reused and are not released after the training. cache_size is ignored in this case.
+        :param initial: alphas to start from, for example results of the svm trained with a close c or on the first
+        samples of X (a shorter vector is padded with zeros). Supported by SMO, COORDINATE_DESCENT and approximated
+        training, QUADPROG raises ValueError. The bias is not a variable of the dual problem, so it is always found
+        from the new solution.
+        :param approximation: name of the kernel approximation (the constants defined in approximation namespace) or
+        a fitted approximation.FeatureMap. The input vectors are mapped into its feature space and the problem is
+        solved there by coordinate descent, so neither the kernel matrix nor the support vectors are kept. solver,
+        cache_size and cache are ignored in this case.
+        :param n_components: dimension of the feature space of the approximation
+        :param seed: seed of the random generator of the approximation and of the solver
+        :param features: X already mapped by the given fitted approximation, which is shared with other svm trained
+        on the same X. X is transformed here if it is None.
+        :param dtype: float type of kernel rows, support vectors and prediction, one of kernels.FLOAT_TYPES. The
+        solvers work in float64 anyway. The float type of the given cache is used instead. Approximated kernels are
+        always float64.
         :except AssertionError: raises if params has wrong type
         :except ValueError: raises if params has wrong values
         :return: SVM after training
         """
-        assert X, list
+        assert len(X), list
         for x in X:
-            assert x, list
-        assert Y, list
+            assert len(x), list
+        assert len(Y), list
         for y in Y:
             assert y, list
         if len(X) != len(Y):
@@ -59,32 +136,216 @@ class SVM:
         for res in Y:
             if res != 1 and res != -1:
                 raise ValueError("Y should contains only 1 and -1")
+        if numpy.dtype(dtype) not in FLOAT_TYPES:
+            raise ValueError("Unsupported float type {}".format(numpy.dtype(dtype)))
         self.X = X
         self.Y = Y
         self.params = params
+        self.kernel_type = kernel_type
         self.kernel = SVM.kernel_types[kernel_type]
-        for i in range(len(self.X)):
-            equation = []
-            for j in range(len(self.X)):
-                data = self.Y[i] * self.Y[j] * self.kernel(self.X[i], self.X[j], *self.params)
-                equation.append(data)
-            self.C.append(equation)
         self.c = c
-        self.results = minimization.minimize(self.C, len(self.X), self.Y, self.c)
-        self.__find_b()
+        self.feature_map = None
+        self.weights = None
+        self.dtype = numpy.dtype(numpy.float64)
+        if approximation is not None:
+            return self.__train_approximated(approximation, n_components, seed, initial, features)
+        if solver == minimization.COORDINATE_DESCENT:
+            if kernel_type != LINEAR:
+                raise ValueError("{} solver requires the linear kernel or an approximation".format(solver))
+            return self.__train_approximated(LINEAR_FEATURES, n_components, seed, initial)
+        self.dtype = numpy.dtype(dtype if cache is None else cache.dtype)
+        if cache is None:
+            self.cache = KernelCache(kernel_type, self.params, self.X, self.Y, cache_size, self.dtype)
+        elif cache.kernel_type != kernel_type or list(cache.params) != list(params) or len(cache) != len(X):
+            raise ValueError("The cache is built for another kernel or input vectors set")
+        else:
+            self.cache = cache.relabel(self.Y)
+        if solver == minimization.QUADPROG:
+            if initial is not None:
+                raise ValueError("Starting point is not supported by {} solver".format(minimization.QUADPROG))
+            self.results, self.iterations = minimization.minimize(self.cache.matrix(), len(self.X), self.Y, self.c,
+                                                                  full_output=True)
+        elif solver == minimization.SMO:
+            self.results, self.iterations = minimization.minimize_smo(self.cache.row, self.cache.diagonal(), self.Y,
+                                                                      self.c, initial=initial, full_output=True)
+        else:
+            raise ValueError("Unknown solver {}".format(solver))
+        self.__find_support()
+        with instrumentation.stage('svm.find_b'):
+            self.__find_b()
+        self.__compact(release=cache is None)
         return self
 
+    def restore(self, kernel_type: str, params: list, X: list, Y: list, c: float, results: numpy.ndarray,
+                b: float, iterations: int = 0, dtype=numpy.float64) -> 'SVM':
+        """
+        This method restores svm from the solution of the dual problem found elsewhere, for example in another process.
+        :param kernel_type: name of kernel type. The constants defined in svm namespace must be used.
+        :param params: params for kernel
+        :param X: input vectors set
+        :param Y: output values set. Should contains only 1 for positive class and -1 for negative class
+        :param c: param for svm
+        :param results: alphas found for X and Y
+        :param b: bias coefficient
+        :param iterations: number of iterations the solver made
+        :param dtype: float type of support vectors and prediction
+        :return: SVM ready for prediction
+        """
+        self.X = X
+        self.Y = Y
+        self.params = params
+        self.kernel_type = kernel_type
+        self.kernel = SVM.kernel_types[kernel_type]
+        self.c = c
+        self.cache = None
+        self.results = numpy.asarray(results, dtype=numpy.float64)
+        self.b = b
+        self.iterations = iterations
+        self.feature_map = None
+        self.weights = None
+        self.dtype = numpy.dtype(dtype)
+        self.__find_support()
+        self.__compact(release=False)
+        return self
+
+    def __train_approximated(self, approximation, n_components: int, seed: int, initial: numpy.ndarray,
+                             features: numpy.ndarray = None) -> 'SVM':
+        """
+        Private method training svm in the feature space of the kernel approximation
+        :param approximation: name of the approximation or fitted approximation.FeatureMap
+        :param n_components: dimension of the feature space
+        :param seed: seed of the random generators
+        :param initial: alphas to start from
+        :param features: X mapped by the approximation, None if it should be transformed here
+        :return: SVM after training
+        """
+        if not isinstance(approximation, FeatureMap):
+            approximation = feature_map(approximation, self.kernel_type, self.params, n_components, seed).fit(self.X)
+            features = None
+        self.feature_map = approximation
+        self.cache = None
+        if features is None:
+            features = approximation.transform(self.X)
+        #  The constant feature makes the bias a part of the weights
+        Z = numpy.column_stack([features, numpy.ones(len(features))])
+        labels = numpy.asarray(self.Y, dtype=numpy.float64)
+        self.results, self.iterations = minimization.minimize_coordinate_descent(
+            Z, labels, self.c, seed=0 if seed is None else seed, initial=initial, full_output=True)
+        weights = numpy.dot(Z.T, self.results * labels)
+        self.weights, self.b = weights[:-1], float(weights[-1])
+        self.__find_support()
+        #  Prediction uses the weights only
+        self.dual_coef = numpy.zeros(0)
+        self.support_vectors = numpy.zeros((0, 0))
+        return self
+
+    def partial_fit(self, X: list, Y: list, budget: int = None, cache_size: int = DEFAULT_BUDGET) -> 'SVM':
+        """
+        This method updates the trained svm with new samples without solving the whole problem again. The samples
+        which are not support vectors are forgotten, the new samples are added to the support vectors and SMO starts
+        from the current alphas, so it only fixes the conditions the new samples violate.
+        :param X: new input vectors
+        :param Y: output values of the new vectors. Should contains only 1 and -1
+        :param budget: maximum number of support vectors. If there are more of them, the ones with the smallest alphas
+        are forgotten and the rest are trained again. None means no limit.
+        :param cache_size: memory budget of the kernel rows cache in bytes
+        :except ValueError: raises if svm is not trained or params has wrong values
+        :return: SVM after training
+        """
+        if self.kernel_type is None:
+            raise ValueError("SVM should be trained before partial_fit")
+        if self.feature_map is not None:
+            raise ValueError("partial_fit is not supported for approximated kernels")
+        X = as_matrix(X)
+        if len(X) != len(Y):
+            raise ValueError("X and Y should be the same size")
+        points = numpy.concatenate([self.support_vectors, X]) if len(self.support) else X
+        labels = numpy.concatenate([numpy.asarray(self.Y, dtype=numpy.float64)[self.support],
+                                    numpy.asarray(Y, dtype=numpy.float64)])
+        return self.__refit(points, labels, self.results[self.support], budget, cache_size)
+
+    def remove(self, X: list, budget: int = None, cache_size: int = DEFAULT_BUDGET) -> 'SVM':
+        """
+        This method retires samples from the trained svm. The rest of the samples start from their current alphas.
+        :param X: input vectors to remove. Every sample of the X field equal to one of them is removed.
+        :param budget: maximum number of support vectors as in partial_fit
+        :param cache_size: memory budget of the kernel rows cache in bytes
+        :except ValueError: raises if svm is not trained
+        :return: SVM after training
+        """
+        if self.kernel_type is None:
+            raise ValueError("SVM should be trained before remove")
+        if self.feature_map is not None:
+            raise ValueError("remove is not supported for approximated kernels")
+        points = as_matrix(self.X)
+        keep = numpy.ones(len(points), dtype=bool)
+        for vector in as_matrix(X):
+            keep &= ~numpy.all(points == vector, axis=1)
+        return self.__refit(points[keep], numpy.asarray(self.Y, dtype=numpy.float64)[keep], self.results[keep],
+                            budget, cache_size)
+
+    def __refit(self, points: numpy.ndarray, labels: numpy.ndarray, initial: numpy.ndarray, budget: int,
+                cache_size: int) -> 'SVM':
+        """
+        Private method training svm with SMO from the given alphas and keeping at most budget support vectors
+        :param points: input vectors of the new problem
+        :param labels: output values of the new problem
+        :param initial: alphas of the first samples
+        :param budget: maximum number of support vectors, None means no limit
+        :param cache_size: memory budget of the kernel rows cache in bytes
+        :return: SVM after training
+        """
+        self.train(self.kernel_type, self.params, points, labels, self.c, solver=minimization.SMO,
+                   cache_size=cache_size, initial=initial, dtype=self.dtype)
+        if budget is not None and self.n_support > budget:
+            iterations = self.iterations
+            #  Vectors on the margin define the hyperplane, the ones far inside the margin or on the wrong side of the
+            #  hyperplane are forgotten first
+            signs = numpy.asarray(self.Y, dtype=numpy.float64)[self.support]
+            margins = numpy.abs(signs * self.decision_function_batch(self.support_vectors) - 1)
+            keep = numpy.sort(self.support[numpy.argsort(margins, kind='stable')[:budget]])
+            self.train(self.kernel_type, self.params, points[keep], labels[keep], self.c, solver=minimization.SMO,
+                       cache_size=cache_size, initial=self.results[keep], dtype=self.dtype)
+            self.iterations += iterations
+        return self
+
+    def __find_support(self) -> None:
+        """
+        Private method finding the indexes of the support vectors
+        :return: None
+        """
+        self.support = numpy.flatnonzero(self.results > self.support_tolerance * self.c)
+        instrumentation.count('svm.train', 'support_vectors', len(self.support))
+
     def __find_b(self) -> None:
         """
-        Private method finding the bias coefficient
+        Private method finding the bias coefficient. Uses a support vector strictly inside the box if there is one,
+        because only such vectors lie exactly on the margin.
+        :return: None
+        """
+        free = self.support[self.results[self.support] < self.c * (1 - self.support_tolerance)]
+        if len(free):
+            m = free[0]
+        elif len(self.support):
+            m = self.support[0]
+        else:
+            m = len(self.results) - 1
+        #  Row m of the cached matrix already contains Y_m * Y_i * K(X_i, X_m)
+        self.b = 1 / self.Y[m] - self.Y[m] * numpy.dot(self.results, self.cache.row(m))
+
+    def __compact(self, release: bool) -> None:
+        """
+        Private method keeping only the support vectors and their coefficients alpha * y in contiguous arrays of the
+        float type of svm, so the prediction cost depends on the number of support vectors only.
+        :param release: whether the cached kernel rows should be released
         :return: None
         """
-        for m, alpha in enumerate(self.results):
-            if alpha != 0:
-                break
-        self.b = 1 / self.Y[m]
-        for i in range(len(self.results)):
-            self.b -= self.results[i] * self.Y[i] * self.kernel(self.X[i], self.X[m], *self.params)
+        points = as_matrix(self.X, self.dtype) if self.cache is None else self.cache.points
+        self.support_vectors = numpy.ascontiguousarray(points[self.support])
+        self.dual_coef = (self.results[self.support] * numpy.asarray(self.Y, dtype=numpy.float64)[self.support]).astype(
+            self.dtype)
+        if release:
+            self.cache.clear()
 
     def classify(self, vector: list) -> int:
         """
@@ -92,9 +353,7 @@ class SVM:
         :param vector: input sample
         :return: 1 if sample belongs to positive class, 0 if sample belongs to negative class
         """
-        result = 0
-        for i in range(len(self.results)):
-            result += self.results[i] * self.Y[i] * self.kernel(self.X[i], vector, *self.params) + self.b
+        result = self.get_distance(vector)
         if result < 0:
             return -1
         return 1
@@ -105,11 +364,59 @@ class SVM:
         :param vector: input sample
         :return: distance from the point to the reference hyperplane
         """
-        result = 0
-        for i in range(len(self.results)):
-            result += self.results[i] * self.Y[i] * self.kernel(self.X[i], vector, *self.params) + self.b
+        if self.feature_map is not None:
+            return float(numpy.dot(self.feature_map.transform(vector)[0], self.weights) + self.b)
+        return float(numpy.dot(self.dual_coef, kernel_matrix(self.kernel_type, self.support_vectors, vector,
+                                                             self.params, self.dtype)) + self.b)
+
+    @instrumentation.timed('svm.predict')
+    def decision_function_batch(self, X, batch_size: int = BATCH_SIZE) -> numpy.ndarray:
+        """
+        This method calculates the distances from many points to the reference hyperplane. The samples are processed
+        in chunks of batch_size, every chunk with one kernel matrix evaluation.
+        :param X: matrix of input samples
+        :param batch_size: number of samples in one chunk
+        :return: vector of distances
+        """
+        X = as_matrix(X, self.dtype)
+        instrumentation.count('svm.predict', 'samples', len(X))
+        result = numpy.empty(len(X))
+        for start in range(0, len(X), batch_size):
+            chunk = X[start:start + batch_size]
+            if self.feature_map is not None:
+                result[start:start + batch_size] = numpy.dot(self.feature_map.transform(chunk), self.weights) + self.b
+                continue
+            result[start:start + batch_size] = numpy.dot(
+                kernel_matrix(self.kernel_type, chunk, self.support_vectors, self.params, self.dtype),
+                self.dual_coef) + self.b
         return result
 
+    def decision_function_precomputed(self, K) -> numpy.ndarray:
+        """
+        This method calculates the distances from many points to the reference hyperplane with the kernel values
+        computed elsewhere, for example once for many trained svm.
+        :param K: matrix samples x training samples of kernel values K(x, X_j) for all input vectors of the training
+        :return: vector of distances
+        """
+        return numpy.dot(numpy.asarray(K)[:, self.support], self.dual_coef) + self.b
+
+    def predict_precomputed(self, K) -> numpy.ndarray:
+        """
+        The method classifies many input samples with the kernel values computed elsewhere
+        :param K: matrix samples x training samples of kernel values K(x, X_j) for all input vectors of the training
+        :return: vector which contains 1 for samples of the positive class and -1 for samples of the negative class
+        """
+        return numpy.where(self.decision_function_precomputed(K) < 0, -1, 1)
+
+    def predict_batch(self, X, batch_size: int = BATCH_SIZE) -> numpy.ndarray:
+        """
+        The method classifies many input samples at once.
+        :param X: matrix of input samples
+        :param batch_size: number of samples in one chunk
+        :return: vector which contains 1 for samples of the positive class and -1 for samples of the negative class
+        """
+        return numpy.where(self.decision_function_batch(X, batch_size) < 0, -1, 1)
+
     def draw_plots(self) -> None:
         """
         Draws a graph on which the points are located. Works only for two-dimensional space.
@@ -1,5 +1,53 @@
+import asyncio
+import json
+import os
+import pickle
+import sys
+import tempfile
+import types
 import unittest
+from unittest import mock
+
+import numpy
+
+import approximation
+import benchmark
+import dataset
+import feature_store
+import features
+import instrumentation
+import kernels
+import minimization
+import model_file
+import ovr
+import pairwise
+import search
+import server
+import streaming
+from kernel_cache import KernelCache
 import svm
+import utility
+import validation
+
+
+def legacy_features(data):
+    y = [sum(i) / len(data[0]['templates']) for i in zip(*data[0]['templates'])]
+    for j in range(1, len(data)):
+        y = [y[n] + (sum(i) / len(data[0]['templates'])) for n, i in enumerate(zip(*data[j]['templates']))]
+    y = [i / len(data) for i in y]
+    temp = [abs(i) for i in y]
+    peaks = [value for i in list(sorted(temp))[-5:] for value in (y[temp.index(i)], temp.index(i))]
+    r_distance = [j - i for i, j in zip(data[0]['rpeaks'][:-1], data[0]['rpeaks'][1:])]
+    for k in range(1, len(data)):
+        r_distance = [(r_distance[n] if len(r_distance) > n else 0) + j - i for n, (i, j) in
+                      enumerate(zip(data[k]['rpeaks'][:-1], data[k]['rpeaks'][1:]))]
+    r_distance = [i / len(data) for i in r_distance]
+    distance_ev, distance_dispersion = utility.get_ev_and_dispersion(r_distance)
+    r_peaks = []
+    for k in range(len(data)):
+        r_peaks += utility.get_ev_and_dispersion([data[k]['ts'][i] for i in data[k]['rpeaks']])
+    rate_ev, distance_dispersion = utility.get_ev_and_dispersion(data[0]['heart_rate'])
+    return peaks + [distance_ev, distance_dispersion] + r_peaks + [rate_ev, distance_dispersion]
 
 
 class TestClass(unittest.TestCase):
@@ -18,6 +66,595 @@ class TestClass(unittest.TestCase):
         machine = svm.SVM().train(svm.POLYNOMIAL, [1, 1, 2], [[-1, -1], [1, 1]], [-1, 1], 1)
         self.assertEqual(machine.C, [[9, -1], [-1, 9]])
 
+    def test_kernel_matrices(self):
+        X = [[-1, -1], [-1, 1], [1, -1], [1, 1], [0.5, 2]]
+        Y = [[0, 1], [2, -1], [1, 1]]
+        for kernel_type, params in [(svm.LINEAR, [1]), (svm.POLYNOMIAL, [1, 0.5, 3]), (svm.GAUSSIAN, [2]),
+                                    (svm.EXPONENTIAL, [2]), (svm.LAPLICAN, [2])]:
+            scalar = svm.SVM.kernel_types[kernel_type]
+            expected = [[scalar(x, y, *params) for y in Y] for x in X]
+            numpy.testing.assert_allclose(kernels.kernel_matrix(kernel_type, X, Y, params), expected)
+            numpy.testing.assert_allclose(kernels.kernel_matrix(kernel_type, X, Y[0], params),
+                                          [row[0] for row in expected])
+            numpy.testing.assert_allclose(kernels.kernel_matrix(kernel_type, X, X, params),
+                                          [[scalar(x, y, *params) for y in X] for x in X])
+
+    def test_smo_matches_quadprog(self):
+        random = numpy.random.RandomState(0)
+        X = random.randn(40, 3).tolist()
+        Y = [1 if x[0] * x[1] > 0 else -1 for x in X]
+        for kernel_type, params in [(svm.GAUSSIAN, [1.5]), (svm.LAPLICAN, [2])]:
+            dense = svm.SVM().train(kernel_type, params, X, Y, 5)
+            smo = svm.SVM()
+            smo.train(kernel_type, params, X, Y, 5, solver=minimization.SMO)
+            numpy.testing.assert_allclose(smo.results, dense.results, atol=1e-2)
+            self.assertEqual([smo.classify(x) for x in X], [dense.classify(x) for x in X])
+
+    def test_quadprog_of_rank_deficient_kernel(self):
+        random = numpy.random.RandomState(3)
+        X = random.randn(60, 3)
+        Y = numpy.where(numpy.dot(X, [1, -1, 0.5]) > 0, 1, -1)
+        for kernel_type, params in [(svm.LINEAR, [1]), (svm.POLYNOMIAL, [1, 1, 2])]:
+            dense = svm.SVM().train(kernel_type, params, X, Y, 1)
+            smo = svm.SVM().train(kernel_type, params, X, Y, 1, solver=minimization.SMO)
+            numpy.testing.assert_allclose(dense.decision_function_batch(X), smo.decision_function_batch(X), atol=1e-2)
+        G = numpy.dot(X, X.T)
+        numpy.testing.assert_allclose(minimization.regularize(G), G, atol=1e-6)
+        identity = numpy.eye(3)
+        self.assertIs(minimization.regularize(identity), identity)
+
+    def test_quadprog_of_one_class(self):
+        #  quadprog finds the constraints of this problem inconsistent
+        X = numpy.random.RandomState(1).randn(5, 3)
+        machine = svm.SVM().train(svm.GAUSSIAN, [10], X, [-1] * 5, 1)
+        self.assertEqual((machine.n_support, machine.b), (0, -1))
+        self.assertEqual(machine.predict_batch(X).tolist(), [-1] * 5)
+        #  Class 3 has no samples, so its svm gets negative labels only
+        X = numpy.random.RandomState(1).randn(30, 3)
+        classes = [0, 1, 2] * 10
+        multi = ovr.OVR()
+        multi.train(4, svm.GAUSSIAN, [10], X, classes, 1)
+        self.assertEqual(multi.machine[3].n_support, 0)
+        numpy.testing.assert_array_equal(multi.decision_function_batch(X)[:, 3], -1)
+
+    def test_kernel_cache_eviction(self):
+        X = numpy.random.RandomState(0).randn(10, 2)
+        Y = [1, -1] * 5
+        cache = KernelCache(svm.GAUSSIAN, [1], X, Y, budget=3 * 10 * 8)
+        expected = numpy.outer(Y, Y) * kernels.kernel_matrix(svm.GAUSSIAN, X, X, [1])
+        for i in [0, 1, 2, 0, 3, 1]:
+            numpy.testing.assert_allclose(cache.row(i), expected[i])
+        statistics = cache.statistics()
+        self.assertEqual((statistics["hits"], statistics["misses"], statistics["evictions"]), (1, 5, 2))
+        self.assertEqual(list(cache.rows), [0, 3, 1])
+        numpy.testing.assert_allclose(cache.matrix(), expected)
+
+    def test_support_vectors_only(self):
+        random = numpy.random.RandomState(1)
+        X = random.randn(30, 2).tolist()
+        Y = [1 if x[0] + x[1] > 0 else -1 for x in X]
+        machine = svm.SVM().train(svm.LINEAR, [1], X, Y, 10, solver=minimization.SMO)
+        self.assertLess(machine.n_support, len(X))
+        self.assertAlmostEqual(machine.support_ratio, machine.n_support / len(X))
+        self.assertEqual(machine.support_vectors.shape, (machine.n_support, 2))
+        for x in X[:5]:
+            full = sum(a * y * svm.linear_kernel(v, x, 1) for a, y, v in zip(machine.results, Y, X)) + machine.b
+            self.assertAlmostEqual(machine.get_distance(x), full)
+
+    def test_batch_prediction(self):
+        random = numpy.random.RandomState(2)
+        X = random.randn(30, 2)
+        Y = (X[:, 0] > 0).astype(int) + (X[:, 1] > 0).astype(int)
+        machine = ovr.OVR()
+        machine.train(3, svm.GAUSSIAN, [1], X.tolist(), Y.tolist(), 10)
+        test = random.randn(7, 2)
+        expected = [[element.get_distance(x) for element in machine.machine] for x in test]
+        numpy.testing.assert_allclose(machine.decision_function_batch(test, batch_size=3), expected)
+        self.assertEqual(machine.predict_batch(test).tolist(), [machine.classify(x) for x in test])
+        binary = machine.machine[0]
+        self.assertEqual(binary.predict_batch(test, batch_size=2).tolist(), [binary.classify(x) for x in test])
+
+    def test_affiliation_matrix(self):
+        data = [0.5, -1, 2, 0.25, -3, 1.5]
+        expected = [sum(element) for element in pairwise.PairwiseClassifier.identify_affiliation(data)]
+        numpy.testing.assert_allclose(numpy.dot(data, pairwise.PairwiseClassifier.affiliation_matrix(6)), expected)
+
+    def test_ovr_shares_kernel_rows(self):
+        random = numpy.random.RandomState(3)
+        X = random.randn(20, 2).tolist()
+        Y = [i % 4 for i in range(20)]
+        machine = ovr.OVR()
+        machine.train(4, svm.GAUSSIAN, [1], X, Y, 10)
+        self.assertEqual(machine.statistics["misses"], 1)
+        for n, element in enumerate(machine.machine):
+            separate = svm.SVM().train(svm.GAUSSIAN, [1], X, [1 if y == n else -1 for y in Y], 10)
+            numpy.testing.assert_allclose(element.results, separate.results)
+
+    def test_parallel_training_is_identical(self):
+        random = numpy.random.RandomState(4)
+        X = random.randn(24, 3).tolist()
+        Y = [i % 3 for i in range(24)]
+        for solver in [minimization.QUADPROG, minimization.SMO]:
+            serial, concurrent = ovr.OVR(), ovr.OVR()
+            serial.train(3, svm.GAUSSIAN, [1], X, Y, 10, solver=solver)
+            concurrent.train(3, svm.GAUSSIAN, [1], X, Y, 10, solver=solver, n_jobs=2)
+            for first, second in zip(serial.machine, concurrent.machine):
+                numpy.testing.assert_array_equal(first.results, second.results)
+                numpy.testing.assert_array_equal(first.support_vectors, second.support_vectors)
+                numpy.testing.assert_array_equal(first.dual_coef, second.dual_coef)
+                self.assertEqual(first.b, second.b)
+
+    def test_pairwise(self):
+        random = numpy.random.RandomState(5)
+        centers = numpy.array([[0, 0], [4, 0], [0, 4], [4, 4]])
+        Y = [i % 3 for i in range(45)]
+        X = (centers[Y] + random.randn(45, 2) * 0.5).tolist()
+        machine = pairwise.PairwiseClassifier()
+        machine.train(4, svm.GAUSSIAN, [1], X, Y, 10)
+        self.assertEqual(machine.pairs.tolist(), [[0, 1], [0, 2], [1, 2]])
+        self.assertEqual(len(machine.machine[0].results), 30)
+        self.assertEqual(machine.predict_batch(X).tolist(), Y)
+        self.assertEqual(machine.classify([4, 0.2]), 1)
+        concurrent = pairwise.PairwiseClassifier()
+        concurrent.train(4, svm.GAUSSIAN, [1], X, Y, 10, n_jobs=2)
+        numpy.testing.assert_array_equal(concurrent.decision_function_batch(X), machine.decision_function_batch(X))
+
+    def test_search_reuses_kernel_arguments(self):
+        random = numpy.random.RandomState(7)
+        X = random.randn(40, 2)
+        Y = (X[:, 0] > 0).astype(int) + 2 * (X[:, 1] > 0)
+        numpy.testing.assert_allclose(
+            kernels.kernel_from_argument(svm.LAPLICAN, kernels.kernel_argument(svm.LAPLICAN, X, X), [2]),
+            kernels.kernel_matrix(svm.LAPLICAN, X, X, [2]))
+        results = search.grid_search(X[:30], Y[:30], X[30:], Y[30:], {svm.GAUSSIAN: [[1], [2]]}, [1, 10],
+                                     classifier=pairwise.PairwiseClassifier, number_of_classes=4, n_jobs=1)
+        self.assertEqual([result['rank'] for result in results], [1, 2, 3, 4])
+        self.assertEqual([result['accuracy'] for result in results],
+                         sorted((result['accuracy'] for result in results), reverse=True))
+        for result in results:
+            machine = pairwise.PairwiseClassifier()
+            machine.train(4, result['kernel_type'], result['params'], X[:30], Y[:30], result['c'])
+            self.assertEqual(numpy.mean(machine.predict_batch(X[30:]) == Y[30:]), result['accuracy'])
+
+    def test_cross_validation(self):
+        random = numpy.random.RandomState(8)
+        X = random.randn(40, 2)
+        Y = numpy.where(X[:, 0] + X[:, 1] > 0, 1, -1)
+        folds = validation.k_folds(40, 4, seed=1)
+        self.assertEqual(sorted(numpy.concatenate([test for train, test in folds]).tolist()), list(range(40)))
+        results = validation.cross_validate(svm.GAUSSIAN, [1], X, Y, 10, classifier=svm.SVM, folds=folds, n_jobs=1)
+        self.assertEqual([result['test_size'] for result in results], [10] * 4)
+        for (train, test), result in zip(folds, results):
+            machine = svm.SVM().train(svm.GAUSSIAN, [1], X[train], Y[train], 10)
+            self.assertEqual(numpy.mean(machine.predict_batch(X[test]) == Y[test]), result['accuracy'])
+
+    def test_warm_start(self):
+        random = numpy.random.RandomState(9)
+        X = random.randn(120, 2)
+        Y = numpy.where(X[:, 0] + 0.5 * random.randn(120) > 0, 1, -1)
+        previous = svm.SVM().train(svm.GAUSSIAN, [1], X, Y, 10, solver=minimization.SMO)
+        cold = svm.SVM().train(svm.GAUSSIAN, [1], X, Y, 12, solver=minimization.SMO)
+        warm = svm.SVM().train(svm.GAUSSIAN, [1], X, Y, 12, solver=minimization.SMO, initial=previous.results)
+        self.assertLess(warm.iterations, cold.iterations)
+        appended = svm.SVM().train(svm.GAUSSIAN, [1], X, Y, 12, solver=minimization.SMO,
+                                   initial=previous.results[:110])
+        numpy.testing.assert_allclose(appended.decision_function_batch(X), cold.decision_function_batch(X), atol=1e-2)
+        self.assertAlmostEqual(numpy.dot(warm.results, Y), 0)
+        self.assertTrue(numpy.all((warm.results >= 0) & (warm.results <= 12)))
+        numpy.testing.assert_allclose(warm.decision_function_batch(X), cold.decision_function_batch(X), atol=1e-2)
+        with self.assertRaises(ValueError):
+            svm.SVM().train(svm.GAUSSIAN, [1], X, Y, 12, initial=previous.results)
+
+    def test_partial_fit(self):
+        random = numpy.random.RandomState(10)
+        X = random.randn(200, 2)
+        Y = numpy.where(X[:, 0] + 0.3 * random.randn(200) > 0, 1, -1)
+        full = svm.SVM().train(svm.GAUSSIAN, [1], X, Y, 10, solver=minimization.SMO)
+        machine = svm.SVM().train(svm.GAUSSIAN, [1], X[:100], Y[:100], 10, solver=minimization.SMO)
+        for start in range(100, 200, 25):
+            machine.partial_fit(X[start:start + 25], Y[start:start + 25])
+        self.assertGreater(numpy.mean(machine.predict_batch(X) == full.predict_batch(X)), 0.95)
+        machine.partial_fit(X[:0], Y[:0], budget=20)
+        self.assertLessEqual(machine.n_support, 20)
+        self.assertEqual(len(machine.X), 20)
+        self.assertGreater(numpy.mean(machine.predict_batch(X) == Y), 0.85)
+        machine.remove(machine.X[:5])
+        self.assertEqual(len(machine.X), 15)
+        self.assertAlmostEqual(numpy.dot(machine.results, machine.Y), 0)
+        classes = (X[:, 0] > 0).astype(int) + 2 * (X[:, 1] > 0)
+        multi = ovr.OVR()
+        multi.train(4, svm.GAUSSIAN, [1], X[:100], classes[:100], 10, solver=minimization.SMO)
+        multi.partial_fit(X[100:], classes[100:], budget=30)
+        self.assertTrue(all(element.n_support <= 30 for element in multi.machine))
+        self.assertGreater(numpy.mean(multi.predict_batch(X) == classes), 0.9)
+
+    def test_kernel_approximation(self):
+        random = numpy.random.RandomState(11)
+        X = random.randn(200, 3)
+        for kernel_type in (svm.GAUSSIAN, svm.EXPONENTIAL, svm.LAPLICAN):
+            exact = kernels.kernel_matrix(kernel_type, X, X, [1.5])
+            features = approximation.RandomFourierFeatures(kernel_type, [1.5], 4000, seed=1).fit(X).transform(X)
+            self.assertLess(numpy.abs(numpy.dot(features, features.T) - exact).mean(), 0.02)
+        features = approximation.Nystroem(svm.POLYNOMIAL, [1, 1, 2], 20, seed=1).fit(X).transform(X)
+        numpy.testing.assert_allclose(numpy.dot(features, features.T),
+                                      kernels.kernel_matrix(svm.POLYNOMIAL, X, X, [1, 1, 2]), atol=1e-8)
+        classes = (X[:, 0] > 0).astype(int) + 2 * (X[:, 1] * X[:, 2] > 0)
+        machine = ovr.OVR()
+        machine.train(4, svm.GAUSSIAN, [1], X[:150], classes[:150], 10, approximation=approximation.NYSTROEM,
+                      n_components=100, seed=0)
+        self.assertEqual(len(machine.machine[0].support_vectors), 0)
+        self.assertGreater(numpy.mean(machine.predict_batch(X[150:]) == classes[150:]), 0.75)
+        numpy.testing.assert_allclose(machine.decision_function_batch(X[150:])[:, 2],
+                                      machine.machine[2].decision_function_batch(X[150:]))
+        self.assertEqual(machine.classify(X[160]), machine.predict_batch(X[160:161])[0])
+        with self.assertRaises(TypeError):
+            approximation.FeatureMap(svm.GAUSSIAN, [1])
+        #  A vector changed in place is transformed again
+        vector = X[160].copy()
+        binary = machine.machine[0]
+        binary.get_distance(vector)
+        vector[:] = X[170]
+        self.assertAlmostEqual(binary.get_distance(vector), binary.get_distance(X[170].copy()))
+
+    def test_linear_primal_mode(self):
+        random = numpy.random.RandomState(12)
+        X = random.randn(300, 5)
+        Y = numpy.where(numpy.dot(X, [1, -2, 0.5, 0, 1]) > 0, 1, -1)
+        machine = svm.SVM().train(svm.LINEAR, [1], X, Y, 1, solver=minimization.COORDINATE_DESCENT)
+        self.assertEqual(machine.weights.shape, (5,))
+        self.assertEqual(len(machine.support_vectors), 0)
+        numpy.testing.assert_allclose(machine.decision_function_batch(X), numpy.dot(X, machine.weights) + machine.b)
+        dual = svm.SVM().train(svm.LINEAR, [1], X, Y, 1, solver=minimization.SMO)
+        self.assertGreater(numpy.mean(machine.predict_batch(X) == dual.predict_batch(X)), 0.98)
+        classes = numpy.argmax(numpy.dot(X, random.randn(5, 3)), axis=1)
+        multi = ovr.OVR()
+        multi.train(3, svm.LINEAR, [1], X, classes, 1, solver=minimization.COORDINATE_DESCENT)
+        weights = numpy.column_stack([element.weights for element in multi.machine])
+        numpy.testing.assert_allclose(multi.decision_function_batch(X),
+                                      numpy.dot(X, weights) + [element.b for element in multi.machine])
+        with self.assertRaises(ValueError):
+            svm.SVM().train(svm.GAUSSIAN, [1], X, Y, 1, solver=minimization.COORDINATE_DESCENT)
+        #  A starting point found on the first samples is padded with zeros
+        first = svm.SVM().train(svm.LINEAR, [1], X[:100], Y[:100], 1, solver=minimization.COORDINATE_DESCENT)
+        warm = svm.SVM().train(svm.LINEAR, [1], X, Y, 1, solver=minimization.COORDINATE_DESCENT,
+                               initial=first.results)
+        self.assertGreater(numpy.mean(warm.predict_batch(X) == machine.predict_batch(X)), 0.98)
+        start = ovr.OVR()
+        start.train(3, svm.GAUSSIAN, [1], X[:100], classes[:100], 1, approximation=approximation.NYSTROEM,
+                    n_components=50, seed=0)
+        multi.train(3, svm.GAUSSIAN, [1], X, classes, 1, warm_start=start, approximation=approximation.NYSTROEM,
+                    n_components=50, seed=0)
+        with self.assertRaises(ValueError):
+            svm.SVM().train(svm.LINEAR, [1], X[:100], Y[:100], 1, solver=minimization.COORDINATE_DESCENT,
+                            initial=warm.results)
+
+    def test_benchmark_baseline(self):
+        results = benchmark.run(((30, 3, 2),), {svm.GAUSSIAN: [1]}, repeat=1)
+        stages = {(result['stage'], result['solver']) for result in results}
+        self.assertIn(('svm_train', minimization.QUADPROG), stages)
+        self.assertIn(('ovr_predict_batch', None), stages)
+        self.assertTrue(all(result['seconds'] >= 0 and result['peak_bytes'] >= 0 for result in results))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'baseline.json')
+            benchmark.save(results, path)
+            baseline = benchmark.load(path)
+        self.assertEqual(benchmark.compare(results, baseline), [])
+        slower = [dict(result, seconds=result['seconds'] * 2 + 1) for result in results]
+        self.assertEqual(len(benchmark.compare(slower, baseline)), len(results))
+
+    def test_instrumentation(self):
+        events = []
+        instrumentation.reset()
+        instrumentation.enable(profile=True)
+        callback = lambda stage, values: events.append((stage, values))
+        instrumentation.add_callback(callback)
+        try:
+            machine = ovr.OVR()
+            machine.train(2, svm.GAUSSIAN, [1], [[0, 0], [0, 1], [3, 3], [3, 4]], [0, 0, 1, 1], 10)
+            machine.classify([3, 3])
+        finally:
+            instrumentation.disable()
+            instrumentation.remove_callback(callback)
+        metrics = instrumentation.metrics()
+        self.assertEqual(metrics['svm.train']['calls'], 2)
+        self.assertEqual(metrics['svm.train']['support_vectors'], sum(m.n_support for m in machine.machine))
+        self.assertEqual(metrics['qp.solve']['iterations'], sum(m.iterations for m in machine.machine))
+        self.assertEqual(metrics['kernel']['evaluations'], 16 + sum(m.n_support for m in machine.machine))
+        self.assertIn('ovr.classify', metrics)
+        self.assertIn(('ovr.train', {'calls': 1, 'seconds': metrics['ovr.train']['seconds']}), events)
+        self.assertIn('minimize', instrumentation.profile_report('ovr.train'))
+        machine.classify([3, 3])
+        self.assertEqual(instrumentation.metrics()['ovr.classify']['calls'], 1)
+        instrumentation.reset()
+
+    def test_model_file(self):
+        generator = numpy.random.RandomState(11)
+        X = generator.randn(60, 3)
+        Y = (X[:, 0] > 0).astype(int) + 2 * (X[:, 1] > 0)
+        exact, approximated, voting = ovr.OVR(), ovr.OVR(), pairwise.PairwiseClassifier()
+        exact.train(4, svm.GAUSSIAN, [1], X, Y, 10)
+        approximated.train(4, svm.GAUSSIAN, [1], X, Y, 10, approximation=approximation.NYSTROEM, n_components=20)
+        voting.train(4, svm.LAPLICAN, [1], X, Y, 10)
+        self.assertEqual(approximated.machine[0].dual_coef.size + approximated.machine[0].support_vectors.size, 0)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'model.bin')
+            for machine in (exact, approximated, voting, exact.machine[0]):
+                model_file.save_model(machine, path)
+                for mmap in (True, False):
+                    loaded = model_file.load_model(path, mmap=mmap)
+                    self.assertIs(type(loaded), type(machine))
+                    numpy.testing.assert_array_equal(loaded.predict_batch(X), machine.predict_batch(X))
+            self.assertIsInstance(model_file.load_model(path).support_vectors, numpy.memmap)
+            model_file.save_model(voting, path)
+            with self.assertRaisesRegex(ValueError, 'unknown'):
+                model_file.load_model(path).predict_precomputed(kernels.kernel_matrix(svm.LAPLICAN, X, X, [1]))
+            #  Hyperparameters of numpy types, as they come from a search grid
+            for options in ({}, {'approximation': approximation.RANDOM_FOURIER, 'n_components': numpy.int64(20),
+                                 'seed': numpy.int64(1)}):
+                typed = ovr.OVR()
+                typed.train(4, svm.GAUSSIAN, [numpy.float32(1.5)], X, Y, numpy.float32(10), **options)
+                model_file.save_model(typed, path)
+                loaded = model_file.load_model(path)
+                self.assertEqual((loaded.c, loaded.machine[0].params), (10., [1.5]))
+                numpy.testing.assert_array_equal(loaded.predict_batch(X), typed.predict_batch(X))
+            with open(path, 'r+b') as f:
+                f.write(b'BADMAGIC')
+            with self.assertRaises(ValueError):
+                model_file.load_model(path)
+            for size in (0, 10):
+                with open(path, 'r+b') as f:
+                    f.truncate(size)
+                with self.assertRaises(ValueError):
+                    model_file.load_model(path)
+            with self.assertRaises(ValueError):
+                model_file.save_model(ovr.OVR(), path)
+
+    def test_float32_mode(self):
+        generator = numpy.random.RandomState(12)
+        X = generator.randn(80, 4)
+        Y = (X[:, 0] > 0).astype(int) + 2 * (X[:, 1] > 0)
+        exact, reduced = ovr.OVR(), ovr.OVR()
+        #  The dense solver finds the unique optimum, so the difference comes from the float type only
+        exact.train(4, svm.GAUSSIAN, [1], X, Y, 10)
+        reduced.train(4, svm.GAUSSIAN, [1], X, Y, 10, dtype=numpy.float32)
+        self.assertEqual(reduced.machine[0].support_vectors.dtype, numpy.float32)
+        self.assertEqual(reduced.statistics['bytes'] * 2, exact.statistics['bytes'])
+        self.assertLess(reduced.nbytes, exact.nbytes)
+        numpy.testing.assert_allclose(reduced.decision_function_batch(X), exact.decision_function_batch(X), atol=1e-4)
+        numpy.testing.assert_array_equal(reduced.predict_batch(X), exact.predict_batch(X))
+        self.assertEqual(kernels.kernel_matrix(svm.GAUSSIAN, X, X, [numpy.float64(1)], numpy.float32).dtype,
+                         numpy.float32)
+        with self.assertRaises(ValueError):
+            svm.SVM().train(svm.GAUSSIAN, [1], X, numpy.where(Y == 0, 1, -1), 10, dtype=numpy.int32)
+
+    def test_float32_kernel_of_large_features(self):
+        X = 1000 + 300 * numpy.random.RandomState(14).randn(30, 38)
+        reduced = kernels.kernel_matrix(svm.GAUSSIAN, X, X.copy(), [30], numpy.float32)
+        self.assertEqual(reduced.dtype, numpy.float32)
+        numpy.testing.assert_array_equal(numpy.diag(reduced), numpy.ones(30, dtype=numpy.float32))
+        numpy.testing.assert_allclose(reduced, kernels.kernel_matrix(svm.GAUSSIAN, X, X, [30]), atol=1e-7)
+        row = KernelCache(svm.GAUSSIAN, [30], X, dtype=numpy.float32).kernel_row(3)
+        self.assertEqual(row[3], 1)
+
+    def test_prediction_server(self):
+        generator = numpy.random.RandomState(13)
+        X = generator.randn(60, 3)
+        Y = (X[:, 0] > 0).astype(int) + 2 * (X[:, 1] > 0)
+        machine = ovr.OVR()
+        machine.train(4, svm.GAUSSIAN, [1], X, Y, 10, solver=minimization.SMO)
+        service = server.PredictionServer(machine, window=0.05, max_batch=8)
+
+        async def scenario(path):
+            listener = await service.start(path)
+
+            async def client(rows):
+                reader, writer = await asyncio.open_unix_connection(path)
+                for row in rows:
+                    writer.write(json.dumps({'x': row.tolist()}).encode() + b'\n')
+                writer.write(b'{"x": [1, 2]}\n{"y": 1}\nnot json\n{"x": "abc"}\n')
+                answers = [json.loads(await reader.readline()) for element in range(len(rows) + 4)]
+                writer.write(b'{"stats": true}\n')
+                answers.append(json.loads(await reader.readline()))
+                writer.close()
+                return answers
+
+            try:
+                return await asyncio.gather(*[client(X[i::3]) for i in range(3)])
+            finally:
+                listener.close()
+                await service.stop()
+
+        with tempfile.TemporaryDirectory() as directory:
+            answers = asyncio.run(scenario(os.path.join(directory, 'server.sock')))
+        predicted = machine.predict_batch(X)
+        for i, element in enumerate(answers):
+            self.assertEqual([answer['class'] for answer in element[:-5]], predicted[i::3].tolist())
+            self.assertTrue(all('error' in answer for answer in element[-5:-1]))
+        statistics = service.statistics()
+        self.assertEqual(statistics['classified'], 60)
+        self.assertEqual((statistics['requests'], statistics['errors']), (72, 12))
+        self.assertLessEqual(statistics['batches'], 60 // 8 + 3)
+        self.assertLessEqual(statistics['p50'], statistics['p99'])
+
+    def test_prediction_server_errors(self):
+        class Model:
+            def predict_batch(self, X):
+                if X.shape[1] == 2:
+                    raise RuntimeError("Broken model")
+                return numpy.zeros(len(X))
+
+        service = server.PredictionServer(Model(), window=0.05, max_batch=8)
+
+        async def scenario():
+            await service.start(os.path.join(directory, 'server.sock'))
+            try:
+                first = await asyncio.gather(service.predict([1, 2]), service.predict([1, 2, 3]),
+                                             return_exceptions=True)
+                #  The batcher survives the failed group
+                return first, await service.predict([4, 5, 6])
+            finally:
+                await service.stop()
+
+        with tempfile.TemporaryDirectory() as directory:
+            first, second = asyncio.run(scenario())
+        self.assertIsInstance(first[0], RuntimeError)
+        self.assertEqual((first[1], second), (0, 0))
+        self.assertEqual((service.counters['batches'], service.counters['classified']), (2, 2))
+
+    def test_resumable_preprocessing(self):
+        #  wfdb and biosppy are replaced by stand-ins which return a synthetic record and channel
+        wfdb = types.ModuleType('wfdb')
+        wfdb.rdsamp = lambda path: types.SimpleNamespace(fs=250., p_signals=numpy.ones((100, 2)))
+        biosppy = types.ModuleType('biosppy')
+        biosppy.ecg = types.SimpleNamespace(ecg=lambda signal, sampling_rate, show: (
+            numpy.arange(len(signal)) / sampling_rate, signal, [10, 60], None, numpy.zeros((2, 5)), None, [70.]))
+        stubs = {'wfdb': wfdb, 'biosppy': biosppy, 'peakutils': types.ModuleType('peakutils')}
+        with mock.patch.dict(sys.modules, stubs), tempfile.TemporaryDirectory() as directory:
+            import data_predprocessor
+            data, processed = os.path.join(directory, 'data'), os.path.join(directory, 'processed')
+            os.makedirs(data)
+            for name in ('a01', 'a02'):
+                for extension in ('.dat', '.hea'):
+                    open(os.path.join(data, name + extension), 'w').close()
+            options = {'n_jobs': 2, 'data_directory': data, 'processed_directory': processed}
+            timings = data_predprocessor.process_data(**options)
+            self.assertEqual((timings['records'], timings['skipped']), (2, 0))
+            self.assertEqual(sorted(os.listdir(processed)), ['a01', 'a02'])
+            with open(os.path.join(processed, 'a01'), 'rb') as f:
+                channels = pickle.load(f)
+            self.assertEqual(len(channels), 2)
+            numpy.testing.assert_array_equal(channels[1]['rpeaks'], [10, 60])
+            timings = data_predprocessor.process_data(**options)
+            self.assertEqual((timings['records'], timings['skipped']), (0, 2))
+            #  The source becomes newer than the processed record
+            past = os.stat(os.path.join(data, 'a02.dat')).st_mtime - 10
+            os.utime(os.path.join(processed, 'a02'), (past, past))
+            timings = data_predprocessor.process_data(**options)
+            self.assertEqual((timings['records'], timings['skipped']), (1, 1))
+            self.assertTrue(data_predprocessor.is_processed('a02', data, processed))
+            self.assertEqual(data_predprocessor.process_data(force=True, **options)['records'], 2)
+            #  An interrupted write leaves neither a truncated record nor a temporary file
+            with mock.patch.object(data_predprocessor.pickle, 'dump', side_effect=KeyboardInterrupt):
+                with self.assertRaises(KeyboardInterrupt):
+                    data_predprocessor._write_atomically(os.path.join(processed, 'a03'), [])
+            self.assertEqual(sorted(os.listdir(processed)), ['a01', 'a02'])
+
+    def test_lu_linear_algebra(self):
+        matrix = [[0, 2, 1], [1, 1, 1], [2, 1, 3]]
+        self.assertAlmostEqual(utility.determinant(matrix), numpy.linalg.det(matrix))
+        self.assertAlmostEqual(utility.determinant([[1, 2], [2, 4]]), 0)
+        system = [row + [b] for row, b in zip(matrix, [3, 2, 6])]
+        numpy.testing.assert_allclose(utility.solve_gauss_jordan(system), numpy.linalg.solve(matrix, [3, 2, 6]))
+        numpy.testing.assert_allclose(utility.solve_crammer(system), numpy.linalg.solve(matrix, [3, 2, 6]))
+        factorization = utility.lu_factorization(matrix)
+        B = numpy.random.RandomState(6).randn(3, 4)
+        numpy.testing.assert_allclose(utility.lu_solve(factorization, B), numpy.linalg.solve(matrix, B))
+        with self.assertRaises(ValueError):
+            utility.solve_crammer([[1, 2, 3], [2, 4, 6]])
+
+    def test_dataset_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            train, diagnoses = os.path.join(directory, 'train'), os.path.join(directory, 'diagnoses')
+            os.mkdir(train)
+            os.mkdir(diagnoses)
+            for n, name in enumerate(['b', 'a', 'c']):
+                with open(os.path.join(train, name), 'wb') as f:
+                    pickle.dump([n, n + 0.5], f)
+                with open(os.path.join(diagnoses, name), 'w') as f:
+                    f.write('{}\n'.format(n))
+            data = dataset.load_dataset(train, diagnoses)
+            self.assertEqual(data.names, ['a', 'b', 'c'])
+            self.assertEqual(data.X.tolist(), [[1, 1.5], [0, 0.5], [2, 2.5]])
+            self.assertIs(dataset.load_dataset(train, diagnoses), data)
+            first, rest = data.split(2)
+            self.assertEqual((first.Y.tolist(), rest.Y.tolist()), ([1, 0], [2]))
+            with open(os.path.join(diagnoses, 'c'), 'w') as f:
+                f.write('5\n')
+            os.utime(os.path.join(diagnoses, 'c'), ns=(0, 0))
+            self.assertEqual(dataset.load_dataset(train, diagnoses).Y.tolist(), [1, 0, 5])
+
+    def test_feature_store(self):
+        channels = [{'ts': numpy.arange(6) / 2, 'filtered': numpy.arange(6) * k, 'rpeaks': numpy.arange(k + 1),
+                     'templates': numpy.ones((k + 1, 3)) * k, 'heart_rate': numpy.arange(k) + 60.} for k in range(3)]
+        with tempfile.TemporaryDirectory() as directory:
+            store = feature_store.FeatureStore(os.path.join(directory, 'store'))
+            store.write_record('twa00', channels)
+            loaded = feature_store.FeatureStore(os.path.join(directory, 'store')).read_record('twa00')
+            self.assertEqual(len(loaded), 3)
+            for expected, channel in zip(channels, loaded):
+                for field, value in expected.items():
+                    numpy.testing.assert_array_equal(channel[field], value)
+            self.assertIsInstance(loaded[1]['filtered'].base, numpy.memmap)
+            os.mkdir(os.path.join(directory, 'train'))
+            os.mkdir(os.path.join(directory, 'diagnoses'))
+            for n, name in enumerate(['a', 'b']):
+                with open(os.path.join(directory, 'train', name), 'wb') as f:
+                    pickle.dump([n, 2 * n], f)
+                with open(os.path.join(directory, 'diagnoses', name), 'w') as f:
+                    f.write('{}\n'.format(n + 1))
+            feature_store.convert(None, os.path.join(directory, 'train'), os.path.join(directory, 'store'))
+            data = dataset.load_from_store(os.path.join(directory, 'store'), os.path.join(directory, 'diagnoses'))
+            self.assertEqual((data.names, data.X.tolist(), data.Y.tolist()), (['a', 'b'], [[0, 0], [1, 2]], [1, 2]))
+
+    def test_vectorized_features(self):
+        random = numpy.random.RandomState(7)
+        records = []
+        for r in range(4):
+            data = []
+            for k in range(3):
+                beats = random.randint(5, 9)
+                rpeaks = numpy.sort(random.choice(numpy.arange(1000), beats, replace=False))
+                data.append({'ts': numpy.arange(1000) / 500, 'rpeaks': rpeaks, 'templates': random.randn(beats, 20),
+                             'heart_rate': 60 + random.randn(beats - 1)})
+            records.append(data)
+        expected = [legacy_features(data) for data in records]
+        numpy.testing.assert_allclose(features.extract_features_batch(records), expected)
+        numpy.testing.assert_allclose(features.extract_features(records[2]), expected[2])
+
+    def test_running_statistics(self):
+        values = numpy.random.RandomState(8).randn(50) * 3 + 1
+        statistics = utility.RunningStatistics()
+        for chunk in numpy.split(values, [1, 7, 20]):
+            statistics.add(chunk)
+        ev, dispersion = utility.get_ev_and_dispersion(values.tolist())
+        self.assertAlmostEqual(statistics.ev, ev)
+        self.assertAlmostEqual(statistics.dispersion, dispersion)
+
+    def test_streaming_classification(self):
+        class Machine:
+            def __init__(self):
+                self.vectors = []
+
+            def predict_batch(self, X):
+                self.vectors.append(X[0])
+                return [len(self.vectors)]
+
+        def detector(signal, sampling_rate):
+            rpeaks = numpy.flatnonzero(signal > 0.5)
+            rpeaks = rpeaks[(rpeaks >= 10) & (rpeaks < len(signal) - 20)]
+            return rpeaks, numpy.array([signal[i - 10:i + 20] for i in rpeaks])
+
+        signal = numpy.zeros((10000, 2))
+        signal[50::100, 0] = 1
+        signal[52::100, 1] = 2
+        machine = Machine()
+        classifier = streaming.StreamingClassifier(machine, 100, 2, beats_per_window=20, buffer_seconds=5,
+                                                   detector=detector)
+        results = list(classifier.run(signal[i:i + 37] for i in range(0, len(signal), 37)))
+        self.assertEqual([result for beats, result in results], [1, 2, 3, 4])
+        self.assertTrue(all(beats >= 20 * n for n, (beats, result) in enumerate(results, 1)))
+        self.assertLessEqual(len(classifier.buffer), 500)
+        vector = machine.vectors[-1]
+        self.assertEqual(len(vector), 10 + 2 + 2 * 2 + 2)
+        self.assertEqual((vector[10], vector[11], vector[-2]), (100, 0, 60))
+        self.assertEqual((vector[9], vector[8]), (10, 1.5))
+        #  One chunk of the whole signal finds the same beats as the small chunks
+        whole = streaming.StreamingClassifier(Machine(), 100, 2, beats_per_window=20, buffer_seconds=5,
+                                              detector=detector)
+        self.assertEqual(whole.update(signal), [1, 2, 3, 4])
+        self.assertEqual(whole.beats, classifier.beats)
+        numpy.testing.assert_array_equal(whole.machine.vectors, machine.vectors)
+
     def test_wrong(self):
         self.assertEqual(1, 2)
 
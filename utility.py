@@ -1,7 +1,7 @@
 """
 This file contains general mathematics operations which are used in other files
 """
-import copy
+import numpy
 
 
 def multiply_vector(X: list, Y: list) -> float:
@@ -40,39 +40,91 @@ def euclidean_distance(X: list, Y: list) -> float:
     return sum(vector) ** 0.5
 
 
+def squared_distance_matrix(X: numpy.ndarray, Y: numpy.ndarray) -> numpy.ndarray:
+    """
+    The function calculates squared Euclidean distances between every row of X and every row of Y
+    :param X: matrix n x d
+    :param Y: matrix m x d
+    :return: matrix n x m of squared distances
+    :except ValueError: Vectors are not same size
+    """
+    if X.shape[1] != Y.shape[1]:
+        raise ValueError("X and Y should be the same size")
+    result = numpy.einsum('ij,ij->i', X, X)[:, numpy.newaxis] + numpy.einsum('ij,ij->i', Y, Y)[numpy.newaxis, :]
+    result -= 2 * numpy.dot(X, Y.T)
+    #  Rounding errors of the expansion may produce small negative values
+    numpy.maximum(result, 0, out=result)
+    if X is Y:
+        numpy.fill_diagonal(result, 0)
+    return result
+
+
+def lu_factorization(X: list) -> tuple:
+    """
+    This function finds LU factorization of the square matrix with partial (row) pivoting, P * X = L * U.
+    The factorization may be computed once and used for many right-hand sides.
+    :param X: matrix n x n
+    :return: matrix containing L below the main diagonal (its diagonal is 1) and U on and above it,
+    row permutation vector and sign of the permutation
+    :except ValueError: Matrix is not square
+    """
+    matrix = numpy.array(X, dtype=numpy.float64)
+    if matrix.ndim != 2 or matrix.shape[0] != matrix.shape[1]:
+        raise ValueError("Wrong matrix size")
+    n = len(matrix)
+    permutation = numpy.arange(n)
+    sign = 1
+    for k in range(n):
+        #  Chooses the row with the largest element of the column as pivot
+        pivot = k + int(numpy.argmax(numpy.abs(matrix[k:, k])))
+        if pivot != k:
+            matrix[[k, pivot]] = matrix[[pivot, k]]
+            permutation[[k, pivot]] = permutation[[pivot, k]]
+            sign = -sign
+        if matrix[k, k] == 0:
+            continue
+        matrix[k + 1:, k] /= matrix[k, k]
+        matrix[k + 1:, k + 1:] -= numpy.outer(matrix[k + 1:, k], matrix[k, k + 1:])
+    return matrix, permutation, sign
+
+
+def lu_solve(factorization: tuple, B) -> numpy.ndarray:
+    """
+    This function solves the system of linear equations X * A = B using LU factorization of X
+    :param factorization: result of lu_factorization
+    :param B: vector n or matrix n x k of right-hand sides
+    :return: vector n or matrix n x k of solutions
+    :except ValueError: Matrix is singular or B is wrong size
+    """
+    matrix, permutation, sign = factorization
+    n = len(matrix)
+    B = numpy.asarray(B, dtype=numpy.float64)
+    if B.shape[0] != n:
+        raise ValueError("Wrong matrix size")
+    if n and numpy.any(numpy.diagonal(matrix) == 0):
+        raise ValueError("The system of equations is incompatible")
+    result = B[permutation].copy()
+    for i in range(1, n):
+        result[i] -= numpy.dot(matrix[i, :i], result[:i])
+    for i in range(n - 1, -1, -1):
+        result[i] = (result[i] - numpy.dot(matrix[i, i + 1:], result[i + 1:])) / matrix[i, i]
+    return result
+
+
 def solve_gauss_jordan(X: list) -> list:
     """
-    This function solves the system of linear equations by the Gauss-Jordan method and returns the vector of solutions
+    This function solves the system of linear equations by the Gauss method with partial pivoting and returns the
+    vector of solutions
     :param X: matrix n x n + 1 which is a Gauss matrix
     :return: vector of solutions
     :except AssertionError: Param is not matrix
-    :except ValueError: Param size is not n x n + 1
+    :except ValueError: Param size is not n x n + 1 or system of equations is incompatible
     """
     assert X, list
     if len(X) != len(X[0]) - 1:
         raise ValueError("Wrong matrix size")
-    matrix = copy.deepcopy(X)
-    #  Leads the matrix to a Gaussian form
-    for i in range(len(matrix)):
-        mul = matrix[i][i]
-        #  Set main diagonal element to 1
-        for j in range(i, len(matrix[i])):
-            matrix[i][j] /= mul
-        # Set elements to the left of the main diagonal to 0
-        for k in range(i + 1, len(matrix)):
-            mul = matrix[k][i]
-            result = 0
-            for j in range(i, len(matrix[i])):
-                matrix[k][j] -= matrix[i][j] * mul
-                result += matrix[k][j] ** 2
-    matrix = [list(reversed(equation)) for equation in reversed(matrix)]
-    result = []
-    for i in range(len(matrix)):
-        result.append(matrix[i][0] / matrix[i][i + 1])
-        for j in range(i, len(matrix)):
-            matrix[j][0] -= result[i] * matrix[j][i + 1]
-            matrix[j][i + 1] = 0
-    return list(reversed(result))
+    matrix = numpy.array(X, dtype=numpy.float64)
+    return lu_solve(lu_factorization(matrix[:, :-1]), matrix[:, -1]).tolist()
 
 
 def minor(X: list, i: int, j: int) -> list:
@@ -119,10 +171,10 @@ def determinant(X: list) -> float:
             raise ValueError("Wrong matrix")
     if len(X) == 1:
         return X[0][0]
-    result = 0
-    for i in range(len(X)):
-        result += ((-1) ** i) * X[0][i] * determinant(minor(X, 0, i))
-    return result
+    if len(X) != size:
+        raise ValueError("Wrong matrix")
+    matrix, permutation, sign = lu_factorization(X)
+    return float(sign * numpy.prod(numpy.diagonal(matrix)))
 
 
 def crammer_matrix(X: list, j: int) -> list:
@@ -180,18 +232,51 @@ def solve_crammer(X: list) -> list:
         assert x, list
         if len(x) - 1 != len(X):
             raise ValueError("Matrix has wrong size")
-    main = crammer_main_matrix(X)
-    result = []
-    try:
-        det = determinant(main)
-    except ZeroDivisionError:
-        raise ValueError("The system of equations is incompatible")
-    for i in range(len(X)):
-        result.append(determinant(crammer_matrix(X, i)) / det)
-    return result
+    matrix = numpy.array(X, dtype=numpy.float64)
+    #  Cramer's rule gives the same solution as LU factorization, which avoids n + 1 determinants
+    return lu_solve(lu_factorization(crammer_main_matrix(X)), matrix[:, -1]).tolist()
 
 
 def get_ev_and_dispersion(data):
     ev = sum(data) / len(data)
     dispersion = sum([(x - ev) ** 2 for x in data]) / len(data)
     return ev, dispersion
+
+
+class RunningStatistics:
+    """
+    This class updates the expected value and the dispersion of a sequence incrementally (Welford's method), so the
+    values themselves are not stored. The results are the same as get_ev_and_dispersion gives for all added values.
+    """
+
+    def __init__(self):
+        """
+        Constructor. Assigns the initial values to the fields of the class.
+        """
+        self.count = 0
+        self.ev = 0.
+        self.__squares = 0.
+
+    def add(self, values) -> None:
+        """
+        Adds values to the sequence
+        :param values: number or vector of numbers
+        :return: None
+        """
+        values = numpy.atleast_1d(numpy.asarray(values, dtype=numpy.float64))
+        if not len(values):
+            return
+        # Combines statistics of the sequence and of the new values (Chan et al. parallel algorithm)
+        count = self.count + len(values)
+        ev = numpy.mean(values)
+        delta = ev - self.ev
+        self.__squares += numpy.sum((values - ev) ** 2) + delta ** 2 * self.count * len(values) / count
+        self.ev += delta * len(values) / count
+        self.count = count
+
+    @property
+    def dispersion(self) -> float:
+        """
+        Dispersion of the added values
+        """
+        return self.__squares / self.count if self.count else 0.
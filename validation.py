@@ -0,0 +1,129 @@
+"""
+This file implements k-fold cross-validation of svm and multi-class classifiers. The kernel matrix of the whole
+dataset is computed once, every fold trains and predicts on its blocks.
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+
+import minimization
+import ovr
+import parallel
+import svm
+from kernel_cache import KernelCache
+from kernels import *
+
+
+def k_folds(n: int, k: int, shuffle: bool = True, seed: int = None) -> list:
+    """
+    Splits the samples into k folds of almost equal size
+    :param n: number of samples
+    :param k: number of folds
+    :param shuffle: whether the samples are shuffled before splitting, otherwise folds are contiguous
+    :param seed: seed of the random generator used for shuffling
+    :return: list of pairs (training indexes, test indexes), one for each fold
+    :except ValueError: there are fewer samples than folds
+    """
+    if k < 2 or k > n:
+        raise ValueError("Number of folds should be in range 2..n")
+    order = numpy.random.default_rng(seed).permutation(n) if shuffle else numpy.arange(n)
+    folds = numpy.array_split(order, k)
+    return [(numpy.sort(numpy.concatenate(folds[:i] + folds[i + 1:])), numpy.sort(test))
+            for i, test in enumerate(folds)]
+
+
+def _validate_fold(task: tuple, arrays) -> dict:
+    """
+    Private function training and checking the classifier on one fold
+    :param task: training indexes, test indexes, classifier class, number of classes, kernel type, params, c and solver
+    :param arrays: function returning the array by its name
+    :return: result of the fold
+    """
+    train, test, classifier, number_of_classes, kernel_type, params, c, solver = task
+    X, Y, gram = arrays('X'), arrays('Y'), arrays('gram')
+    cache = KernelCache.from_matrix(kernel_type, params, X[train], gram[numpy.ix_(train, train)])
+    machine = classifier()
+    start = time.perf_counter()
+    if classifier is svm.SVM:
+        machine.train(kernel_type, params, cache.points, Y[train], c, solver=solver, cache=cache)
+    else:
+        machine.train(number_of_classes, kernel_type, params, cache.points, Y[train], c, solver=solver, cache=cache)
+    train_time = time.perf_counter() - start
+    start = time.perf_counter()
+    predicted = machine.predict_precomputed(gram[numpy.ix_(test, train)])
+    predict_time = time.perf_counter() - start
+    return {'train_size': len(train), 'test_size': len(test), 'accuracy': float(numpy.mean(predicted == Y[test])),
+            'errors': int(numpy.sum(predicted != Y[test])), 'train_time': train_time, 'predict_time': predict_time}
+
+
+def _validate_shared(task: tuple) -> dict:
+    """
+    Private function validating the fold in the worker process on the shared arrays
+    :param task: task as in _validate_fold
+    :return: result of the fold
+    """
+    return _validate_fold(task, parallel.shared)
+
+
+def cross_validate(kernel_type: str, params: list, X, Y, c: float, classifier=ovr.OVR, number_of_classes: int = None,
+                   folds: int = 5, solver: str = minimization.QUADPROG, shuffle: bool = True, seed: int = None,
+                   n_jobs: int = -1, dtype=numpy.float64) -> list:
+    """
+    Estimates the accuracy of the classifier with k-fold cross-validation. The folds are checked in a pool of
+    processes which share the kernel matrix of the whole dataset.
+    :param kernel_type: name of kernel type. The constants defined in kernels namespace must be used.
+    :param params: params for kernel
+    :param X: input vectors set
+    :param Y: output values set. Class numbers for OVR and PairwiseClassifier, 1 and -1 for SVM.
+    :param c: param for svm
+    :param classifier: svm.SVM, ovr.OVR or pairwise.PairwiseClassifier class
+    :param number_of_classes: number of classes, by default the greatest class number plus one. Not used by SVM.
+    :param folds: number of folds or list of pairs (training indexes, test indexes)
+    :param solver: name of the quadratic problem solver
+    :param shuffle: whether the samples are shuffled before splitting into folds
+    :param seed: seed of the random generator used for shuffling
+    :param n_jobs: number of processes, -1 means all CPUs
+    :param dtype: float type of the kernel matrix, see svm.SVM.train
+    :return: list of results, one for each fold. Every result is a dictionary with train_size, test_size, accuracy,
+    errors and the times in seconds: train_time, predict_time and kernel_time, the time spent on the shared matrix.
+    """
+    X = as_matrix(X, dtype)
+    Y = numpy.asarray(Y, dtype=numpy.int64)
+    if len(X) != len(Y):
+        raise ValueError("X and Y should be the same size")
+    if number_of_classes is None:
+        number_of_classes = int(Y.max(initial=-1)) + 1
+    splits = k_folds(len(X), folds, shuffle, seed) if isinstance(folds, int) else folds
+    start = time.perf_counter()
+    gram = kernel_matrix(kernel_type, X, X, params, dtype)
+    kernel_time = time.perf_counter() - start
+    tasks = [(numpy.asarray(train), numpy.asarray(test), classifier, number_of_classes, kernel_type, params, c,
+              solver) for train, test in splits]
+    arrays = {'X': X, 'Y': Y, 'gram': gram}
+    workers = min(parallel.number_of_workers(n_jobs), len(tasks))
+    if workers == 1:
+        results = [_validate_fold(task, arrays.__getitem__) for task in tasks]
+    else:
+        with parallel.SharedArrays(**arrays) as specification:
+            with ProcessPoolExecutor(max_workers=workers, initializer=parallel.attach,
+                                     initargs=(specification,)) as executor:
+                results = list(executor.map(_validate_shared, tasks))
+    return [dict(result, fold=fold, kernel_time=kernel_time) for fold, result in enumerate(results)]
+
+
+def format_folds(results: list) -> str:
+    """
+    Formats the results of cross-validation as a table with the mean accuracy in the last row
+    :param results: list of results returned by cross_validate
+    :return: text of the table
+    """
+    lines = ['{:>4} {:>6} {:>6} {:>8} {:>10} {:>10}'.format('fold', 'train', 'test', 'accuracy', 'train, s',
+                                                            'predict, s')]
+    for result in results:
+        lines.append('{:>4} {:>6} {:>6} {:>8.4f} {:>10.4f} {:>10.4f}'.format(
+            result['fold'], result['train_size'], result['test_size'], result['accuracy'], result['train_time'],
+            result['predict_time']))
+    accuracy = [result['accuracy'] for result in results]
+    lines.append('mean accuracy {:.4f} +- {:.4f}'.format(numpy.mean(accuracy), numpy.std(accuracy)))
+    return '\n'.join(lines)